@@ -0,0 +1,80 @@
+'''Benchmark of the streaming parser in entsoeparser against the
+BeautifulSoup find_all path load_db used before.
+
+No live API responses are committed, the documents in benchmarks/fixtures
+are output of benchmarks.documents with the layout of API responses, so 
+this measures both parsers on synthetic documents only: a week of hourly
+prices, a day of 15 minute A03 curves and 369 days of PT60M and PT15M.
+Responses captured with benchmarks.stub.record are parsed as well when 
+they are added to benchmarks/fixtures.
+
+Run from the repository root:
+    python -m benchmarks.bench_parser
+'''
+
+import glob
+import os
+import time
+import tracemalloc
+from datetime import datetime as dt
+from datetime import timedelta as td
+from bs4 import BeautifulSoup
+import entsoeparser
+from benchmarks.documents import a44_document
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def beautifulsoup_parse(content):
+    '''The parsing done by load_db before entsoeparser, kept as baseline.'''
+
+    response_content = BeautifulSoup(content, 'lxml')
+    datetimes = []
+    prices = []
+    for day_timeseries in response_content.find_all('timeseries'):
+        date = dt.strptime(
+            day_timeseries.find_all('start')[0].get_text(), '%Y-%m-%dT%H:%MZ')
+        for hour in day_timeseries.find_all('point'):
+            hour_index = int(hour.find('position').get_text())
+            datetimes.append(str(date + td(hours=hour_index)))
+            prices.append(hour.find('price.amount').get_text())
+    return datetimes, prices
+
+
+def measure(parse, content, repeat=3):
+    '''Returns best wall time in seconds, peak traced memory in bytes and
+    number of parsed points for parse(content).
+    '''
+
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = parse(content)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    parse(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, len(result[0])
+
+
+def main():
+    documents = [(os.path.basename(path), open(path, 'rb').read())
+                 for path in sorted(glob.glob(os.path.join(FIXTURES, "a44_*.xml")))]
+    #Fixtures named "*_synthetic.xml" are generated, others are captured.
+    documents.append(("synthetic 369 days PT60M", a44_document(days=369)))
+    documents.append(("synthetic 369 days PT15M", 
+                      a44_document(days=369, resolution="PT15M")))
+    parsers = [("BeautifulSoup", beautifulsoup_parse),
+               ("entsoeparser", entsoeparser.parse_arrays)]
+    print(f"{'document':<50}{'parser':<15}{'points':>9}{'seconds':>10}"
+          f"{'points/s':>12}{'peak MiB':>10}")
+    for name, content in documents:
+        for parser_name, parse in parsers:
+            seconds, peak, points = measure(parse, content)
+            print(f"{name:<50}{parser_name:<15}{points:>9}{seconds:>10.3f}"
+                  f"{points / seconds:>12.0f}{peak / 2 ** 20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+'''Benchmark of every stage of the pipeline against the local StubServer,
+from 1 zone x 1 month up to 60 zones x 10 years:
+
+    fetch           concurrent HTTP requests of all (zone x window) jobs
+    parse           entsoeparser.parse_arrays of every response
+    insert          PriceStore.write_prices of every parsed response
+    check status    check_status_of_zones on the loaded database
+    cache build     first read, writes the memory-mapped columnar cache
+    history         get_historydata for every groupby and percentile
+    iterate         iter_historydata in monthly chunks
+    analytics       get_trendstats, materialized and streamed by year
+    pairs           get_pairstats, building the pair rollups and from them
+    render          Line, Histogram and Analytics figures of up to 3 zones
+
+Day and Month means of get_historydata and iter_historydata are checked to
+agree with hours missing first, see check_missing_hours, then the fixtures
+of benchmarks/fixtures are replayed. The committed fixtures are synthetic,
+output of benchmarks.documents, not captured API responses. Results are printed as a table and
+written as JSON with --output, to compare throughput between releases.
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline [--scales 1x1M 5x1Y ...|all]
+                                        [--jobs N] [--output results.json]
+'''
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime as dt
+from datetime import timedelta as td
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pandas as pd
+import entsoecache
+import entsoefetch
+import entsoeparser
+import entsoestore
+import entsoetime
+from entsoedata import DayAheadPrices
+from benchmarks.stub import ROOT, StubServer, domains, fixture_responses
+
+#Name: (zones, startdate, enddate)
+SCALES = {"1x1M": (1, "20200101", "20200201"),
+          "5x1Y": (5, "20190101", "20200101"),
+          "20x3Y": (20, "20170101", "20200101"),
+          "60x10Y": (60, "20100101", "20200101")}
+DEFAULT_SCALES = ("1x1M", "5x1Y", "20x3Y")
+GROUPBYS = ("", "Day", "Month")
+PERCENTILES = (100, 95)
+PLOTTYPES = ("Line", "Histogram", "Analytics")
+
+
+class Results:
+    '''Collects the timings of the stages and prints them as they come.'''
+
+    def __init__(self):
+        self.rows = []
+        print(f"{'scale':<9}{'stage':<36}{'seconds':>9}{'rows':>11}{'rows/s':>12}")
+
+    def add(self, scale, stage, seconds, rows=None, **extra):
+        rate = rows / seconds if rows and seconds > 0 else None
+        self.rows.append({"scale": scale, "stage": stage, "seconds": seconds,
+                          "rows": rows, "rows_per_second": rate, **extra})
+        print(f"{scale:<9}{stage:<36}{seconds:>9.3f}"
+              f"{rows if rows is not None else '':>11}"
+              f"{f'{rate:.0f}' if rate else '':>12}")
+
+
+def _database(directory):
+    '''Returns the path of a new database in the directory with DomainInfo.'''
+
+    path = os.path.join(directory, "Energyprices.db")
+    pd.read_csv(os.path.join(ROOT, "Domaininfo.csv")).to_sql(
+        "DomainInfo", entsoestore.connect(path), index=False)
+    return path
+
+
+def _fetcher(stub, jobs):
+    #No rate limit against the stub, the API limit is not what is measured.
+    return entsoefetch.Fetcher("benchmark", api_url=stub.url, jobs=jobs,
+                               requests_per_minute=10 ** 6)
+
+
+def load(results, scale, fetcher, store, jobs):
+    '''Runs the fetch, parse and insert stages of the jobs. Fetching is
+    measured on its own, parsing and inserting serially as responses of a
+    second fetch arrive.
+    '''
+
+    started = time.perf_counter()
+    size = sum(len(content) for _, content, error in fetcher.run(jobs)
+               if error is None)
+    results.add(scale, "fetch", time.perf_counter() - started,
+                requests=len(jobs), bytes=size)
+    parsing = inserting = 0.0
+    rows = 0
+    for job, content, error in fetcher.run(jobs):
+        if error is not None:
+            print(f"{job.zone} {job.start} - {job.end} failed: {error}")
+            continue
+        started = time.perf_counter()
+        try:
+            epochs, prices = entsoeparser.parse_arrays(content)
+        except entsoeparser.NoMatchingDataError:
+            continue
+        parsed = time.perf_counter()
+        rows += store.write_prices(job.zone, epochs, prices, 
+                                   entsoetime.day_epoch(job.start),
+                                   entsoetime.day_epoch(job.end))
+        parsing += parsed - started
+        inserting += time.perf_counter() - parsed
+    results.add(scale, "parse", parsing, rows)
+    results.add(scale, "insert", inserting, rows)
+    return rows
+
+
+def replay(results, jobs):
+    '''Loads every fixture through the stub.'''
+
+    zones = {domain: zone for zone, domain in domains().items()}
+    fetch_jobs = [entsoefetch.FetchJob(zones[domain], domain,
+                                       dt.strptime(start, '%Y%m%d').date(),
+                                       (dt.strptime(start, '%Y%m%d') + td(days=days)).date(),
+                                       doc_type)
+                  for doc_type, domain, start, days in fixture_responses()]
+    with tempfile.TemporaryDirectory() as directory, StubServer() as stub:
+        store = entsoestore.PriceStore(_database(directory))
+        fetcher = _fetcher(stub, jobs)
+        load(results, "fixtures", fetcher, store, fetch_jobs)
+        fetcher.close()
+
+
+def check_missing_hours():
+    '''Returns True if the Day and Month means of get_historydata and 
+    iter_historydata agree when one zone is missing hours, prints the 
+    differences otherwise.
+    '''
+
+    epochs = np.arange(entsoetime.day_epoch(dt(2019, 12, 25)), 
+                       entsoetime.day_epoch(dt(2020, 2, 5)), 3600)
+    #Five hours of FI on 2020-01-10 are missing.
+    gap = (epochs >= entsoetime.day_epoch(dt(2020, 1, 10, 6))) & (
+        epochs < entsoetime.day_epoch(dt(2020, 1, 10, 11)))
+    prices = 40 + 20 * np.sin(np.arange(len(epochs)) / 5)
+    agree = True
+    with tempfile.TemporaryDirectory() as directory:
+        database = _database(directory)
+        with entsoestore.PriceStore(database) as store:
+            store.write_prices("SE_1", epochs, prices, int(epochs[0]), 
+                               int(epochs[-1]) + 3600)
+            store.write_prices("FI", epochs[~gap], prices[~gap] + 5, 
+                               int(epochs[0]), int(epochs[-1]) + 3600)
+        for groupby in ("Day", "Month"):
+            entsoecache.history_results.clear()
+            history = DayAheadPrices(["SE_1", "FI"], startdate="20200101",
+                                     enddate="20200201", groupby=groupby,
+                                     database=database, fetch=False)
+            materialized = history.get_historydata()
+            streamed = pd.concat(list(history.iter_historydata(chunk="7D")),
+                                 ignore_index=True)
+            columns = ["SE_1 Price", "FI Price"]
+            if (len(materialized) != len(streamed) or not np.allclose(
+                    materialized[columns], streamed[columns])):
+                agree = False
+                print(f"{groupby} means of get_historydata and "
+                      f"iter_historydata differ with missing hours!")
+                print(materialized.merge(streamed, on="TimeStamp", 
+                                         how="outer").to_string())
+        entsoestore.close_connections()
+    return agree
+
+
+def scale_stages(results, scale, jobs, render=True):
+    '''Runs all stages for one scale in a temporary database.'''
+
+    count, startdate, enddate = SCALES[scale]
+    codes = domains()
+    zones = list(codes)[:count]
+    with tempfile.TemporaryDirectory() as directory, StubServer(fixtures=None) as stub:
+        database = _database(directory)
+        store = entsoestore.PriceStore(database)
+        fetcher = _fetcher(stub, jobs)
+        fetch_jobs = [entsoefetch.FetchJob(zone, codes[zone], lower, upper)
+                      for zone in zones
+                      for lower, upper in entsoefetch.split_windows(
+                          dt.strptime(startdate, '%Y%m%d').date(),
+                          dt.strptime(enddate, '%Y%m%d').date())]
+        load(results, scale, fetcher, store, fetch_jobs)
+
+        prices = DayAheadPrices(zones, startdate=startdate, enddate=enddate,
+                                database=database)
+        started = time.perf_counter()
+        prices.check_status_of_zones(fetcher)
+        results.add(scale, "check status", time.perf_counter() - started)
+        fetcher.close()
+
+        start = entsoetime.day_epoch(dt.strptime(startdate, '%Y%m%d'))
+        end = entsoetime.day_epoch(dt.strptime(enddate, '%Y%m%d'))
+        started = time.perf_counter()
+        cached = entsoecache.ColumnarCache(store).read_prices(zones, start, end)
+        results.add(scale, "cache build", time.perf_counter() - started,
+                    len(cached) * len(zones))
+
+        for groupby in GROUPBYS:
+            for percentile in PERCENTILES:
+                entsoecache.history_results.clear()
+                history = DayAheadPrices(zones, startdate=startdate,
+                                         enddate=enddate, percentile=percentile,
+                                         groupby=groupby, database=database)
+                started = time.perf_counter()
+                frame = history.get_historydata()
+                results.add(scale, f"history {groupby or 'Hour'} p{percentile}",
+                            time.perf_counter() - started, len(frame) * len(zones))
+
+        started = time.perf_counter()
+        rows = sum(len(chunk) for chunk in prices.iter_historydata(chunk="1M"))
+        results.add(scale, "iterate 1M", time.perf_counter() - started,
+                    rows * len(zones))
+
+        for chunk in (None, "1Y"):
+            entsoecache.history_results.clear()
+            started = time.perf_counter()
+            stats = prices.get_trendstats(chunk=chunk)
+            results.add(scale, f"analytics {chunk or 'frame'}",
+                        time.perf_counter() - started, int(stats["n"].sum()))
+
+        for stage in ("pairs build", "pairs rollup"):
+            started = time.perf_counter()
+            pairs = prices.get_pairstats()
+            results.add(scale, stage, time.perf_counter() - started,
+                        len(pairs))
+
+        if render:
+            import entsoeplot
+
+            shown = zones[:3]
+            history = DayAheadPrices(shown, startdate=startdate, enddate=enddate,
+                                     database=database).get_historydata()
+            for plottype in PLOTTYPES:
+                path = os.path.join(directory, f"{plottype}.png")
+                started = time.perf_counter()
+                if plottype == "Analytics":
+                    entsoeplot.render_analytics(history, shown, path)
+                else:
+                    entsoeplot.render_history(history, shown, plottype, path)
+                results.add(scale, f"render {plottype}",
+                            time.perf_counter() - started, len(history) * len(shown))
+        entsoestore.close_connections()
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_pipeline")
+    parser.add_argument("--scales", nargs="+", default=list(DEFAULT_SCALES),
+                        help=f"any of {', '.join(SCALES)} or all")
+    parser.add_argument("--jobs", type=int, default=8,
+                        help="concurrent requests")
+    parser.add_argument("--no-render", dest="render", action="store_false")
+    parser.add_argument("--output", help="path of the JSON results")
+    args = parser.parse_args(argv)
+    scales = list(SCALES) if args.scales == ["all"] else args.scales
+    unknown = [scale for scale in scales if scale not in SCALES]
+    if unknown:
+        print(f"Scales {unknown} are not valid scales!")
+        return 1
+
+    #Import time is measured by bench_startup, not as part of a stage.
+    import entsoeanalytics
+    import entsoeplot
+
+    if not check_missing_hours():
+        return 1
+    results = Results()
+    started = time.perf_counter()
+    replay(results, args.jobs)
+    for scale in scales:
+        scale_stages(results, scale, args.jobs, args.render)
+    report = {"commit": _commit(), "created": dt.utcnow().isoformat(),
+              "python": platform.python_version(), "platform": platform.platform(),
+              "jobs": args.jobs, "seconds": time.perf_counter() - started,
+              "results": results.rows}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=1)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
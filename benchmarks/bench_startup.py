@@ -0,0 +1,93 @@
+'''Benchmark of the import time of the modules used by short-lived jobs,
+ex: python -m entsoecli sync from cron, against an import-time budget.
+
+Every module is imported in a fresh interpreter, the best and median of the
+runs are reported along with the heavy dependencies it loaded, which should
+only be loaded by the plotting and analytics paths. Exits with status 1 if
+a module is over the budget or loads a heavy dependency.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup [--budget SECONDS] [--runs N]
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MODULES = ("entsoestore", "entsoefetch", "entsoedata", "entsoecli")
+HEAVY = ("matplotlib", "scipy", "IPython", "julian", "bs4")
+#Seconds to import a module, on top of the start of the interpreter.
+BUDGET = 1.0
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds,
+    "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+
+def measure(module, runs=5):
+    '''Returns the import times in seconds of the module over the runs and
+    the heavy dependencies loaded by the import.
+    '''
+
+    times = []
+    heavy = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY)],
+            cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        times.append(result["seconds"])
+        heavy = result["heavy"]
+    return times, heavy
+
+
+def slowest_imports(module, count=5):
+    '''Returns the count imports with the largest cumulative time in
+    microseconds from python -X importtime.
+    '''
+
+    report = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             f"import {module}"], cwd=ROOT, capture_output=True,
+                            text=True, check=True).stderr
+    rows = []
+    for line in report.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_startup")
+    parser.add_argument("--budget", type=float, default=BUDGET)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--verbose", action="store_true",
+                        help="show the slowest imports of every module")
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f"{'module':<14}{'best s':>9}{'median s':>10}{'budget s':>10}  heavy")
+    for module in MODULES:
+        times, heavy = measure(module, args.runs)
+        over = min(times) > args.budget
+        failed = failed or over or bool(heavy)
+        print(f"{module:<14}{min(times):>9.3f}{statistics.median(times):>10.3f}"
+              f"{args.budget:>10.2f}  {', '.join(heavy) or '-'}"
+              f"{'  OVER BUDGET' if over else ''}")
+        if args.verbose:
+            for microseconds, name in slowest_imports(module):
+                print(f"    {name:<40}{microseconds / 1e6:>8.3f}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
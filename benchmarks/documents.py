@@ -0,0 +1,179 @@
+'''Synthetic ENTSO-E market documents for benchmarks.
+
+The documents follow the layout of responses from the RESTful API, with
+generated prices so that any number of days, resolutions and curve types 
+can be produced. The files "*_synthetic.xml" in benchmarks/fixtures are
+output of a44_document and acknowledgement_document, not captured 
+responses. Load (A65),
+generation (A75) and flows (A11) are produced by quantity_document.
+'''
+
+import math
+from datetime import datetime as dt
+from datetime import timedelta as td
+
+PUBLICATION_NS = "urn:iec62325.351:tc57wg16:451-3:publicationdocument:7:0"
+GENERATIONLOAD_NS = "urn:iec62325.351:tc57wg16:451-6:generationloaddocument:3:0"
+ACKNOWLEDGEMENT_NS = "urn:iec62325.351:tc57wg16:451-1:acknowledgementdocument:7:0"
+RESOLUTION_MINUTES = {"PT60M": 60, "PT30M": 30, "PT15M": 15}
+
+
+def price_at(domain, step):
+    '''Deterministic price with a daily and a yearly cycle.'''
+
+    offset = sum(map(ord, domain)) % 17
+    return round(40 + offset
+                 + 25 * math.sin(step / 24 * 2 * math.pi)
+                 + 15 * math.sin(step / 8760 * 2 * math.pi), 2)
+
+
+def a44_document(domain="10Y1001A1001A44P", startdate="20200101", days=7,
+                 resolution="PT60M", curvetype="A01"):
+    '''Returns an A44 Publication_MarketDocument as bytes with one 
+    TimeSeries per delivery day starting at 23:00 UTC the day before.
+    '''
+
+    minutes = RESOLUTION_MINUTES[resolution]
+    points_per_day = 24 * 60 // minutes
+    first = dt.strptime(startdate, '%Y%m%d') - td(hours=1)
+    last = first + td(days=days)
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+             f'<Publication_MarketDocument xmlns="{PUBLICATION_NS}">\n'
+             '\t<mRID>a0e6ad1f4f2f4c8a9d1b7c4e2f3a5b6c</mRID>\n'
+             '\t<revisionNumber>1</revisionNumber>\n'
+             '\t<type>A44</type>\n'
+             '\t<sender_MarketParticipant.mRID codingScheme="A01">10X1001A1001A450</sender_MarketParticipant.mRID>\n'
+             '\t<sender_MarketParticipant.marketRole.type>A32</sender_MarketParticipant.marketRole.type>\n'
+             '\t<receiver_MarketParticipant.mRID codingScheme="A01">10X1001A1001A450</receiver_MarketParticipant.mRID>\n'
+             '\t<receiver_MarketParticipant.marketRole.type>A33</receiver_MarketParticipant.marketRole.type>\n'
+             '\t<createdDateTime>2022-11-20T10:00:00Z</createdDateTime>\n'
+             '\t<period.timeInterval>\n'
+             f'\t\t<start>{first:%Y-%m-%dT%H:%MZ}</start>\n'
+             f'\t\t<end>{last:%Y-%m-%dT%H:%MZ}</end>\n'
+             '\t</period.timeInterval>\n']
+    for day in range(days):
+        start = first + td(days=day)
+        end = start + td(days=1)
+        parts.append('\t<TimeSeries>\n'
+                     f'\t\t<mRID>{day + 1}</mRID>\n'
+                     '\t\t<businessType>A62</businessType>\n'
+                     f'\t\t<in_Domain.mRID codingScheme="A01">{domain}</in_Domain.mRID>\n'
+                     f'\t\t<out_Domain.mRID codingScheme="A01">{domain}</out_Domain.mRID>\n'
+                     '\t\t<currency_Unit.name>EUR</currency_Unit.name>\n'
+                     '\t\t<price_Measure_Unit.name>MWH</price_Measure_Unit.name>\n'
+                     f'\t\t<curveType>{curvetype}</curveType>\n'
+                     '\t\t<Period>\n'
+                     '\t\t\t<timeInterval>\n'
+                     f'\t\t\t\t<start>{start:%Y-%m-%dT%H:%MZ}</start>\n'
+                     f'\t\t\t\t<end>{end:%Y-%m-%dT%H:%MZ}</end>\n'
+                     '\t\t\t</timeInterval>\n'
+                     f'\t\t\t<resolution>{resolution}</resolution>\n')
+        previous = None
+        for position in range(1, points_per_day + 1):
+            step = day * 24 + (position - 1) * minutes // 60
+            price = price_at(domain, step)
+            if curvetype == "A03" and price == previous:
+                continue
+            previous = price
+            parts.append('\t\t\t<Point>\n'
+                         f'\t\t\t\t<position>{position}</position>\n'
+                         f'\t\t\t\t<price.amount>{price:.2f}</price.amount>\n'
+                         '\t\t\t</Point>\n')
+        parts.append('\t\t</Period>\n\t</TimeSeries>\n')
+    parts.append('</Publication_MarketDocument>\n')
+    return "".join(parts).encode()
+
+
+def quantity_at(domain, step, series=""):
+    '''Deterministic quantity in MW with a daily cycle per domain and series.'''
+
+    scale = 500 + sum(map(ord, domain + series)) % 2000
+    return round(scale * (1 + 0.3 * math.sin(step / 24 * 2 * math.pi)))
+
+
+def quantity_document(doc_type="A65", domain="10Y1001A1001A44P",
+                      startdate="20200101", days=7, resolution="PT60M",
+                      psr_types=("B12", "B14", "B19"), counterpart=None):
+    '''Returns a load (A65), generation (A75) or flow (A11) document as 
+    bytes with one TimeSeries over all days per series: one for load, one
+    per psrType for generation, with the consumption of B10 if given, and
+    one from domain to counterpart for flows.
+    '''
+
+    minutes = RESOLUTION_MINUTES[resolution]
+    first = dt.strptime(startdate, '%Y%m%d') - td(hours=1)
+    last = first + td(days=days)
+    if doc_type == "A11":
+        root = "Publication_MarketDocument"
+        namespace = PUBLICATION_NS
+        series = [("", f'\t\t<in_Domain.mRID codingScheme="A01">{counterpart}'
+                       '</in_Domain.mRID>\n'
+                       f'\t\t<out_Domain.mRID codingScheme="A01">{domain}'
+                       '</out_Domain.mRID>\n')]
+    elif doc_type == "A75":
+        root = "GL_MarketDocument"
+        namespace = GENERATIONLOAD_NS
+        series = [(psr_type, f'\t\t<inBiddingZone_Domain.mRID codingScheme="A01">'
+                             f'{domain}</inBiddingZone_Domain.mRID>\n'
+                             f'\t\t<MktPSRType><psrType>{psr_type}</psrType>'
+                             '</MktPSRType>\n')
+                  for psr_type in psr_types]
+        if "B10" in psr_types:
+            series.append(("B10 consumption",
+                           f'\t\t<outBiddingZone_Domain.mRID codingScheme="A01">'
+                           f'{domain}</outBiddingZone_Domain.mRID>\n'
+                           '\t\t<MktPSRType><psrType>B10</psrType></MktPSRType>\n'))
+    else:
+        root = "GL_MarketDocument"
+        namespace = GENERATIONLOAD_NS
+        series = [("", f'\t\t<outBiddingZone_Domain.mRID codingScheme="A01">'
+                       f'{domain}</outBiddingZone_Domain.mRID>\n')]
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+             f'<{root} xmlns="{namespace}">\n'
+             '\t<mRID>b1f7be2e5f3a4d9b8c2a6e4d3f2a1b0c</mRID>\n'
+             '\t<revisionNumber>1</revisionNumber>\n'
+             f'\t<type>{doc_type}</type>\n'
+             '\t<createdDateTime>2022-11-20T10:00:00Z</createdDateTime>\n'
+             '\t<time_Period.timeInterval>\n'
+             f'\t\t<start>{first:%Y-%m-%dT%H:%MZ}</start>\n'
+             f'\t\t<end>{last:%Y-%m-%dT%H:%MZ}</end>\n'
+             '\t</time_Period.timeInterval>\n']
+    for number, (label, domains) in enumerate(series):
+        parts.append('\t<TimeSeries>\n'
+                     f'\t\t<mRID>{number + 1}</mRID>\n'
+                     '\t\t<businessType>A01</businessType>\n'
+                     + domains +
+                     '\t\t<quantity_Measure_Unit.name>MAW</quantity_Measure_Unit.name>\n'
+                     '\t\t<curveType>A01</curveType>\n'
+                     '\t\t<Period>\n'
+                     '\t\t\t<timeInterval>\n'
+                     f'\t\t\t\t<start>{first:%Y-%m-%dT%H:%MZ}</start>\n'
+                     f'\t\t\t\t<end>{last:%Y-%m-%dT%H:%MZ}</end>\n'
+                     '\t\t\t</timeInterval>\n'
+                     f'\t\t\t<resolution>{resolution}</resolution>\n')
+        for position in range(1, days * 24 * 60 // minutes + 1):
+            step = (position - 1) * minutes // 60
+            parts.append('\t\t\t<Point>\n'
+                         f'\t\t\t\t<position>{position}</position>\n'
+                         f'\t\t\t\t<quantity>{quantity_at(domain, step, label)}'
+                         '</quantity>\n'
+                         '\t\t\t</Point>\n')
+        parts.append('\t\t</Period>\n\t</TimeSeries>\n')
+    parts.append(f'</{root}>\n')
+    return "".join(parts).encode()
+
+
+def acknowledgement_document():
+    '''Returns the acknowledgement ENTSO-E sends when no data matches.'''
+
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<Acknowledgement_MarketDocument xmlns="{ACKNOWLEDGEMENT_NS}">\n'
+            '\t<mRID>9f2c1d3e4b5a6978</mRID>\n'
+            '\t<createdDateTime>2022-11-20T10:00:00Z</createdDateTime>\n'
+            '\t<Reason>\n'
+            '\t\t<code>999</code>\n'
+            '\t\t<text>No matching data found for Data item Day-ahead Prices'
+            ' [12.1.D] (10Y1001A1001A44P, 10Y1001A1001A44P) and interval'
+            ' 2015-01-01T00:00:00.000Z/2015-01-02T00:00:00.000Z.</text>\n'
+            '\t</Reason>\n'
+            '</Acknowledgement_MarketDocument>\n').encode()
@@ -0,0 +1,164 @@
+'''Local stand-in for the ENTSO-E RESTful API.
+
+StubServer answers GET requests like the API does, in a separate process
+so serving does not compete with the benchmarked client for the GIL:
+
+    - a fixture from benchmarks/fixtures when one matches the domain, 
+      start date and number of days of the request, fixtures are named
+      "{documentType}_{zone}_{YYYYMMDD}_{days}d[_...].xml",
+      ex: "a44_SE_1_20200101_7d_synthetic.xml",
+    - an acknowledgement without data for windows before no_data_before,
+    - otherwise a synthetic document from benchmarks.documents, prices for
+      A44 and load, generation or flows for A65, A75 and A11.
+
+Point a Fetcher to it with api_url:
+    with StubServer() as stub:
+        fetcher = entsoefetch.Fetcher("token", api_url=stub.url)
+
+The committed fixtures, "*_synthetic.xml", are output of benchmarks.documents
+and not captured responses, so replaying them measures the pipeline on
+synthetic documents. record saves live responses as fixtures, which are
+replayed the same way.
+'''
+
+import csv
+import glob
+import multiprocessing
+import os
+import re
+import time
+import urllib.parse
+from datetime import datetime as dt
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.documents import (a44_document, acknowledgement_document,
+                                  quantity_document)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+#Parameter with the domain of the zone, in_Domain for the others.
+_DOMAIN_PARAMS = {"A65": "outBiddingZone_Domain", "A11": "out_Domain"}
+_FIXTURE = re.compile(r'^([a-z0-9]+)_(.+)_(\d{8})_(\d+)d(?:_.*)?\.xml$', re.I)
+
+
+def domains(path=os.path.join(ROOT, "Domaininfo.csv")):
+    '''Returns the shortcodes mapped to their Domainstr from Domaininfo.csv.'''
+
+    with open(path, newline='') as file:
+        return {row["Shortcode"]: row["Domainstr"] for row in csv.DictReader(file)}
+
+
+def fixture_responses(directory=FIXTURES):
+    '''Returns the fixtures as a dict from (documentType, domain, YYYYMMDD,
+    days) to the path of the fixture.
+    '''
+
+    codes = domains()
+    responses = {}
+    for path in glob.glob(os.path.join(directory, "*.xml")):
+        match = _FIXTURE.match(os.path.basename(path))
+        if match and match.group(2) in codes:
+            doc_type, zone, start, days = match.groups()
+            responses[(doc_type.upper(), codes[zone], start, int(days))] = path
+    return responses
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+        try:
+            start = dt.strptime(query["periodStart"][:8], '%Y%m%d')
+            end = dt.strptime(query["periodEnd"][:8], '%Y%m%d')
+            doc_type = query.get("documentType", "A44")
+            domain = query[_DOMAIN_PARAMS.get(doc_type, "in_Domain")]
+        except (KeyError, ValueError):
+            self._send(400, acknowledgement_document())
+            return
+        key = (doc_type, domain, f"{start:%Y%m%d}", (end - start).days)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if key in self.server.responses:
+            with open(self.server.responses[key], 'rb') as file:
+                self._send(200, file.read())
+        elif self.server.no_data_before and start < self.server.no_data_before:
+            self._send(200, acknowledgement_document())
+        elif doc_type == "A44":
+            self._send(200, a44_document(domain, f"{start:%Y%m%d}",
+                                         (end - start).days))
+        else:
+            self._send(200, quantity_document(doc_type, domain, f"{start:%Y%m%d}",
+                                              (end - start).days,
+                                              counterpart=query.get("in_Domain")))
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _serve(port, responses, no_data_before, latency):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.responses = responses
+    server.no_data_before = no_data_before
+    server.latency = latency
+    port.put(server.server_port)
+    server.serve_forever()
+
+
+class StubServer:
+    '''Serves fixtures and synthetic documents on 127.0.0.1 from a child
+    process while used as context manager.
+
+    Parameters:
+        fixtures: 'str', optional | Default: benchmarks/fixtures
+            Directory of fixtures, None for only generated documents.
+        no_data_before: 'str', optional | Default: None
+            Date as "%Y%m%d", windows starting earlier get acknowledgements.
+        latency: 'float', optional | Default: 0
+            Seconds added to every response to mimic the network.
+    '''
+
+    def __init__(self, fixtures=FIXTURES, no_data_before=None, latency=0.0):
+        self.responses = fixture_responses(fixtures) if fixtures else {}
+        self.no_data_before = (dt.strptime(no_data_before, '%Y%m%d')
+                               if no_data_before else None)
+        self.latency = latency
+        self.process = None
+        self.url = None
+
+    def __enter__(self):
+        port = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=_serve, args=(port, self.responses, self.no_data_before,
+                                 self.latency), daemon=True)
+        self.process.start()
+        self.url = f"http://127.0.0.1:{port.get(timeout=30)}/api"
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+
+def record(fetcher, jobs, directory=FIXTURES):
+    '''Fetches the FetchJobs, ex: from the live API, and saves every
+    response as a fixture StubServer replays. Returns the paths written.
+    '''
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for job, content, error in fetcher.run(jobs):
+        if error is not None:
+            print(f"Recording {job.zone} {job.start} - {job.end} failed: {error}")
+            continue
+        path = os.path.join(directory, f"{job.doc_type.lower()}_{job.zone}_"
+                            f"{job.start:%Y%m%d}_{(job.end - job.start).days}d.xml")
+        with open(path, 'wb') as file:
+            file.write(content)
+        paths.append(path)
+    return paths
@@ -0,0 +1,367 @@
+'''Aggregation of prices over time buckets.
+
+Aggregates are computed either in SQL, pushed down to the rollup tables of
+entsoestore when the interval allows it, or vectorized with NumPy over an
+aligned price matrix with one column per zone.
+
+Resolutions: "hour", "day", "week" (starting Monday), "month", "year" or a
+fixed offset as a pandas timedelta string, ex: "15min", "6h" or "2D".
+Buckets shorter than a day are UTC and identified by the epoch of their
+first second. Days and longer buckets follow the local market day of every
+zone and are identified by the local epoch of their first second, see
+entsoetime, so the same key is the same date in every zone and the bounds
+of queries at these resolutions are local epochs, ex: local midnights.
+
+Aggregates: "mean", "min", "max", "count", "sum", "std" along with any
+percentiles, ex: percentiles=(5, 50, 95) gives the columns "p5", "p50"...
+'''
+
+import numpy as np
+import pandas as pd
+import entsoetime
+
+AGGREGATES = ("mean", "min", "max", "count", "sum", "std")
+CALENDAR = ("month", "year")
+FIXED = {"hour": 3600, "day": 86400, "week": 604800}
+#1970-01-01 was a Thursday, shift weeks to start on Monday.
+WEEK_OFFSET = 3 * 86400
+
+
+def resolution_seconds(resolution):
+    '''Returns the length in seconds of a fixed resolution or None for
+    "month" and "year".
+    '''
+
+    if resolution in CALENDAR:
+        return None
+    if resolution in FIXED:
+        return FIXED[resolution]
+    try:
+        seconds = int(pd.Timedelta(resolution).total_seconds())
+    except ValueError:
+        raise ValueError(f"Resolution {resolution} is not supported!") from None
+    if seconds <= 0:
+        raise ValueError(f"Resolution {resolution} is not supported!")
+    return seconds
+
+
+def is_local(resolution):
+    '''True if buckets of the resolution follow the local calendar, days
+    and multiples of days, weeks, months and years.
+    '''
+
+    seconds = resolution_seconds(resolution)
+    return seconds is None or seconds % 86400 == 0
+
+
+def bucket_starts(epochs, resolution, timezone=None):
+    '''Returns the epoch of the bucket of every epoch in the array, with a
+    timezone the local epoch of the bucket in its local calendar.
+    '''
+
+    epochs = np.asarray(epochs, dtype=np.int64)
+    if timezone is not None:
+        epochs = entsoetime.local_epochs(epochs, timezone)
+    if resolution in CALENDAR:
+        unit = 'M' if resolution == "month" else 'Y'
+        return (epochs.astype('datetime64[s]').astype(f'datetime64[{unit}]')
+                .astype('datetime64[s]').astype(np.int64))
+    seconds = resolution_seconds(resolution)
+    offset = WEEK_OFFSET if resolution == "week" else 0
+    return epochs - (epochs + offset) % seconds
+
+
+def _bucket_sql(resolution, column):
+    '''Returns the SQL expression of the bucket of the epoch column.'''
+
+    if resolution in CALENDAR:
+        return (f"CAST(strftime('%s', {column}, 'unixepoch', "
+                f"'start of {resolution}') AS INTEGER)")
+    seconds = resolution_seconds(resolution)
+    offset = WEEK_OFFSET if resolution == "week" else 0
+    return f"{column} - ({column} + {offset}) % {seconds}"
+
+
+def _source_sql(resolution, start, end):
+    '''Picks the smallest table that can answer the buckets for [start, end).
+    Returns (table, epoch column, count, sum, squares, min, max) as SQL, or
+    None for local buckets of an interval not aligned to local days, which
+    SQL can not tell apart from the UTC epochs of Prices.
+    '''
+
+    day_aligned = start % 86400 == 0 and end % 86400 == 0
+    month_aligned = (day_aligned and
+                     (bucket_starts([start, end], "month") == [start, end]).all())
+    rollup = ("SUM(count)", "SUM(total)", "SUM(squares)", "MIN(low)", "MAX(high)")
+    if not is_local(resolution):
+        return ("Prices", "epoch", "COUNT(price)", "SUM(price)", 
+                "SUM(price * price)", "MIN(price)", "MAX(price)")
+    if resolution in CALENDAR and month_aligned:
+        return ("MonthlyRollup", "month", *rollup)
+    if day_aligned:
+        return ("DailyRollup", "day", *rollup)
+    return None
+
+
+def _finish(count, total, squares, low, high, aggregates):
+    '''Returns the requested aggregates from the sufficient statistics.'''
+
+    count = np.asarray(count, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance = (squares - total * mean) / (count - 1)
+    values = {"mean": mean, "min": low, "max": high, "count": count,
+              "sum": total, "std": np.sqrt(np.clip(variance, 0, None))}
+    return {aggregate: values[aggregate] for aggregate in aggregates}
+
+
+def aggregate_sql(store, zones, start, end, resolution="day",
+                  aggregates=("mean",)):
+    '''Aggregates the prices of the zones for [start, end) in epoch seconds
+    in SQL, from the daily or monthly rollups whenever the interval is
+    aligned to them, otherwise from Prices. Local buckets of an interval
+    not aligned to local days are computed with NumPy instead.
+
+    Returns a dataframe indexed by bucket epoch with the columns
+    (zone, aggregate) as a MultiIndex.
+    '''
+
+    unknown = set(aggregates) - set(AGGREGATES)
+    if unknown:
+        raise ValueError(f"Aggregates {sorted(unknown)} are not supported!")
+    zone_ids = {store.zone_id(zone): zone for zone in zones}
+    zone_ids.pop(None, None)
+    columns = pd.MultiIndex.from_product([list(zones), list(aggregates)])
+    if not zone_ids:
+        return pd.DataFrame(columns=columns,
+                            index=pd.Index([], name="epoch", dtype=np.int64))
+    source = _source_sql(resolution, start, end)
+    if source is None:
+        return _aggregate_read(store, zones, start, end, resolution, aggregates)
+    table, column, *statistics = source
+    placeholders = ",".join("?" * len(zone_ids))
+    rows = pd.read_sql(f'''
+        SELECT zone_id, {_bucket_sql(resolution, column)} AS bucket,
+        {", ".join(statistics)}
+        FROM {table}
+        WHERE zone_id IN ({placeholders}) AND {column}>=? AND {column}<?
+        GROUP BY zone_id, bucket;
+        ''', store.conn, params=[*zone_ids, start, end])
+    rows.columns = ["zone_id", "epoch", "count", "total", "squares", "low", "high"]
+    result = _finish(rows["count"].to_numpy(), rows["total"].to_numpy(),
+                     rows["squares"].to_numpy(), rows["low"].to_numpy(),
+                     rows["high"].to_numpy(), aggregates)
+    long_format = pd.DataFrame(result)
+    long_format["zone"] = rows["zone_id"].map(zone_ids)
+    long_format["epoch"] = rows["epoch"]
+    wide_format = long_format.pivot(index="epoch", columns="zone",
+                                    values=list(aggregates))
+    wide_format = wide_format.swaplevel(axis=1)
+    return wide_format.reindex(columns=columns).sort_index()
+
+
+def _statistics(epochs, matrix, resolution, timezone=None):
+    '''Sorts the matrix by epoch and reduces every bucket of the resolution.
+    Returns keys, offsets and counts of the buckets, the sorted matrix and
+    the statistics (count, total, squares, low, high) with one row per bucket.
+    Missing prices, NaN, are left out of the statistics of their column.
+    '''
+
+    buckets = bucket_starts(epochs, resolution, timezone)
+    #By bucket, local hours repeated when the clocks go back stay in theirs.
+    order = np.lexsort((epochs, buckets))
+    matrix = matrix[order]
+    buckets = buckets[order]
+    keys, offsets, counts = np.unique(buckets, return_index=True,
+                                      return_counts=True)
+    valid = ~np.isnan(matrix)
+    values = np.where(valid, matrix, 0.0)
+    statistics = (np.add.reduceat(valid.astype(np.int64), offsets, axis=0),
+                  np.add.reduceat(values, offsets, axis=0),
+                  np.add.reduceat(values * values, offsets, axis=0),
+                  np.fmin.reduceat(matrix, offsets, axis=0),
+                  np.fmax.reduceat(matrix, offsets, axis=0))
+    return keys, offsets, counts, matrix, statistics
+
+
+def aggregate_prices(prices, resolution="day", aggregates=("mean",),
+                     percentiles=(), spreads=(), timezone=None):
+    '''Aggregates an aligned price matrix in one vectorized pass.
+
+    Parameters:
+        prices: 'DataFrame'
+            Prices indexed by epoch with one column per zone, as returned
+            by entsoestore.PriceStore.read_prices.
+        resolution: 'str', optional | Default: "day"
+        aggregates: 'tuple', optional | Default: ("mean",)
+        percentiles: 'tuple', optional | Default: ()
+            Percentiles between 0 and 100 added as "p{percentile}".
+        spreads: 'tuple', optional | Default: ()
+            Pairs of zones (a, b) aggregated as a column "a-b" with the
+            price of a minus the price of b.
+        timezone: 'str', optional | Default: None
+            Buckets in the local calendar of the timezone, ex: 
+            "Europe/Stockholm", keyed by local epochs. None for UTC.
+
+    Returns a dataframe indexed by bucket epoch with the columns
+    (zone or spread, aggregate) as a MultiIndex.
+    '''
+
+    names = list(prices.columns) + [f"{a}-{b}" for a, b in spreads]
+    matrix = prices.to_numpy(dtype=np.float64)
+    if spreads:
+        position = {zone: rank for rank, zone in enumerate(prices.columns)}
+        matrix = np.column_stack([matrix] + [
+            matrix[:, position[a]] - matrix[:, position[b]] for a, b in spreads])
+    labels = list(aggregates) + [f"p{percentile:g}" for percentile in percentiles]
+    columns = pd.MultiIndex.from_product([names, labels])
+    if not len(matrix):
+        return pd.DataFrame(columns=columns,
+                            index=pd.Index([], name="epoch", dtype=np.int64))
+
+    keys, offsets, counts, matrix, statistics = _statistics(
+        prices.index.to_numpy(dtype=np.int64), matrix, resolution, timezone)
+    result = _finish(*statistics, aggregates)
+
+    if percentiles:
+        #Sort every column within its bucket, then interpolate positions.
+        group = np.repeat(np.arange(keys.size), counts)
+        ranked = np.empty_like(matrix)
+        for rank in range(matrix.shape[1]):
+            ranked[:, rank] = matrix[np.lexsort((matrix[:, rank], group)), rank]
+        for percentile in percentiles:
+            position = offsets + (counts - 1) * percentile / 100
+            lower = np.floor(position).astype(np.int64)
+            upper = np.ceil(position).astype(np.int64)
+            weight = (position - lower)[:, None]
+            result[f"p{percentile:g}"] = (ranked[lower] * (1 - weight)
+                                          + ranked[upper] * weight)
+
+    frame = pd.DataFrame(
+        np.stack([result[label] for label in labels], axis=2)
+        .reshape(keys.size, -1),
+        index=pd.Index(keys, name="epoch"),
+        columns=pd.MultiIndex.from_product([names, labels]))
+    return frame
+
+
+def aggregate(store, zones, start, end, resolution="day", aggregates=("mean",),
+              percentiles=(), spreads=()):
+    '''Aggregates the prices of the zones for [start, end) in epoch seconds,
+    local epochs for local resolutions. Plain per-zone aggregates are pushed
+    down to SQL, percentiles and spreads need the aligned prices and are 
+    computed with NumPy, spreads in the local calendar of their first zone.
+
+    Returns a dataframe indexed by bucket epoch with the columns
+    (zone or spread, aggregate) as a MultiIndex.
+    '''
+
+    if not percentiles and not spreads:
+        return aggregate_sql(store, zones, start, end, resolution, aggregates)
+    return _aggregate_read(store, zones, start, end, resolution, aggregates,
+                           percentiles, spreads)
+
+
+def _aggregate_read(store, zones, start, end, resolution, aggregates,
+                    percentiles=(), spreads=()):
+    '''Reads the prices of the zones and aggregates them with NumPy, one
+    read per timezone of the zones for local resolutions.
+    '''
+
+    local = is_local(resolution)
+    groups = {}
+    for zone in zones:
+        timezone = entsoetime.zone_timezone(zone) if local else None
+        groups.setdefault(timezone, ([], []))[0].append(zone)
+    for a, b in spreads:
+        timezone = entsoetime.zone_timezone(a) if local else None
+        groups.setdefault(timezone, ([], []))[1].append((a, b))
+    frames = []
+    for timezone, (group, pairs) in groups.items():
+        lower, upper = ((start, end) if timezone is None else 
+                        entsoetime.utc_epochs([start, end], timezone).tolist())
+        read = list(dict.fromkeys(group + [zone for pair in pairs 
+                                           for zone in pair]))
+        frame = aggregate_prices(store.read_prices(read, lower, upper - 1), 
+                                 resolution, aggregates, percentiles, pairs,
+                                 timezone)
+        names = group + [f"{a}-{b}" for a, b in pairs]
+        frames.append(frame.loc[:, frame.columns.get_level_values(0).isin(names)])
+    labels = list(aggregates) + [f"p{percentile:g}" for percentile in percentiles]
+    columns = pd.MultiIndex.from_product(
+        [list(zones) + [f"{a}-{b}" for a, b in spreads], labels])
+    return pd.concat(frames, axis=1).reindex(columns=columns).sort_index()
+
+
+def aggregate_stream(chunks, resolution="day", aggregates=("mean",),
+                     timezones=None):
+    '''Aggregates a stream of aligned price frames, as yielded by
+    entsoestore.PriceStore.iter_prices, with bounded memory. Statistics of
+    a bucket spanning several chunks are merged before it is yielded.
+
+    Parameters:
+        timezones: 'dict', optional | Default: None
+            Timezone of the columns, buckets of columns with a timezone
+            follow its local calendar, see aggregate_prices.
+
+    Yields dataframes indexed by bucket epoch with the columns
+    (zone, aggregate) as a MultiIndex, one per chunk with finished buckets.
+    '''
+
+    pending = {}
+    names = None
+    for prices in chunks:
+        if not len(prices):
+            continue
+        names = prices.columns
+        epochs = prices.index.to_numpy(dtype=np.int64)
+        matrix = prices.to_numpy(dtype=np.float64)
+        groups = {}
+        for rank, name in enumerate(names):
+            groups.setdefault((timezones or {}).get(name), []).append(rank)
+        #Buckets before the last bucket of every group are finished.
+        last = None
+        for timezone, ranks in groups.items():
+            keys, _, _, _, statistics = _statistics(
+                epochs, matrix[:, ranks], resolution, timezone)
+            for row, key in enumerate(keys.tolist()):
+                merged = pending.get(key)
+                if merged is None:
+                    merged = pending[key] = [np.zeros(len(names)), 
+                        np.zeros(len(names)), np.zeros(len(names)),
+                        np.full(len(names), np.inf), np.full(len(names), -np.inf)]
+                for rank, merge in enumerate(_MERGES):
+                    merged[rank][ranks] = merge(merged[rank][ranks],
+                                                statistics[rank][row])
+            last = keys[-1] if last is None else min(last, keys[-1])
+        finished = sorted(key for key in pending if key < last)
+        if finished:
+            yield _pending_frame(pending, finished, names, aggregates)
+    if pending:
+        yield _pending_frame(pending, sorted(pending), names, aggregates)
+
+
+_MERGES = (np.add, np.add, np.add, np.fmin, np.fmax)
+
+
+def _pending_frame(pending, keys, names, aggregates):
+    '''Pops the merged statistics of the keys into a frame, columns without
+    prices in a bucket are NaN.
+    '''
+
+    merged = [pending.pop(key) for key in keys]
+    statistics = [np.array([statistic[rank] for statistic in merged])
+                  for rank in range(5)]
+    empty = statistics[0] == 0
+    for statistic in statistics[1:]:
+        statistic[empty] = np.nan
+    return _statistics_frame(keys, statistics, names, aggregates)
+
+
+def _statistics_frame(keys, statistics, names, aggregates):
+    result = _finish(*statistics, aggregates)
+    return pd.DataFrame(
+        np.stack([result[label] for label in aggregates], axis=2)
+        .reshape(len(keys), -1),
+        index=pd.Index(np.asarray(keys, dtype=np.int64), name="epoch"),
+        columns=pd.MultiIndex.from_product([list(names), list(aggregates)]))
@@ -0,0 +1,146 @@
+'''Linear regression of prices over time from sufficient statistics.
+
+RegressionStats keeps, per zone, the count and the centered moments of time
+and price (means, sums of squares and co-moment), the numerically stable
+form of n, Σx, Σy, Σxy, Σx² and Σy². They are updated with a batch of rows
+for all zones at once, can be merged across chunks and give the OLS fit,
+R², standard error, T-score and P-value of the slope as well as confidence
+and prediction bands without another pass over the data.
+'''
+
+import numpy as np
+import pandas as pd
+import scipy.stats as st
+
+
+class RegressionStats:
+    '''Mergeable sufficient statistics of y = slope * x + intercept for
+    several zones, every zone ignores the rows where its price is NaN.
+
+    Parameters:
+        zones: 'list' of zone names, one per column of the prices.
+    '''
+
+    def __init__(self, zones):
+        self.zones = list(zones)
+        shape = len(self.zones)
+        self.n = np.zeros(shape)
+        self.mean_x = np.zeros(shape)
+        self.mean_y = np.zeros(shape)
+        self.sxx = np.zeros(shape)
+        self.syy = np.zeros(shape)
+        self.sxy = np.zeros(shape)
+
+    def update(self, x, prices):
+        '''Adds a batch with x as 1-D array of times and prices as 2-D array
+        with one column per zone.
+        '''
+
+        x = np.asarray(x, dtype=np.float64)
+        prices = np.asarray(prices, dtype=np.float64).reshape(len(x), -1)
+        valid = ~np.isnan(prices)
+        n = valid.sum(axis=0).astype(np.float64)
+        if not n.any():
+            return
+        xs = np.where(valid, x[:, None], 0.0)
+        ys = np.where(valid, prices, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_x = np.where(n > 0, xs.sum(axis=0) / n, 0.0)
+            mean_y = np.where(n > 0, ys.sum(axis=0) / n, 0.0)
+        dx = np.where(valid, x[:, None] - mean_x, 0.0)
+        dy = np.where(valid, prices - mean_y, 0.0)
+        self._combine(n, mean_x, mean_y, (dx * dx).sum(axis=0),
+                      (dy * dy).sum(axis=0), (dx * dy).sum(axis=0))
+
+    def merge(self, other):
+        '''Adds the statistics of another RegressionStats of the same zones.'''
+
+        self._combine(other.n, other.mean_x, other.mean_y,
+                      other.sxx, other.syy, other.sxy)
+
+    def _combine(self, n, mean_x, mean_y, sxx, syy, sxy):
+        total = self.n + n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(total > 0, n / total, 0.0)
+        delta_x = mean_x - self.mean_x
+        delta_y = mean_y - self.mean_y
+        correction = self.n * weight
+        self.sxx = self.sxx + sxx + delta_x * delta_x * correction
+        self.syy = self.syy + syy + delta_y * delta_y * correction
+        self.sxy = self.sxy + sxy + delta_x * delta_y * correction
+        self.mean_x = self.mean_x + delta_x * weight
+        self.mean_y = self.mean_y + delta_y * weight
+        self.n = total
+
+    def fit(self, alpha=0.05):
+        '''Returns a dataframe indexed by zone with the columns slope,
+        intercept, r_square, std_err (of the residuals), slope_err, t_score
+        and p_value of the slope, t_critical for alpha, dof, n, mean_x and
+        sxx.
+        '''
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = self.sxy / self.sxx
+            intercept = self.mean_y - slope * self.mean_x
+            r_square = self.sxy * self.sxy / (self.sxx * self.syy)
+            dof = self.n - 2
+            residuals = np.clip(self.syy - slope * self.sxy, 0, None)
+            std_err = np.sqrt(residuals / dof)
+            slope_err = std_err / np.sqrt(self.sxx)
+            t_score = slope / slope_err
+        p_value = 2 * st.t.sf(np.abs(t_score), dof)
+        t_critical = st.t.ppf(1 - alpha / 2, dof)
+        return pd.DataFrame({"slope": slope, "intercept": intercept,
+                             "r_square": r_square, "std_err": std_err,
+                             "slope_err": slope_err, "t_score": t_score,
+                             "p_value": p_value, "t_critical": t_critical,
+                             "dof": dof, "n": self.n, "mean_x": self.mean_x,
+                             "sxx": self.sxx},
+                            index=pd.Index(self.zones, name="zone"))
+
+
+def bands(fit, x, alpha=0.05):
+    '''Returns (fitted, confidence, prediction) arrays of shape
+    (zones, len(x)) for the rows of a fit from RegressionStats.fit, where
+    confidence and prediction are the half widths of the 1 - alpha bands.
+    '''
+
+    x = np.asarray(x, dtype=np.float64)[None, :]
+    column = lambda name: fit[name].to_numpy()[:, None]
+    t_critical = st.t.ppf(1 - alpha / 2, column("dof"))
+    fitted = column("slope") * x + column("intercept")
+    leverage = 1 / column("n") + (x - column("mean_x")) ** 2 / column("sxx")
+    confidence = t_critical * column("std_err") * np.sqrt(leverage)
+    prediction = t_critical * column("std_err") * np.sqrt(1 + leverage)
+    return fitted, confidence, prediction
+
+
+def regression_frame(historydata, zones, alpha=0.05):
+    '''Returns RegressionStats.fit of the prices of the zones against the
+    column TimeStamp of a history dataframe.
+    '''
+
+    stats = RegressionStats(zones)
+    stats.update(historydata['TimeStamp'].to_numpy(),
+                 historydata[[f"{zon} Price" for zon in zones]].to_numpy())
+    return stats.fit(alpha)
+
+
+def regression_stream(chunks, zones, alpha=0.05):
+    '''Same as regression_frame for an iterable of history dataframes, ex:
+    from DayAheadPrices.iter_historydata, one chunk at a time.
+    '''
+
+    stats = RegressionStats(zones)
+    for historydata in chunks:
+        stats.update(historydata['TimeStamp'].to_numpy(),
+                     historydata[[f"{zon} Price" for zon in zones]].to_numpy())
+    return stats.fit(alpha)
+
+
+def julian_to_month(timestamps):
+    '''Returns "YYYY-MM" strings for an array of julian days.'''
+
+    seconds = np.round((np.asarray(timestamps, dtype=np.float64) - 2440587.5)
+                       * 86400).astype(np.int64)
+    return np.datetime_as_string(seconds.astype('datetime64[s]'), unit='M')
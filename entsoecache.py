@@ -0,0 +1,217 @@
+'''On-disk columnar cache of the price store.
+
+Prices are kept per zone and UTC year as two NumPy files, epochs (int64) and
+prices (float64), sorted by epoch and opened memory-mapped, so a query only
+touches the pages of the slice it needs:
+
+    {directory}/{zone}/{year}.epochs.npy
+    {directory}/{zone}/{year}.prices.npy
+    {directory}/{zone}/{year}.json      version of the partition
+
+A partition is valid while its version equals the watermark of the zone and
+year in entsoestore, which is bumped by every write. Stale or missing
+partitions are rebuilt from SQLite when read.
+
+ResultCache is an in-process LRU for finished results, ex: the dataframes
+of DayAheadPrices.get_historydata, validated against the ingest versions of
+the zones instead of a time to live.
+'''
+
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import entsoemetrics
+
+
+class ColumnarCache:
+    '''Memory-mapped per zone and year partitions of a PriceStore.
+
+    Parameters:
+        store: 'entsoestore.PriceStore'
+        directory: 'str', optional | Default: path of the database with
+            the extension ".cache", ex: "./Energyprices.cache".
+    '''
+
+    def __init__(self, store, directory=None):
+        self.store = store
+        if directory is None:
+            directory = os.path.splitext(store.path)[0] + ".cache"
+        self.directory = directory
+
+    def _paths(self, zone, year):
+        base = os.path.join(self.directory, zone, str(year))
+        return f"{base}.epochs.npy", f"{base}.prices.npy", f"{base}.json"
+
+    def partition(self, zone, year, version=None):
+        '''Returns memory-mapped (epochs, prices) of the zone and year,
+        rebuilt from the store first if the partition is stale.
+        '''
+
+        if version is None:
+            version = self.store.watermarks(zone).get(year, 0)
+        epochs_path, prices_path, meta_path = self._paths(zone, year)
+        try:
+            with open(meta_path) as meta:
+                cached = json.load(meta)["version"]
+        except (OSError, ValueError, KeyError):
+            cached = None
+        if cached != version:
+            entsoemetrics.count("cache_partition_builds_total", zone=zone)
+            with entsoemetrics.timer("cache_build_seconds", zone=zone):
+                self._build(zone, year, version)
+        else:
+            entsoemetrics.count("cache_partition_hits_total", zone=zone)
+        return (np.load(epochs_path, mmap_mode='r'),
+                np.load(prices_path, mmap_mode='r'))
+
+    def _build(self, zone, year, version):
+        '''Writes the partition of the zone and year from the store, files
+        are replaced atomically with the version written last.
+        '''
+
+        start, end = (np.array([f"{year}", f"{year + 1}"], dtype='datetime64[Y]')
+                      .astype('datetime64[s]').astype(np.int64).tolist())
+        zone_id = self.store.zone_id(zone)
+        rows = self.store.conn.execute('''
+            SELECT epoch, price FROM Prices
+            WHERE zone_id=? AND epoch>=? AND epoch<? ORDER BY epoch;
+            ''', (zone_id, start, end)).fetchall()
+        epochs = np.array([row[0] for row in rows], dtype=np.int64)
+        prices = np.array([row[1] for row in rows], dtype=np.float64)
+        os.makedirs(os.path.join(self.directory, zone), exist_ok=True)
+        for path, array in zip(self._paths(zone, year), (epochs, prices)):
+            with open(f"{path}.tmp", 'wb') as file:
+                np.save(file, array)
+            os.replace(f"{path}.tmp", path)
+        meta_path = self._paths(zone, year)[2]
+        with open(f"{meta_path}.tmp", 'w') as meta:
+            json.dump({"version": version}, meta)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def zone_arrays(self, zone, start, end):
+        '''Returns (epochs, prices) of the zone between start and end in
+        epoch seconds, both included. Within one year the arrays are
+        zero-copy slices of the memory-mapped partition.
+        '''
+
+        first_year, last_year = (np.array([start, end]).astype('datetime64[s]')
+                                 .astype('datetime64[Y]').astype(np.int64) + 1970)
+        versions = self.store.watermarks(zone)
+        epoch_parts = []
+        price_parts = []
+        for year in range(int(first_year), int(last_year) + 1):
+            epochs, prices = self.partition(zone, year, versions.get(year, 0))
+            lower = np.searchsorted(epochs, start, side='left')
+            upper = np.searchsorted(epochs, end, side='right')
+            epoch_parts.append(epochs[lower:upper])
+            price_parts.append(prices[lower:upper])
+        if len(epoch_parts) == 1:
+            return epoch_parts[0], price_parts[0]
+        return np.concatenate(epoch_parts), np.concatenate(price_parts)
+
+    def read_prices(self, zones, start, end):
+        '''Same as PriceStore.read_prices but served from the cache: prices
+        of the zones between start and end, both included, indexed by epoch
+        with one column per zone and only epochs with prices for all zones.
+        '''
+
+        arrays = [self.zone_arrays(zone, start, end) for zone in zones]
+        if len(arrays) == 1:
+            epochs, prices = arrays[0]
+            return pd.DataFrame({zones[0]: prices},
+                                index=pd.Index(epochs, name="epoch"), copy=False)
+        common = arrays[0][0]
+        for epochs, _ in arrays[1:]:
+            common = np.intersect1d(common, epochs, assume_unique=True)
+        columns = {zone: prices[np.searchsorted(epochs, common)]
+                   for zone, (epochs, prices) in zip(zones, arrays)}
+        return pd.DataFrame(columns, index=pd.Index(common, name="epoch"))
+
+
+class ResultCache:
+    '''Thread safe LRU of results bounded by number of entries and bytes.
+
+    Every entry is stored with the ingest versions of its zones, see
+    PriceStore.zone_versions, and is only served while they are unchanged.
+    Cached dataframes are shared between callers and not copied, treat them
+    as read-only and copy before modifying them in place.
+
+    Parameters:
+        max_entries: 'int', optional | Default: 32
+        max_bytes: 'int', optional | Default: 512 MiB
+    '''
+
+    def __init__(self, max_entries=32, max_bytes=512 * 2 ** 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, versions):
+        '''Returns the cached result of key for the versions or None.'''
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != versions:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, versions, result):
+        '''Caches the result of key for the versions and evicts the least
+        recently used entries until both bounds hold again. Results larger 
+        than max_bytes are not cached.
+        '''
+
+        size = _size(result)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (versions, result, size)
+            self.bytes += size
+            while (len(self.entries) > self.max_entries or 
+                    self.bytes > self.max_bytes):
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.bytes -= self.entries.pop(key)[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        '''Returns hits, misses, evictions, entries and bytes as a dict.'''
+
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "entries": len(self.entries),
+                    "bytes": self.bytes}
+
+
+def _size(result):
+    '''Returns the memory used by a dataframe, series or array in bytes.'''
+
+    if hasattr(result, "memory_usage"):
+        usage = result.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    return int(getattr(result, "nbytes", 0))
+
+
+#Shared by all DayAheadPrices instances of the process.
+history_results = ResultCache()
@@ -0,0 +1,341 @@
+'''Command line interface of the project.
+
+    python -m entsoecli [--db PATH] [--config PATH] COMMAND ...
+
+Commands:
+    info        Shortcodes of the zones with country and area.
+    sync        Fetches the missing prices of the zones, by default of the
+                zones already in the database for the last 7 days up to
+                tomorrow, cheap enough to run from cron every 15 minutes.
+    query       Writes the history data to CSV, JSON or Parquet.
+    plot        Renders history plots or analytics to files.
+    analytics   Writes the linear regression of every zone.
+    series      Writes load, generation per production type or cross-border
+                flows, fetched first if missing, see entsoeseries.
+    pairs       Writes the spreads, correlation and coupling of every pair
+                of the zones, see entsoepairs.
+    serve       Polls the new delivery day after publication and serves the
+                prices over HTTP as JSON, see entsoeservice.
+
+The API token is read from ENTSOE_API_TOKEN or the config file, see
+entsoefetch.api_token. Exit status is 0 on success and 1 on errors. Data
+written to stdout, the default --output "-", is kept apart from messages
+of fetching and errors, which go to stderr.
+
+Metrics of the stages are written on exit with --metrics, ex:
+    python -m entsoecli --metrics log,prom:./entsoe.prom sync
+see entsoemetrics for the sinks.
+'''
+
+import argparse
+import contextlib
+import logging
+import os
+import sys
+import time
+from datetime import date
+from datetime import timedelta as td
+import entsoefetch
+import entsoemetrics
+import entsoeseries
+import entsoestore
+
+FORMATS = ("csv", "json", "parquet")
+
+
+def _dates(args, start=None, end=None):
+    '''Returns (startdate, enddate) from the arguments as "%Y%m%d".'''
+
+    startdate = args.start or start or "20200101"
+    enddate = args.end or end or date.today().strftime('%Y%m%d')
+    return startdate, enddate
+
+
+def _prices(args, **fields):
+    '''Returns a DayAheadPrices of the arguments, which leaves fetching the
+    missing prices to _check.
+    '''
+
+    from entsoedata import DayAheadPrices
+
+    startdate, enddate = _dates(args)
+    return DayAheadPrices(args.zones, startdate=startdate, enddate=enddate,
+                          percentile=args.percentile, range=args.range,
+                          groupby=args.groupby, filtermode=args.filtermode,
+                          database=args.db, fetch=False, **fields)
+
+
+def _fetcher(args):
+    '''Returns a Fetcher with the token of the config or None.'''
+
+    return entsoefetch.default_fetcher(args.config, args.jobs)
+
+
+def _diagnostics():
+    '''Returns a context in which printed messages, ex: of fetching, go to
+    stderr, so the data written to stdout stays valid CSV or JSON.
+    '''
+
+    return contextlib.redirect_stdout(sys.stderr)
+
+
+def _write(frame, output, format):
+    '''Writes the rows of a dataframe, without index, to the output path,
+    or stdout for "-", in the format, which defaults to the extension of the
+    output or CSV.
+    '''
+
+    if format is None:
+        extension = os.path.splitext(output)[1].lstrip(".").lower()
+        format = extension if extension in FORMATS else "csv"
+    if format == "parquet":
+        if output == "-":
+            print("Parquet can only be written to a file, use --output!",
+                  file=sys.stderr)
+            return 1
+        try:
+            frame.to_parquet(output, index=False)
+        except ImportError as exc:
+            print(exc, file=sys.stderr)
+            print("Writing Parquet needs pyarrow or fastparquet!", 
+                  file=sys.stderr)
+            return 1
+        return 0
+    target = sys.stdout if output == "-" else output
+    if format == "json":
+        frame.to_json(target, orient="records", date_format="iso")
+        if output == "-":
+            print()
+    else:
+        frame.to_csv(target, index=False)
+    return 0
+
+
+def info(args):
+    from entsoedata import DayAheadPrices
+
+    DayAheadPrices(database=args.db).info()
+    return 0
+
+
+def _zones(args):
+    '''Returns the zones of the arguments or all zones in the database.'''
+
+    if args.zones:
+        return args.zones
+    with entsoestore.PriceStore(args.db) as store:
+        zones = [row[0] for row in store.conn.execute(
+            '''SELECT Shortcode FROM Zones ORDER BY Shortcode;''')]
+    if not zones:
+        print("No zones in the database, give them with --zones!")
+    return zones
+
+
+def sync(args):
+    zones = _zones(args)
+    if not zones:
+        return 1
+    fetcher = _fetcher(args)
+    if fetcher is None:
+        return 1
+    from entsoedata import DayAheadPrices
+
+    startdate, enddate = _dates(args,
+        start=(date.today() - td(days=7)).strftime('%Y%m%d'),
+        end=(date.today() + td(days=2)).strftime('%Y%m%d'))
+    started = time.perf_counter()
+    try:
+        DayAheadPrices(zones, startdate=startdate, enddate=enddate,
+                       database=args.db).check_status_of_zones(fetcher)
+    finally:
+        fetcher.close()
+    print(f"Synced {len(zones)} zones in {time.perf_counter() - started:.2f} s")
+    if args.pairs:
+        import entsoepairs
+
+        started = time.perf_counter()
+        with entsoepairs.PairStore(args.db) as store:
+            refreshed = store.refresh_pairs(zones)
+        print(f"Refreshed {refreshed} years of pairs in "
+              f"{time.perf_counter() - started:.2f} s")
+    return 0
+
+
+def _check(prices, args):
+    '''Fetches the missing prices of the history with the jobs and token of
+    the arguments. Without a token only the database is queried.
+    '''
+
+    fetcher = _fetcher(args)
+    if fetcher is None:
+        return
+    try:
+        prices.check_status_of_zones(fetcher)
+    finally:
+        fetcher.close()
+
+
+def query(args):
+    prices = _prices(args)
+    with _diagnostics():
+        _check(prices, args)
+        frame = prices.get_historydata()
+    return _write(frame, args.output, args.format)
+
+
+def plot(args):
+    import entsoeplot
+
+    jobs = [_prices(args, plottype=plottype) for plottype in args.plottype]
+    _check(jobs[0], args)
+    entsoeplot.render_jobs(jobs, args.output, args.extension, args.jobs)
+    return 0
+
+
+def analytics(args):
+    prices = _prices(args)
+    with _diagnostics():
+        _check(prices, args)
+        stats = prices.get_trendstats(alpha=args.alpha, chunk=args.chunk)
+    return _write(stats.reset_index(), args.output, args.format)
+
+
+def series(args):
+    if not args.zones:
+        print("Give the zones with --zones!", file=sys.stderr)
+        return 1
+    with _diagnostics():
+        fetcher = _fetcher(args)
+        if fetcher is None:
+            return 1
+        startdate, enddate = _dates(args)
+        try:
+            frame = entsoeseries.get_series(args.dataset, args.zones, 
+                                            startdate, enddate, 
+                                            args.counterparts, fetcher, args.db)
+        finally:
+            fetcher.close()
+    return _write(frame, args.output, args.format)
+
+
+def pairs(args):
+    prices = _prices(args)
+    with _diagnostics():
+        _check(prices, args)
+        stats = prices.get_pairstats()
+    return _write(stats, args.output, args.format)
+
+
+def serve(args):
+    zones = _zones(args)
+    if not zones:
+        return 1
+    fetcher = _fetcher(args)
+    if fetcher is None:
+        return 1
+    import asyncio
+    import entsoeservice
+
+    service = entsoeservice.Service(zones, args.db, fetcher, days=args.window,
+                                    host=args.host, port=args.port)
+    try:
+        asyncio.run(service.run())
+    finally:
+        fetcher.close()
+    return 0
+
+
+def parser():
+    '''Returns the argument parser of the command line interface.'''
+
+    main_parser = argparse.ArgumentParser(prog="python -m entsoecli",
+        description="Day-ahead prices from the ENTSO-E RESTful API.")
+    main_parser.add_argument("--db", default=entsoestore.DB_PATH,
+                             help="path of the sqlite database")
+    main_parser.add_argument("--config", default=None,
+                             help="config file with the API token")
+    main_parser.add_argument("--metrics", default=None,
+                             help="metrics sinks, ex: log,jsonl:PATH,prom:PATH")
+    commands = main_parser.add_subparsers(dest="command", required=True)
+
+    def command(name, function, help, zones=True, history=True):
+        sub = commands.add_parser(name, help=help)
+        sub.set_defaults(function=function)
+        if zones:
+            sub.add_argument("--zones", nargs="+", required=history,
+                             help="shortcodes, ex: SE_1 FI")
+            sub.add_argument("--start", help="first date as YYYYMMDD")
+            sub.add_argument("--end", help="last date as YYYYMMDD")
+            sub.add_argument("--jobs", type=int, default=8,
+                             help="concurrent requests or render processes")
+        if history:
+            sub.add_argument("--percentile", type=float, default=100)
+            sub.add_argument("--range", default="Middle",
+                             choices=("Top", "Middle", "Bottom"))
+            sub.add_argument("--groupby", default="", choices=("", "Day", "Month"))
+            sub.add_argument("--filtermode", default="Any",
+                             choices=("Any", "All", "Zone"))
+        return sub
+
+    command("info", info, "shortcodes of the zones", zones=False, history=False)
+    sub = command("sync", sync, "fetch missing prices", history=False)
+    sub.add_argument("--pairs", action="store_true",
+                     help="refresh the pair statistics of the zones")
+    sub = command("query", query, "write history data")
+    sub.add_argument("--format", choices=FORMATS,
+                     help="default from the extension of --output or csv")
+    sub.add_argument("--output", default="-", help="file or - for stdout")
+    sub = command("plot", plot, "render plots to files")
+    sub.add_argument("--plottype", nargs="+", default=["Line"],
+                     choices=("Line", "Scatter", "Histogram", "Analytics"))
+    sub.add_argument("--output", default=".", help="directory of the figures")
+    sub.add_argument("--extension", default=".png", help="ex: .png or .svg")
+    sub = command("analytics", analytics, "write linear regression")
+    sub.add_argument("--alpha", type=float, default=0.05)
+    sub.add_argument("--chunk", default=None,
+                     help="stream the history data in chunks, ex: 1M")
+    sub.add_argument("--format", choices=FORMATS,
+                     help="default from the extension of --output or csv")
+    sub.add_argument("--output", default="-", help="file or - for stdout")
+    sub = command("series", series, "write load, generation or flows",
+                  history=False)
+    sub.add_argument("dataset", choices=tuple(entsoeseries.DOCUMENT_TYPES))
+    sub.add_argument("--counterparts", nargs="+",
+                     help="zones the flows go to, ex: FI SE_2")
+    sub.add_argument("--format", choices=FORMATS,
+                     help="default from the extension of --output or csv")
+    sub.add_argument("--output", default="-", help="file or - for stdout")
+    sub = command("pairs", pairs, "write spreads and correlation of pairs")
+    sub.add_argument("--format", choices=FORMATS,
+                     help="default from the extension of --output or csv")
+    sub.add_argument("--output", default="-", help="file or - for stdout")
+    sub = command("serve", serve, "poll and serve prices over HTTP",
+                  history=False)
+    sub.add_argument("--host", default="127.0.0.1")
+    sub.add_argument("--port", type=int, default=8080)
+    sub.add_argument("--window", type=int, default=90,
+                     help="days of prices kept in memory")
+    return main_parser
+
+
+def main(argv=None):
+    '''Runs the command line interface, returns the exit status.'''
+
+    args = parser().parse_args(argv)
+    if args.metrics:
+        try:
+            sinks = entsoemetrics.configure(args.metrics)
+        except ValueError as exc:
+            print(exc)
+            return 1
+        if any(isinstance(sink, entsoemetrics.LoggingSink) for sink in sinks):
+            logging.basicConfig(level=logging.INFO, format="%(name)s %(message)s")
+    try:
+        return args.function(args)
+    except Exception as exc:
+        print(f"{args.command} failed: {exc}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
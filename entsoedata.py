@@ -1,16 +1,17 @@
-import requests 
-import sqlite3
 import pandas as pd 
 from datetime import datetime as dt
-from datetime import timedelta as td
-from IPython.display import display 
-from bs4 import BeautifulSoup  
 import numpy as np 
-import lxml
-import matplotlib.pyplot as plt 
-import scipy.stats as st 
 from dataclasses import dataclass 
-import julian 
+import time
+import entsoeparser
+import entsoefetch
+import entsoestore
+import entsoeaggregate
+import entsoecache
+import entsoefilter
+import entsoemetrics
+import entsoeseries
+import entsoetime
 
 @dataclass
 class DayAheadPrices: 
@@ -35,9 +36,19 @@ class DayAheadPrices:
                 the 5 % highest values from the full dataset.
         groupby: 'str', optional | Default: Empty string | Options: "Day", "Month"
             Type of grouping of the dataset as string.
-
-    Notes: Insert API-token in the method "load_db" before requesting data
-           from DayAheadPrices.
+        filtermode: 'str', optional | Default: "Any" | Options: "Any", "All", "Zone"
+            How percentile and range apply to several zones as string.
+            "Any" drops an hour if any zone is outside its band, "All" only
+            if all zones are, "Zone" filters every zone independently.
+        database: 'str', optional | Default: "./Energyprices.db"
+            Path of the sqlite database as string.
+        fetch: 'bool', optional | Default: True
+            Whether the queries first fetch missing prices with 
+            check_status_of_zones, turned off by callers that already 
+            checked the zones with their own fetcher, ex: entsoecli.
+
+    Notes: Set the API-token in the environment variable ENTSOE_API_TOKEN 
+           or in "~/.entsoe.ini" before requesting data from DayAheadPrices.
 
     Examples of how to run in another script:
         from entsoedata import DayAheadPrices
@@ -57,6 +68,9 @@ class DayAheadPrices:
     percentile: int = 100
     range: str = "Middle"
     groupby: str = ""
+    filtermode: str = "Any"
+    database: str = entsoestore.DB_PATH
+    fetch: bool = True
 
 
     def info(self):
@@ -64,7 +78,7 @@ class DayAheadPrices:
         areas to choose from, along with other describing info.
         '''
 
-        conn = sqlite3.connect("./Energyprices.db")
+        conn = entsoestore.connect(self.database)
         try: 
             domaininfo = pd.read_csv("./Domaininfo.csv")
         except FileNotFoundError as fnf:
@@ -77,211 +91,106 @@ class DayAheadPrices:
             pass
         try:
             textinfo = pd.read_sql('''SELECT * FROM DomainInfo; ''', conn)
-            conn.close()
             with pd.option_context('display.max_rows', None):
-                display(textinfo.set_index('Shortcode'))
+                _display(textinfo.set_index('Shortcode'))
         except Exception:
             print("Can't display Domaininfo!")
 
 
-    def load_db(self, zones=None):
+    def load_db(self, zones=None, fetcher=None, intervals=None):
         '''Loads the sqlite database with day-ahead prices 
         along with date and time for the choosen zones and inverval.
+        The (zone x window) requests are fetched and parsed concurrently, 
+        every response is written by this thread with a single upsert 
+        transaction per zone and window to the store in entsoestore, which 
+        also records the covered range of the zone.
 
         Parameters: 
             zones: 'list', optional
+            fetcher: 'entsoefetch.Fetcher', optional | Default: 8 jobs 
+                against the ENTSO-E API with the token of 
+                entsoefetch.api_token, nothing is fetched without a token.
+            intervals: 'dict', optional | Default: startdate - enddate
+                Zone mapped to a list of (start, end) dates to load, 
+                used by check_status_of_zones to only fetch gaps.
         '''
         
         if zones is None:
             zones = self.zones
-        #Insert your API-token below to be able to run script.
-        api_token = "...."
-        api_base = f"api?securityToken={api_token}"
-        doc_type = "A44"
         start_day = dt.strptime(self.startdate, '%Y%m%d').date()
         end_day = dt.strptime(self.enddate, '%Y%m%d').date()
         interval = (end_day-start_day).days
-        startdate = self.startdate
-        enddate = self.enddate
         
         if interval < 0:
             print("The interval is invalid, the endingdate most be" 
                     "after the startingdate in time!") 
-        
-        elif interval > 369: 
-            lower_limit = start_day
-            upper_limit = start_day + td(days=369)
-            while (end_day-lower_limit).days > 369:
-                for zon in zones:
-                    conn = sqlite3.connect("./Energyprices.db")
-                    try:
-                        cursor = conn.cursor()
-                        cursor.execute(f'''
-                            SELECT Domainstr 
-                            FROM DomainInfo 
-                            WHERE Shortcode="{zon}";
-                            ''')
-                        Domain = cursor.fetchone()[0]
-                    except Exception:
-                        print(f"{zon} is not a valid shortcode!")
-                        continue
-                    cursor.execute(f'''
-                        CREATE TABLE IF NOT EXISTS "{zon}" 
-                        (DateTime TEXT PRIMARY KEY, Price INT); 
-                        ''')
-                    conn.commit()
-                    cursor.close()
-                    
-                    lower_limit_str = dt.strftime(lower_limit, '%Y%m%d')
-                    upper_limit_str = dt.strftime(upper_limit, '%Y%m%d')
-                    try:
-                        response = requests.get(
-                                        "https://web-api.tp.entsoe.eu/"\
-                                        f"{api_base}&"\
-                                        f"documentType={doc_type}&"\
-                                        f"in_Domain={Domain}&"\
-                                        f"out_Domain={Domain}&"\
-                                        f"periodStart={lower_limit_str}0000&"\
-                                        f"periodEnd={upper_limit_str}0000")
-                    except requests.exceptions.RequestException as re:
-                        print(re)
-                        print(f"Request for {zon} {startdate}-{enddate} failed!")
-                        continue
-                    
-                    response_content = BeautifulSoup(response.content, 'lxml')
-                    try:
-                        no_data=response_content.find('text').get_text()[0:22]
-                        no_data_str='No matching data found'
-                        if no_data == no_data_str:
-                            print(f"No data found for {zon} {lower_limit_str} - "\
-                                    f"{upper_limit_str}, choose another zone!")
-                            exit(1) 
-                    except Exception:
-                        pass
-                    response_selection = response_content.find_all('timeseries')
-                    insert_query = f'''INSERT INTO "{zon}" (DateTime, Price) VALUES (?,?)'''
-                    for day_timeseries in response_selection:
-                        date = dt.strptime(
-                        day_timeseries.find_all('start')[0].get_text(),'%Y-%m-%dT%H:%MZ'
-                        )
-                        try:
-                            for hour in day_timeseries.find_all('point'):
-                                conn = sqlite3.connect("./Energyprices.db")
-                                hour_index = int(hour.find('position').get_text())
-                                datehour = str(date + td(hours=hour_index))
-                                price = hour.find('price.amount').get_text()
-                                cursor = conn.cursor()
-                                cursor.execute(insert_query, (datehour,price))
-                                conn.commit()
-                        except Exception:
-                           pass
-                    conn.close() 
-                    print(f"{zon} fetched and loaded for {lower_limit}"\
-                            f" - {upper_limit} in to sql tables!")
-                lower_limit = upper_limit 
-                upper_limit += td(days=369)
-            startdate = dt.strftime(lower_limit, '%Y%m%d')
-            enddate = dt.strftime(end_day, '%Y%m%d')
-        
+            return
+
+        store = entsoestore.PriceStore(self.database)
+        jobs = []
         for zon in zones:
-                conn = sqlite3.connect("./Energyprices.db")
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute(f'''
-                        SELECT Domainstr 
-                        FROM DomainInfo 
-                        WHERE Shortcode="{zon}"
-                    ''')
-                    Domain = cursor.fetchone()[0]
-                except Exception:
-                    print(f"{zon} is not a valid shortcode!")
-                    continue
-                cursor.execute(f'''
-                    CREATE TABLE IF NOT EXISTS "{zon}" 
-                    (DateTime TEXT PRIMARY KEY, Price INT) 
-                    ''')
-                conn.commit()
-                cursor.close()
-                try:
-                    response = requests.get(
-                                        "https://web-api.tp.entsoe.eu/"\
-                                        f"{api_base}&"\
-                                        f"documentType={doc_type}&"\
-                                        f"in_Domain={Domain}&"\
-                                        f"out_Domain={Domain}&"\
-                                        f"periodStart={startdate}0000&"\
-                                        f"periodEnd={enddate}0000")
-                except requests.exceptions.RequestException as re:
-                    print(re)
-                    print(f"Request for {zon} {startdate}-{enddate} failed!")
-                    continue
-                response_content = BeautifulSoup(response.content, 'lxml')
-                try:
-                    no_data=response_content.find('text').get_text()[0:22]
-                    no_data_str='No matching data found'
-                    if no_data == no_data_str:
-                        print(f"No data found for {zon} {lower_limit_str} - "\
-                                    f"{upper_limit_str}, choose another zone!")
-                        exit(1)
-                except Exception:
-                    pass
-                response_selection = response_content.find_all('timeseries')
-                insert_query = f'''INSERT INTO "{zon}" (DateTime, Price) VALUES (?,?)'''
-                for day_timeseries in response_selection:
-                    date = dt.strptime(
-                        day_timeseries.find_all('start')[0].get_text(),
-                        '%Y-%m-%dT%H:%MZ')
-                    try:
-                        for hour in day_timeseries.find_all('point'):
-                            hour_index = int(hour.find('position').get_text())
-                            datehour = str(date + td(hours=hour_index))
-                            price = hour.find('price.amount').get_text()
-                            cursor = conn.cursor()
-                            cursor.execute(insert_query, (datehour,price))
-                            conn.commit()
-                            cursor.close()       
-                    except Exception:
-                        pass
-                conn.close()
-                print(f"{zon} fetched and loaded for {startdate}"\
-                        f" - {enddate} in to sql tables!")
-
-
-    def check_status_of_zones(self):
+            Domain = store.domain(zon)
+            if Domain is None:
+                print(f"{zon} is not a valid shortcode!")
+                continue
+            zone_intervals = ([(start_day, end_day)] if intervals is None 
+                              else intervals.get(zon, []))
+            for lower_day, upper_day in zone_intervals:
+                for lower_limit, upper_limit in entsoefetch.split_windows(
+                        lower_day, upper_day):
+                    jobs.append(entsoefetch.FetchJob(zon, Domain, 
+                                                     lower_limit, upper_limit))
+        own_fetcher = fetcher is None
+        if own_fetcher:
+            fetcher = entsoefetch.default_fetcher()
+            if fetcher is None:
+                store.close()
+                return
+
+        def write(job, batch, covered_end):
+            entsoemetrics.count("parse_points_total", len(batch[0]), zone=job.zone)
+            #Windows ending in the past are complete, others up to last point.
+            return store.write_prices(job.zone, *batch, 
+                                      entsoetime.day_epoch(job.start), covered_end)
+
+        def empty(job):
+            #Past windows without data won't get any, skip them later.
+            store.record_coverage(job.zone, entsoetime.day_epoch(job.start), 
+                                  entsoetime.day_epoch(job.end))
+
+        try:
+            entsoeseries.ingest(fetcher, jobs, _parse_a44, write, empty)
+        finally:
+            if own_fetcher:
+                fetcher.close()
+            store.close()
+
+
+    def check_status_of_zones(self, fetcher=None):
         '''Checks if the data for the zones and interval already exists in 
         the database. 
-        Calls on the method for loading in data if a certain zone don't exists
-        in the database.
+        Looks up the ranges in the table Coverage and calls on the method 
+        for loading in data with only the missing intervals of every zone.
+
+        Parameters: 
+            fetcher: 'entsoefetch.Fetcher', optional, passed to load_db.
         '''
 
-        lower_limit_str = dt.strptime(self.startdate, 
-                                        '%Y%m%d').strftime('%Y-%m-%d %H:%M')
-        upper_limit_str = dt.strptime(self.enddate, 
-                                        '%Y%m%d').strftime('%Y-%m-%d %H:%M')
-        check=[]
-
-        for zon in self.zones:
-            try:
-                conn = sqlite3.connect("./Energyprices.db")
-                tableexists = pd.read_sql(f'''
-                    SELECT strftime('%Y-%m-%d %H:%M',"{zon}".DateTime) AS DateHour, 
-                    Price AS "{zon} Price" 
-                    FROM "{zon}" 
-                    WHERE DateHour BETWEEN "{lower_limit_str}" AND "{upper_limit_str}"; 
-                    ''',conn)
-                conn.close()
-            except Exception:
-                check.append(zon)
-                continue
-            start_day = dt.strptime(self.startdate, '%Y%m%d').date()
-            end_day = dt.strptime(self.enddate, '%Y%m%d').date()
-            interval_points = (end_day-start_day).days * 24 * 0.95
-            if (tableexists.empty or 
-                    (len(tableexists.index) < interval_points)):
-                check.append(zon)
+        start = entsoetime.day_epoch(dt.strptime(self.startdate, '%Y%m%d'))
+        end = entsoetime.day_epoch(dt.strptime(self.enddate, '%Y%m%d'))
+        check = {}
+
+        with entsoestore.PriceStore(self.database) as store:
+            for zon in self.zones:
+                missing = store.missing_intervals(zon, start, end)
+                if missing:
+                    check[zon] = [(entsoetime.epoch_day(lower), 
+                                   entsoetime.epoch_day(upper, ceil=True)) 
+                                  for lower, upper in missing]
         if check:
             print(f"Fetching data for {check}")
-            DayAheadPrices.load_db(self, zones=check)    
+            DayAheadPrices.load_db(self, zones=list(check), fetcher=fetcher, 
+                                   intervals=check)
         
 
     def get_historydata(self):
@@ -289,262 +198,262 @@ class DayAheadPrices:
         if parameter groupby is change from default.
         Returns the data as a dataframe.
 
-        Options for groupby: "Month", "Day".
+        Options for groupby: "Month", "Day", giving the mean price of every 
+        zone for its local market day or month. For other aggregates and 
+        resolutions use entsoeaggregate.aggregate. Hourly data is read and
+        labelled in the local time of the first zone.
+
+        Results are memoized in entsoecache.history_results until new data 
+        is ingested for any of the zones, the returned dataframe is shared 
+        with later calls and should not be modified in place.
         '''
         
-        DayAheadPrices.check_status_of_zones(self)
-
-        startdate = dt.strptime(self.startdate, '%Y%m%d').strftime('%Y-%m-%d %H:%M')
-        enddate = dt.strptime(self.enddate, '%Y%m%d').strftime('%Y-%m-%d %H:%M')
-        first_zon = self.zones[0]
-        price_column_query = ""
-        inner_join_query = ""
-        groupby_query = ""
-
-        if self.groupby == "Month":
-            groupby_query = '''GROUP BY YearMonth'''
-        elif self.groupby == "Day":
-            groupby_query = '''GROUP BY YearMonthDay'''
-        
-        if len(self.zones) > 1:
-            for zon in self.zones[1:]:
-                price_column_query = (f'''{price_column_query},'''\
-                    f''' "{zon}".Price AS "{zon} Price" ''')
-                inner_join_query = (f'''{inner_join_query}INNER JOIN "{zon}" '''\
-                    f'''ON "{zon}".DateTime = "{first_zon}".DateTime ''')
-        
-        insert_query=f''' 
-            SELECT strftime('%Y-%m-%d %H',"{first_zon}".DateTime), 
-            strftime('%Y%m',"{first_zon}".DateTime) AS YearMonth, 
-            strftime('%Y%m%d',"{first_zon}".DateTime) AS YearMonthDay, 
-            julianday("{first_zon}".DateTime) TimeStamp, 
-            "{first_zon}".Price AS "{first_zon} Price"{price_column_query} 
-            FROM "{first_zon}" 
-            {inner_join_query} 
-            WHERE "{first_zon}".DateTime BETWEEN "{startdate}" AND "{enddate}"  
-            {groupby_query}
-            ORDER BY "{first_zon}".DateTime ASC
-            '''
-        conn = sqlite3.connect("./Energyprices.db")
+        if self.fetch:
+            DayAheadPrices.check_status_of_zones(self)
+
+        start = entsoetime.day_epoch(dt.strptime(self.startdate, '%Y%m%d'))
+        end = entsoetime.day_epoch(dt.strptime(self.enddate, '%Y%m%d'))
+        key = (tuple(self.zones), self.startdate, self.enddate, 
+               self.percentile, self.range, self.groupby, self.filtermode)
+        groupby = self.groupby or "Hour"
+        started = time.perf_counter()
         try:
-            historydata = pd.read_sql(insert_query,conn)
+            with entsoestore.PriceStore(self.database) as store:
+                key = (store.path,) + key
+                versions = store.zone_versions(self.zones)
+                historydata = entsoecache.history_results.get(key, versions)
+                if historydata is not None:
+                    entsoemetrics.count("history_cache_hits_total")
+                    entsoemetrics.observe("query_seconds", 
+                                          time.perf_counter() - started, 
+                                          groupby=groupby, source="results")
+                    return historydata
+                entsoemetrics.count("history_cache_misses_total")
+                if self.groupby in ("Day", "Month"):
+                    #Mean per day or month, pushed down to the rollup tables.
+                    means = entsoeaggregate.aggregate(
+                        store, self.zones, start, end, 
+                        resolution=self.groupby.lower())
+                    prices = means.xs("mean", axis=1, level=1).dropna()
+                    timezone = None
+                else:
+                    #Hourly prices from the memory-mapped columnar cache.
+                    timezone = entsoetime.zone_timezone(self.zones[0])
+                    lower, upper = entsoetime.utc_epochs([start, end], 
+                                                         timezone).tolist()
+                    cache = entsoecache.ColumnarCache(store)
+                    prices = cache.read_prices(self.zones, lower, upper)
         except Exception as exc:
-            conn.close()
             print(exc)
             print("Fetching of data for historydata failed!")
             raise
         else:
+            historydata = _history_frame(prices, timezone)
             if self.percentile != 100:
-                percentile = self.percentile / 100
-                QB = historydata.quantile(1 - percentile)
-                QT = historydata.quantile(percentile)
-                if self.range == "Middle":
-                    historydata = historydata[~((historydata < QB) | (historydata > QT)).any(axis=1)]
-                elif self.range == "Top":
-                    historydata = historydata[~(historydata < QT).any(axis=1)]
-                elif self.range == "Bottom":
-                    historydata = historydata[~(historydata > QT).any(axis=1)]
-                else:
-                    print("Input to range is not a valid range!")
+                historydata = entsoefilter.filter_frame(
+                    historydata, self.percentile, self.range, self.filtermode)
+            entsoecache.history_results.put(key, versions, historydata)
+            entsoemetrics.observe("query_seconds", time.perf_counter() - started,
+                                  groupby=groupby, source="store")
+            entsoemetrics.observe("query_rows", len(historydata), groupby=groupby)
             return historydata
 
 
+    def iter_historydata(self, chunk="1M"):
+        '''Generator version of get_historydata for out-of-core analysis.
+        Yields dataframes with the same columns for consecutive chunks of 
+        the interval, read from the database one chunk at a time so memory 
+        stays bounded by the chunk and not the interval.
+
+        Day and Month groups spanning several chunks are merged before they
+        are yielded. With a percentile the bands are approximated in a first
+        pass over the chunks, see entsoefilter.approximate_bands.
+
+        Parameters: 
+            chunk: 'str', optional | Default: "1M" 
+                Length of the chunks, ex: "7D", "2W", "1M", "1Y".
+        '''
+
+        if self.fetch:
+            DayAheadPrices.check_status_of_zones(self)
+
+        start = entsoetime.day_epoch(dt.strptime(self.startdate, '%Y%m%d'))
+        end = entsoetime.day_epoch(dt.strptime(self.enddate, '%Y%m%d'))
+
+        timezones = {zone: entsoetime.zone_timezone(zone) for zone in self.zones}
+        bounds = np.array([entsoetime.utc_epochs([start, end], timezone) 
+                           for timezone in timezones.values()])
+
+        def chunks():
+            with entsoestore.PriceStore(self.database) as store:
+                if self.groupby in ("Day", "Month"):
+                    #Local days of every zone, read from the earliest to the
+                    #latest of their UTC bounds and clipped to the dates.
+                    #Every zone is averaged over its own hours and days
+                    #without a mean for all zones are dropped, as the 
+                    #rollups of get_historydata.
+                    means = entsoeaggregate.aggregate_stream(
+                        store.iter_prices(self.zones, int(bounds[:, 0].min()), 
+                                          int(bounds[:, 1].max()) - 1, chunk,
+                                          complete=False), 
+                        resolution=self.groupby.lower(), timezones=timezones)
+                    prices = (frame.xs("mean", axis=1, level=1)
+                              .loc[start:end - 1].dropna() for frame in means)
+                    timezone = None
+                else:
+                    prices = store.iter_prices(self.zones, int(bounds[0, 0]), 
+                                               int(bounds[0, 1]), chunk)
+                    timezone = timezones[self.zones[0]]
+                for frame in prices:
+                    if len(frame):
+                        yield _history_frame(frame, timezone)
+
+        if self.percentile == 100:
+            yield from chunks()
+            return
+        bands = entsoefilter.approximate_bands(chunks(), self.percentile)
+        for historydata in chunks():
+            yield entsoefilter.filter_frame(historydata, self.percentile, 
+                                            self.range, self.filtermode, 
+                                            bands=bands)
+
+
     def get_historytables(self):
         '''Displays the dataframe from historydata in terminal.'''
         historydata = DayAheadPrices.get_historydata(self)
         with pd.option_context('display.max_rows',None):
-            display(historydata.set_index('YearMonth'))   
+            _display(historydata.set_index('YearMonth'))   
 
 
-    def get_historyplots(self):
+    def get_historyplots(self, path=None):
         '''Makes visualisation plots with the given dataframe from 
         get_historydata.
         
         Options for plottype: "Line", "Scatter", "Histogram".
+
+        Parameters:
+            path: 'str', optional | Default: None, shows the plot.
+                Saves the plot to the path instead, ex: "./Lineplot.png" 
+                or "./Lineplot.svg".
         '''
- 
-        tableaucolors = ['#2ca02c', '#1f77b4', '#ff7f0e', '#aec7e8', '#ffbb78',
-                        '#ff9896', '#c5b0d5', '#98df8a', '#9467bd', '#e377c2', 
-                        '#bcbd22', '#9edae5', '#f7b6d2', '#17becf']
-  
+
+        import entsoeplot
+
         zonesdata = DayAheadPrices.get_historydata(self) 
+        return entsoeplot.render_history(zonesdata, self.zones, self.plottype, 
+                                         path)
+
+    def get_trendstats(self, alpha=0.05, chunk=None):
+        '''Returns the linear regression of the price over time (julian day)
+        of every zone as a dataframe indexed by zone with the columns slope,
+        intercept, r_square, std_err, slope_err, t_score, p_value, 
+        t_critical, dof, n, mean_x and sxx, see entsoeanalytics.
+
+        Parameters:
+            alpha: 'float', optional | Default: 0.05
+            chunk: 'str', optional | Default: None | Options: "1D", "1W", 
+                "1M", "1Y"... Streams the history data with iter_historydata
+                instead of materializing it.
+        '''
 
-        number_of_subplots = len(self.zones) + 1
-        plt.figure(f"Prices for {str(self.zones)[1:-1]} energy zones", 
-            figsize = (10, 5), dpi = 150)
-    
-        if self.plottype == "Histogram":
-            plt.subplot(number_of_subplots, 1, 1)
-            for rank,zon in enumerate(self.zones):
-                percentile_25,percentile_75 = np.percentile(zonesdata[f"{zon} Price"], [25, 75])
-                bin_width = (2 
-                            * (percentile_75-percentile_25) 
-                            * len(zonesdata[f"{zon} Price"]) 
-                            ** (-1/3))
-                bins = round((zonesdata[f"{zon} Price"].max() 
-                            - zonesdata[f"{zon} Price"].min())/bin_width)
-                plt.hist(zonesdata[f"{zon} Price"], density=True, 
-                        bins=bins, label=f"{zon}", alpha=0.3, 
-                        color=tableaucolors[-(rank+1)], lw=0)
-                xlim = plt.xlim()
-                plt.xlim(xlim[0], xlim[1])
-                kde_xs = np.linspace(xlim[0], xlim[1], 500)
-                kde = st.gaussian_kde(zonesdata[f"{zon} Price"])
-                plt.plot(kde_xs, kde.pdf(kde_xs), label=f"{zon} PDF", 
-                        linewidth=1, alpha=0.7, color=tableaucolors[rank])
-                plt.tight_layout()  
-            plt.yticks(fontsize=5)
-            plt.xticks(fontsize=5)
-            plt.ylabel('Probability', fontsize=7)
-            plt.legend(fontsize=7, frameon=False, ncol=(len(self.zones)*2))
-
-            for rank,zon in enumerate(self.zones):
-                plt.subplot(number_of_subplots, 1, (rank+2))
-                percentile_25, percentile_75 = np.percentile(zonesdata[f"{zon} Price"], [25, 75])
-                bin_width = (2 
-                            * (percentile_75-percentile_25) 
-                            * len(zonesdata[f"{zon} Price"]) 
-                            ** (-1/3))
-                bins = round((zonesdata[f"{zon} Price"].max() 
-                            - zonesdata[f"{zon} Price"].min())/bin_width)
-                plt.hist(zonesdata[f"{zon} Price"], density=True, bins=bins, 
-                        label=f"{zon}", alpha=0.5, color=tableaucolors[-(rank+1)], 
-                        lw=0.2, ec='White')  
-                xlim = plt.xlim()
-                plt.xlim(xlim[0], xlim[1])
-                kde_xs = np.linspace(xlim[0], xlim[1], 500)
-                kde = st.gaussian_kde(zonesdata[f"{zon} Price"])
-                plt.plot(kde_xs, kde.pdf(kde_xs), label=f"{zon} PDF", linewidth=1, 
-                        alpha=1, color=tableaucolors[rank])
-                plt.tight_layout()
-                plt.legend(fontsize=7, frameon=False, ncol=2)
-                plt.yticks(fontsize=5)
-                plt.xticks(fontsize=5)
-                plt.ylabel('Probability', fontsize=7)
-            plt.tight_layout()
-            plt.xlabel('Price', fontsize=7)
-        
-        else:
-            plt.subplot(number_of_subplots, 1, 1)
-            for rank,zon in enumerate(self.zones):
-                if self.plottype == "Line":
-                    plt.plot(zonesdata.iloc[:,0], zonesdata[f"{zon} Price"], 
-                            linewidth=0.7, label=f"{zon}", alpha=0.8, 
-                            color=tableaucolors[rank])
-                elif self.plottype == "Scatter":
-                    plt.scatter(zonesdata.iloc[:,0], zonesdata[f"{zon} Price"], 
-                                label=f"{zon}", alpha=0.6, c=tableaucolors[rank],
-                                edgecolors='Black', linewidth=0.1, s=10)
-                plt.yticks(fontsize=5)
-                divider_of_xaxis = round(len(zonesdata.index) 
-                                / 11 if len(zonesdata.index) > 11 else 5)
-                plt.xticks(zonesdata.iloc[:,0][::divider_of_xaxis], fontsize=5)
-                plt.ylabel('Price [EUR/MWh]',fontsize=7)
-                plt.xlim(0,zonesdata.iloc[-1,0])
-                plt.tight_layout()
-            plt.legend(fontsize=7, frameon=False, ncol=len(self.zones))
-            
-            for rank,zon in enumerate(self.zones):
-                plt.subplot(number_of_subplots, 1, (rank+2))
-                if self.plottype == "Line":
-                    #Plots the line plot.
-                    plt.plot(zonesdata.iloc[:,0], zonesdata[f"{zon} Price"], 
-                        linewidth=0.7, label=f"{zon}", color=tableaucolors[rank])
-                elif self.plottype == "Scatter":
-                    #Plots the scatter plot.
-                    plt.scatter(zonesdata.iloc[:,0], zonesdata[f"{zon} Price"], 
-                                label=f"{zon}", alpha=0.8, c=tableaucolors[rank],
-                                edgecolors='Black', linewidth=0.1, s=10)
-                plt.yticks(fontsize = 5)
-                divider_of_xaxis = round(len(zonesdata.index) 
-                                / 11 if len(zonesdata.index) > 11 else 5)
-                plt.xticks(zonesdata.iloc[:,0][::divider_of_xaxis], fontsize=5)
-                plt.xlim(0,zonesdata.iloc[-1,0])
-                plt.legend(fontsize=7, frameon=False)
-                plt.tight_layout()
-                plt.ylabel('Price [EUR/MWh]',fontsize=7)
-            plt.xlabel('YearMonth', fontsize=7)
-        plt.tight_layout()
-        plt.show()
-        #For saving the plot as .png uncomment the line below. 
-        #plt.savefig(f'./Lineplot for {str(zones)[1:-1]}.png ')
-
-
-    def get_analytics(self):
+        import entsoeanalytics
+
+        if chunk is None:
+            return entsoeanalytics.regression_frame(
+                DayAheadPrices.get_historydata(self), self.zones, alpha)
+        return entsoeanalytics.regression_stream(
+            DayAheadPrices.iter_historydata(self, chunk), self.zones, alpha)
+
+    def get_pairstats(self, matrices=False):
+        '''Returns the spread (mean, std, min and max), correlation and 
+        coupling frequency, the share of hours with equal prices, of every 
+        pair of the zones as a dataframe with one row per pair, see 
+        entsoepairs. The dates are local midnights of the first zone, 
+        intervals of whole local months are summed from the monthly pair 
+        rollups, which are only recomputed for years with new prices.
+
+        Parameters:
+            matrices: 'bool', optional | Default: False
+                Returns a dict of zones x zones dataframes per statistic
+                instead, ex: ["correlation"].
+        '''
+
+        import entsoepairs
+
+        if self.fetch:
+            DayAheadPrices.check_status_of_zones(self)
+
+        start = entsoetime.day_epoch(dt.strptime(self.startdate, '%Y%m%d'))
+        end = entsoetime.day_epoch(dt.strptime(self.enddate, '%Y%m%d'))
+        start, end = entsoetime.utc_epochs(
+            [start, end], entsoetime.zone_timezone(self.zones[0])).tolist()
+        with entsoepairs.PairStore(self.database) as store:
+            stats = entsoepairs.pair_stats(store, self.zones, start, end)
+        return stats.matrices() if matrices else stats.table()
+
+    def get_analytics(self, path=None):
         '''Makes visualisation of the dataframe from get_historytables 
         with linear regression, prediction range and confidence range.
         Also returns equation for the linear regression along with values 
         for R², T-score, P-value and alpha.   
+
+        Parameters:
+            path: 'str', optional | Default: None, shows the plot.
+                Saves the plot to the path instead, ex: "./Analytics.png".
         '''
 
-        tableaucolors = ['#2ca02c', '#1f77b4', '#ff7f0e', '#aec7e8', '#ffbb78',
-                        '#ff9896', '#c5b0d5', '#98df8a', '#9467bd', '#e377c2', 
-                        '#bcbd22', '#9edae5', '#f7b6d2', '#17becf']
+        import entsoeplot
 
         zonesdata = DayAheadPrices.get_historydata(self)
+        return entsoeplot.render_analytics(zonesdata, self.zones, path)
+
+
+def _display(frame):
+    '''Displays a dataframe with IPython, or prints it without IPython.'''
+
+    try:
+        from IPython.display import display
+    except ImportError:
+        print(frame.to_string())
+        return
+    display(frame)
+
+
+def _parse_a44(content):
+    '''Parses an A44 response into a columnar batch with the streaming
+    parser in entsoeparser.
+
+    Returns a tuple of two arrays (epochs, prices) or None if the response
+    is an acknowledgement without matching data.
+    '''
+
+    try:
+        epochs, prices = entsoeparser.parse_arrays(content)
+    except entsoeparser.NoMatchingDataError:
+        return None
+    if not epochs.size:
+        return None
+    return epochs, prices
+
+
+def _history_frame(prices, timezone=None):
+    '''Returns the dataframe of get_historydata from prices indexed by epoch
+    with one column per zone, with the columns DateHour, YearMonth, 
+    YearMonthDay, TimeStamp (julian day) and "{zon} Price". The labels are
+    in the local time of the timezone, without it the index is already of
+    local epochs, ex: keys of local days.
+    '''
+
+    epochs = prices.index.to_numpy(dtype=np.int64)
+    local = epochs if timezone is None else entsoetime.local_epochs(epochs, 
+                                                                     timezone)
+    date_hours, year_months, year_month_days = entsoetime.calendar_labels(local)
+    historydata = pd.DataFrame({
+        "DateHour": date_hours,
+        "YearMonth": year_months,
+        "YearMonthDay": year_month_days,
+        "TimeStamp": epochs / 86400 + 2440587.5})
+    for zon in prices.columns:
+        historydata[f"{zon} Price"] = prices[zon].to_numpy()
+    return historydata
 
-        plt.figure(f"Analysis for energy zones: {str(self.zones)[1:-1]}", 
-                    figsize=(10, 5), dpi=150)
-        for rank,zon in enumerate(self.zones):
-            time = zonesdata['TimeStamp']
-            price = zonesdata[f"{zon} Price"]
-            reg_koef = np.polyfit(time, price, 1) #Linear regression 
-            number_prices = price.size
-            number_koef = reg_koef.size
-            deg_of_freedom = number_prices - number_koef
-            alpha = 0.05
-            tails = 2
-            t_stat = st.t.ppf(1 - (alpha / tails), deg_of_freedom) # Student’s t
-            p_value = st.t.sf(abs(t_stat), deg_of_freedom)
-            y_model = np.polyval(reg_koef, time)
-            model = np.poly1d(reg_koef)
-            y_model = model(time)
-            y_bar = np.mean(price)
-            r_square = np.sum((y_model-y_bar) ** 2) / np.sum((price-y_bar) ** 2)
-            resid = price - y_model
-            std_err = np.sqrt(sum(resid ** 2) / deg_of_freedom)
-
-            plt.subplot(len(self.zones), 1, rank+1)
-            plt.scatter(time, price, c=tableaucolors[rank], marker='o', s = 3)
-            xlim = plt.xlim()
-            ylim = plt.ylim()
-            plt.plot(np.array(xlim), (reg_koef[1]+reg_koef[0]*np.array(xlim)), 
-                    c=tableaucolors[-1], linewidth=1, 
-                    label = f'Linear regression line: y={reg_koef[0]:.4f}x'\
-                        f' {"+" if reg_koef[1]>0 else "-"}{abs(reg_koef[1]):.2f}')
-            time_fitted = np.linspace(xlim[0], xlim[1], 100)
-            price_fitted = np.polyval(reg_koef, time_fitted)
-            ci = (t_stat * std_err 
-                * np.sqrt(1 / number_prices + (time_fitted-np.mean(time)) 
-                        ** 2 / np.sum((time-np.mean(time)) ** 2)))
-            plt.plot([],[],' ',
-                label=f'R²: {r_square:.3f} | T-score: {t_stat:.3f} | P-value:'\
-                    f' {p_value:.3f} | Alpha: {alpha}')
-            plt.fill_between(time_fitted, (price_fitted+ci), (price_fitted-ci), 
-                            label = f'95 % Confidence Interval',
-                            facecolor='#b9cfe7', zorder=0)
-            pi = (t_stat * std_err 
-                * np.sqrt(1 + 1 / number_prices + (time_fitted - np.mean(time))
-                        **2 / np.sum((time-np.mean(time)) ** 2)))
-            plt.plot(time_fitted, (price_fitted-pi), '--', color='0.5', 
-                label=f'95 % Prediction Limits')
-            plt.plot(time_fitted, (price_fitted+pi), '--', color='0.5')
-            def JDayToStr(element):
-                return julian.from_jd(element).strftime('%Y-%m')
-            mapping = list(map(JDayToStr,time))
-            divider_of_xaxis = round(len(zonesdata.index) 
-                                / 11 if len(zonesdata.index) > 11 else 5)
-            plt.xticks(time[::divider_of_xaxis], mapping[::divider_of_xaxis],
-                        fontsize = 5)
-            plt.yticks(fontsize=5)
-            plt.xlim(xlim)
-            plt.ylim(0, ylim[1])
-            plt.title(f"{zon}", fontsize=10, loc='left')
-            plt.ylabel('Price [EUR/MWh]', fontsize=7)
-            plt.legend(loc=(0.2,1.01), ncol=2, fontsize=4, frameon=False)
-            plt.tight_layout()
-        plt.xlabel('YearMonth', fontsize=7)
-        plt.tight_layout()
-        plt.show()
-        #For saving the plot as .png uncomment the line below. 
-        #plt.savefig(f'./Linearregression"{str(zones)[1:-1]}".png ')
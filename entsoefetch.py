@@ -0,0 +1,237 @@
+'''Concurrent fetching from the ENTSO-E RESTful API.
+
+The (zone x window) grid of a request is split into FetchJobs which are run
+by a bounded thread pool over one pooled requests.Session. A token bucket
+keeps the request rate under the API limit of 400 requests per minute and
+failed requests are retried with exponential backoff. Results are yielded
+back to the calling thread, which is the single writer to the database.
+Latency, throttling, retries, errors and bytes of the requests are recorded
+per zone in entsoemetrics.
+
+The API token is read with api_token from the environment variable
+ENTSOE_API_TOKEN or from a config file:
+
+    [entsoe]
+    api_token = ...
+'''
+
+import configparser
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import date
+from datetime import timedelta as td
+import requests
+from requests.adapters import HTTPAdapter
+import entsoemetrics
+
+API_URL = "https://web-api.tp.entsoe.eu/api"
+RETRY_STATUS = (429, 500, 502, 503, 504)
+TOKEN_ENV = "ENTSOE_API_TOKEN"
+CONFIG_ENV = "ENTSOE_CONFIG"
+CONFIG_PATH = "~/.entsoe.ini"
+
+
+def api_token(config=None):
+    '''Returns the API token from ENTSOE_API_TOKEN or else from api_token
+    in the section [entsoe] of the config file, which is the path given,
+    ENTSOE_CONFIG or ~/.entsoe.ini. Returns None if no token is found.
+    '''
+
+    token = os.environ.get(TOKEN_ENV)
+    if token:
+        return token
+    if config is None:
+        config = os.environ.get(CONFIG_ENV, CONFIG_PATH)
+    parser = configparser.ConfigParser()
+    if not parser.read(os.path.expanduser(config)):
+        return None
+    return parser.get("entsoe", "api_token", fallback=None) or None
+
+
+def default_fetcher(config=None, jobs=8):
+    '''Returns a Fetcher with the token of api_token and the jobs, or prints
+    where to set the token and returns None if no token is found.
+    '''
+
+    token = api_token(config)
+    if token is None:
+        print(f"No API-token found, set {TOKEN_ENV} or api_token in the "
+              f"section [entsoe] of {config or CONFIG_PATH}!")
+        return None
+    return Fetcher(token, jobs=jobs)
+
+
+@dataclass(frozen=True)
+class FetchJob:
+    '''One request to the API for a zone and a window of days.
+
+    Day-ahead prices (A44) are requested with the domain of the zone as
+    in_Domain and out_Domain, other document types give their parameters, 
+    see entsoeseries.DocumentType, and the counterpart zone of a pair, ex: 
+    the zone a cross-border flow goes to.
+    '''
+
+    zone: str
+    domain: str
+    start: date
+    end: date
+    doc_type: str = "A44"
+    parameters: tuple = ()
+    counterpart: str = ""
+
+    def params(self):
+        '''Query parameters for the job, without security token.'''
+
+        params = {"documentType": self.doc_type}
+        params.update(self.parameters or (("in_Domain", self.domain), 
+                                          ("out_Domain", self.domain)))
+        params["periodStart"] = f"{self.start:%Y%m%d}0000"
+        params["periodEnd"] = f"{self.end:%Y%m%d}0000"
+        return params
+
+
+def split_windows(start_day, end_day, days=369):
+    '''Splits the interval into windows of at most days as the API
+    limits one request to a year. Returns a list of (lower, upper) dates.
+    '''
+
+    windows = []
+    lower_limit = start_day
+    while (end_day-lower_limit).days > days:
+        windows.append((lower_limit, lower_limit + td(days=days)))
+        lower_limit += td(days=days)
+    windows.append((lower_limit, end_day))
+    return windows
+
+
+class TokenBucket:
+    '''Thread safe token bucket limiting requests to rate per period.
+
+    The capacity is the allowed burst, with rate 380 per 60 seconds and
+    capacity 10 no 60 second window can see more than 390 requests.
+    '''
+
+    def __init__(self, rate=380, per=60.0, capacity=10):
+        self.fill_rate = rate / per
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''Blocks until a token is available and takes it.'''
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+
+class Fetcher:
+    '''Runs FetchJobs concurrently against the API.
+
+    Parameters:
+        api_token: 'str'
+            Security token for the ENTSO-E RESTful API.
+        api_url: 'str', optional | Default: API_URL
+            Base url, point it to a local server to replay recorded responses.
+        jobs: 'int', optional | Default: 8
+            Number of concurrent requests.
+        requests_per_minute: 'int', optional | Default: 380
+        retries: 'int', optional | Default: 4
+            Retries per job for network errors and status 429/5xx.
+        backoff: 'float', optional | Default: 1.0
+            Seconds before the first retry, doubled for every retry.
+        timeout: 'float', optional | Default: 60
+    '''
+
+    def __init__(self, api_token, api_url=API_URL, jobs=8,
+                 requests_per_minute=380, retries=4, backoff=1.0, timeout=60):
+        self.api_token = api_token
+        self.api_url = api_url
+        self.jobs = jobs
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate=requests_per_minute,
+                                  capacity=min(10, requests_per_minute))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=jobs, pool_maxsize=jobs)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def fetch(self, job):
+        '''Requests one job and returns the response content as bytes.
+        Acknowledgement documents are returned as content regardless of
+        status since they carry the reason, other error statuses raise.
+        '''
+
+        params = {"securityToken": self.api_token, **job.params()}
+        for attempt in range(self.retries + 1):
+            with entsoemetrics.timer("fetch_throttle_seconds", zone=job.zone):
+                self.bucket.acquire()
+            try:
+                with entsoemetrics.timer("fetch_request_seconds", zone=job.zone):
+                    response = self.session.get(self.api_url, params=params,
+                                                timeout=self.timeout)
+            except requests.exceptions.RequestException:
+                if attempt == self.retries:
+                    raise
+                entsoemetrics.count("fetch_retries_total", zone=job.zone,
+                                    reason="network")
+                time.sleep(self._delay(attempt))
+                continue
+            if response.status_code in RETRY_STATUS and attempt < self.retries:
+                entsoemetrics.count("fetch_retries_total", zone=job.zone,
+                                    reason=str(response.status_code))
+                retry_after = response.headers.get("Retry-After", "")
+                time.sleep(float(retry_after) if retry_after.isdigit()
+                           else self._delay(attempt))
+                continue
+            if (response.status_code >= 400 and
+                    b"Acknowledgement_MarketDocument" not in response.content[:1000]):
+                response.raise_for_status()
+            entsoemetrics.count("fetch_bytes_total", len(response.content),
+                                zone=job.zone)
+            return response.content
+
+    def _delay(self, attempt):
+        return self.backoff * 2 ** attempt * (1 + random.random() / 2)
+
+    def run(self, jobs, parse=None):
+        '''Runs the jobs concurrently and yields (job, result, error) in order
+        of completion. The result is the content, or parse(content) when
+        parse is given so that parsing also runs in the worker threads.
+        Error is the raised exception of a failed job, otherwise None.
+        '''
+
+        def work(job):
+            content = self.fetch(job)
+            if parse is None:
+                return content
+            with entsoemetrics.timer("parse_seconds", zone=job.zone):
+                return parse(content)
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = {executor.submit(work, job): job for job in jobs}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as exc:
+                    entsoemetrics.count("fetch_errors_total",
+                                        zone=futures[future].zone)
+                    yield futures[future], None, exc
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,192 @@
+'''Percentile and range filtering of price data.
+
+Quantiles are computed only on the price columns, in one pass over the 2-D
+price matrix, and a band is kept per zone:
+
+    range "Top":    price >= upper quantile (percentile)
+    range "Middle": lower quantile <= price <= upper quantile
+    range "Bottom": price <= lower quantile (100 - percentile)
+
+Modes decide what happens with a row where the zones disagree:
+
+    "Any":  drop the row if any zone is outside its band.
+    "All":  drop the row only if all zones are outside their bands.
+    "Zone": filter every zone independently, prices outside the band of
+            their zone become NaN and rows without prices left are dropped.
+
+For data too large to materialize, TDigest gives approximate quantiles in
+one streaming pass over chunks, see approximate_bands.
+'''
+
+import numpy as np
+
+RANGES = ("Top", "Middle", "Bottom")
+MODES = ("Any", "All", "Zone")
+
+
+def price_columns(frame):
+    '''Returns the "{zon} Price" columns of a history dataframe.'''
+
+    return [column for column in frame.columns if str(column).endswith(" Price")]
+
+
+def quantile_bands(matrix, percentile):
+    '''Returns arrays (lower, upper) with the 100 - percentile and the
+    percentile quantile of every column of the matrix, NaN are ignored.
+    '''
+
+    lower, upper = np.nanpercentile(np.asarray(matrix, dtype=np.float64),
+                                    [100 - percentile, percentile], axis=0)
+    return lower, upper
+
+
+def band_mask(matrix, lower, upper, range="Middle"):
+    '''Returns a boolean matrix which is True for prices inside the band of
+    their column for the range, NaN is never inside.
+    '''
+
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if range == "Top":
+        return matrix >= upper
+    if range == "Bottom":
+        return matrix <= lower
+    if range == "Middle":
+        return (matrix >= lower) & (matrix <= upper)
+    raise ValueError(f"Range {range} is not a valid range!")
+
+
+def filter_frame(historydata, percentile, range="Middle", mode="Any", bands=None):
+    '''Filters a history dataframe on its price columns.
+
+    Parameters:
+        historydata: 'DataFrame' with "{zon} Price" columns.
+        percentile: 'int' or 'float'
+        range: 'str', optional | Default: "Middle" | Options: RANGES
+        mode: 'str', optional | Default: "Any" | Options: MODES
+        bands: 'tuple', optional | Default: exact quantiles of historydata
+            Arrays (lower, upper) per price column, ex: from
+            approximate_bands.
+
+    Returns the filtered dataframe.
+    '''
+
+    if range not in RANGES:
+        print("Input to range is not a valid range!")
+        return historydata
+    if mode not in MODES:
+        print("Input to filtermode is not a valid mode!")
+        return historydata
+    columns = price_columns(historydata)
+    matrix = historydata[columns].to_numpy(dtype=np.float64)
+    if not len(matrix):
+        return historydata
+    lower, upper = bands if bands is not None else quantile_bands(matrix, percentile)
+    inside = band_mask(matrix, lower, upper, range)
+    if mode == "Any":
+        return historydata[inside.all(axis=1)]
+    keep = inside.any(axis=1)
+    if mode == "All":
+        return historydata[keep]
+    filtered = historydata[keep].copy()
+    filtered[columns] = np.where(inside[keep], matrix[keep], np.nan)
+    return filtered
+
+
+class TDigest:
+    '''Mergeable approximate quantiles of a stream of values (t-digest).
+
+    Values are buffered and merged into at most about compression / 2
+    centroids with the arcsine scale function, which keeps the centroids
+    small in the tails where percentile filters need the precision.
+
+    Parameters:
+        compression: 'int', optional | Default: 200
+    '''
+
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.buffer = []
+        self.buffered = 0
+        self.low = np.inf
+        self.high = -np.inf
+
+    def update(self, values, weights=None):
+        '''Adds an array of values, NaN are ignored.'''
+
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if weights is None:
+            weights = np.ones(values.size)
+        keep = ~np.isnan(values)
+        values, weights = values[keep], np.asarray(weights, dtype=np.float64)[keep]
+        if not values.size:
+            return
+        self.low = min(self.low, values.min())
+        self.high = max(self.high, values.max())
+        self.buffer.append((values, weights))
+        self.buffered += values.size
+        if self.buffered > 20 * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        '''Adds the centroids of another TDigest.'''
+
+        other._compress()
+        if other.weights.size:
+            self.update(other.means, other.weights)
+            self.low = min(self.low, other.low)
+            self.high = max(self.high, other.high)
+
+    def _compress(self):
+        if not self.buffer:
+            return
+        means = np.concatenate([self.means] + [values for values, _ in self.buffer])
+        weights = np.concatenate([self.weights] + [weights for _, weights in self.buffer])
+        self.buffer = []
+        self.buffered = 0
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        quantiles = (np.cumsum(weights) - weights / 2) / weights.sum()
+        scale = (self.compression / (2 * np.pi)
+                 * np.arcsin(np.clip(2 * quantiles - 1, -1, 1)))
+        clusters = np.floor(scale)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(clusters)) + 1))
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def quantile(self, q):
+        '''Returns the approximate quantile q, between 0 and 1, or an array
+        of quantiles for an array of q.
+        '''
+
+        self._compress()
+        if not self.weights.size:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        return np.interp(np.asarray(q) * total,
+                         np.concatenate(([0], centers, [total])),
+                         np.concatenate(([self.low], self.means, [self.high])))
+
+
+def approximate_bands(chunks, percentile, compression=200):
+    '''Returns approximate (lower, upper) quantile arrays per column, as
+    quantile_bands, from one pass over an iterable of 2-D price arrays or
+    history dataframes without keeping more than one chunk in memory.
+    '''
+
+    digests = None
+    for chunk in chunks:
+        if hasattr(chunk, "columns"):
+            chunk = chunk[price_columns(chunk)].to_numpy(dtype=np.float64)
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if digests is None:
+            digests = [TDigest(compression) for _ in range(chunk.shape[1])]
+        for digest, column in zip(digests, chunk.T):
+            digest.update(column)
+    if digests is None:
+        return np.empty(0), np.empty(0)
+    bands = np.array([digest.quantile([(100 - percentile) / 100, percentile / 100])
+                      for digest in digests])
+    return bands[:, 0], bands[:, 1]
@@ -0,0 +1,342 @@
+'''Metrics of the fetch, parse, store and query stages.
+
+Instrumented code records counters, gauges and histograms by name and
+labels, ex: per zone:
+
+    with entsoemetrics.timer("fetch_request_seconds", zone=job.zone):
+        ...
+    entsoemetrics.count("fetch_bytes_total", len(content), zone=job.zone)
+    entsoemetrics.observe("write_batch_rows", rows, zone=zone)
+
+Nothing is recorded until metrics are enabled with one or more sinks.
+Disabled, timer returns a shared no-op context and count, gauge and observe
+return after checking a module flag, so the instrumented paths, which are
+per request and per batch and never per row, cost close to nothing.
+
+The recorded values are handed to the sinks on flush, and at exit of the
+process once enabled:
+    LoggingSink     one line per metric to the logger "entsoe.metrics",
+    JsonLinesSink   one JSON object per metric appended to a file,
+    PrometheusSink  the text exposition format written atomically to a
+                    file, ex: for the textfile collector of node_exporter.
+
+Sinks are also enabled from a spec with configure, ex:
+"log,jsonl:./metrics.jsonl,prom:./entsoe.prom", which is read from the
+environment variable ENTSOE_METRICS on import.
+'''
+
+import atexit
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+METRICS_ENV = "ENTSOE_METRICS"
+#Upper bounds of the histogram buckets of durations in seconds and of sizes.
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (10, 100, 1000, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7)
+
+_enabled = False
+_sinks = []
+_metrics = {}
+_lock = threading.Lock()
+_atexit = False
+
+
+class _Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+
+    def add(self, value):
+        self.value += value
+
+    def snapshot(self):
+        return {"value": self.value}
+
+
+class _Gauge(_Counter):
+    kind = "gauge"
+
+    def add(self, value):
+        self.value = value
+
+
+class _Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def snapshot(self):
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {"count": self.count, "sum": self.sum,
+                "min": self.min if self.count else None,
+                "max": self.max if self.count else None,
+                "buckets": cumulative}
+
+
+def _record(factory, name, value, labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        metric = _metrics.get(key)
+        if metric is None:
+            metric = _metrics[key] = factory()
+        metric.add(value)
+
+
+def count(name, value=1, **labels):
+    '''Adds value to the counter name with the labels.'''
+
+    if _enabled:
+        _record(_Counter, name, value, labels)
+
+
+def gauge(name, value, **labels):
+    '''Sets the gauge name with the labels to value.'''
+
+    if _enabled:
+        _record(_Gauge, name, value, labels)
+
+
+def observe(name, value, buckets=None, **labels):
+    '''Adds value to the histogram name with the labels. Buckets default to
+    TIME_BUCKETS for names ending with "_seconds", else SIZE_BUCKETS.
+    '''
+
+    if _enabled:
+        if buckets is None:
+            buckets = TIME_BUCKETS if name.endswith("_seconds") else SIZE_BUCKETS
+        _record(lambda: _Histogram(tuple(buckets)), name, value, labels)
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    '''Returns a context manager adding its duration in seconds to the
+    histogram name with the labels, a shared no-op when disabled.
+    '''
+
+    if _enabled:
+        return _Timer(name, labels)
+    return _NULL_TIMER
+
+
+def enabled():
+    return _enabled
+
+
+def snapshot():
+    '''Returns the recorded metrics as a list of dicts with name, type,
+    labels and the value, or count, sum, min, max and cumulative buckets
+    of histograms, sorted by name and labels.
+    '''
+
+    with _lock:
+        return [{"name": name, "type": metric.kind, "labels": dict(labels),
+                 **metric.snapshot()}
+                for (name, labels), metric in sorted(_metrics.items(),
+                                                     key=lambda item: item[0])]
+
+
+def reset():
+    '''Drops all recorded metrics.'''
+
+    with _lock:
+        _metrics.clear()
+
+
+def enable(*sinks):
+    '''Starts recording and adds the sinks, flushed on exit of the process.'''
+
+    global _enabled, _atexit
+    _sinks.extend(sinks)
+    _enabled = True
+    if not _atexit:
+        atexit.register(flush)
+        _atexit = True
+
+
+def disable():
+    '''Stops recording and removes the sinks, recorded metrics are kept.'''
+
+    global _enabled
+    _enabled = False
+    _sinks.clear()
+
+
+def flush():
+    '''Writes a snapshot of the metrics to every sink.'''
+
+    if not _sinks:
+        return
+    metrics = snapshot()
+    for sink in _sinks:
+        try:
+            sink.write(metrics)
+        except OSError as exc:
+            print(exc)
+            print(f"Writing metrics with {type(sink).__name__} failed!")
+
+
+def configure(spec):
+    '''Enables the sinks of a comma separated spec of "log",
+    "jsonl:PATH" and "prom:PATH". Returns the sinks.
+    '''
+
+    sinks = []
+    for part in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, path = part.partition(":")
+        if kind == "log":
+            sinks.append(LoggingSink())
+        elif kind == "jsonl" and path:
+            sinks.append(JsonLinesSink(path))
+        elif kind == "prom" and path:
+            sinks.append(PrometheusSink(path))
+        else:
+            raise ValueError(f"{part} is not a valid metrics sink, use log, "
+                             f"jsonl:PATH or prom:PATH!")
+    enable(*sinks)
+    return sinks
+
+
+class LoggingSink:
+    '''Logs one line per metric, histograms with count, sum, mean and max.
+
+    Parameters:
+        logger: 'logging.Logger', optional | Default: "entsoe.metrics"
+        level: 'int', optional | Default: logging.INFO
+    '''
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger("entsoe.metrics")
+        self.level = level
+
+    def write(self, metrics):
+        for metric in metrics:
+            labels = " ".join(f"{key}={value}"
+                              for key, value in metric["labels"].items())
+            if metric["type"] == "histogram":
+                mean = metric["sum"] / metric["count"] if metric["count"] else 0
+                text = (f"count={metric['count']} sum={metric['sum']:.6g} "
+                        f"mean={mean:.6g} max={metric['max']:.6g}"
+                        if metric["count"] else "count=0")
+            else:
+                text = f"value={metric['value']:.6g}"
+            self.logger.log(self.level, "%s", " ".join(
+                filter(None, (metric["name"], labels, text))))
+
+
+class JsonLinesSink:
+    '''Appends one JSON object per metric, with the unix time of the flush
+    as "time", to the file at path.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, metrics):
+        now = time.time()
+        with open(self.path, 'a') as file:
+            for metric in metrics:
+                if metric["type"] == "histogram":
+                    metric = dict(metric, buckets=[
+                        ["+Inf" if math.isinf(bound) else bound, count]
+                        for bound, count in metric["buckets"]])
+                file.write(json.dumps({"time": now, **metric}) + "\n")
+
+
+class PrometheusSink:
+    '''Writes the metrics in the Prometheus text exposition format with the
+    names prefixed, ex: "entsoe_fetch_bytes_total". The file is replaced
+    atomically so a collector never reads a partial file.
+    '''
+
+    def __init__(self, path, prefix="entsoe_"):
+        self.path = path
+        self.prefix = prefix
+
+    def write(self, metrics):
+        lines = []
+        typed = set()
+        for metric in metrics:
+            name = self.prefix + metric["name"]
+            if name not in typed:
+                lines.append(f"# TYPE {name} {metric['type']}")
+                typed.add(name)
+            labels = metric["labels"]
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_labels(labels)} {_number(metric['value'])}")
+                continue
+            for bound, count in metric["buckets"]:
+                le = "+Inf" if math.isinf(bound) else _number(bound)
+                lines.append(f"{name}_bucket{_labels(dict(labels, le=le))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(metric['sum'])}")
+            lines.append(f"{name}_count{_labels(labels)} {metric['count']}")
+        with open(f"{self.path}.tmp", 'w') as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+               .replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"'
+                          for key, value in zip(labels, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+if os.environ.get(METRICS_ENV):
+    configure(os.environ[METRICS_ENV])
@@ -0,0 +1,367 @@
+'''Spreads, correlation and coupling of every pair of zones.
+
+PairStats keeps, for all pairs of zones at once, the sufficient statistics
+over the epochs where both zones have a price: count, sums, sums of squares
+and products of the prices, the number of equal prices (coupled hours, the
+zones in one price area) and the minimum and maximum spread. They are
+updated with an aligned price matrix as a few matrix products, NaN for
+missing prices, can be merged and give N x N matrices of the mean, standard
+deviation, minimum and maximum spread, the correlation and the coupling
+frequency without another pass over the data.
+
+PairStore keeps the statistics of every pair per local month in the table
+PairRollup of the database, next to the prices:
+
+    PairRollup (timezone TEXT, zone_a INTEGER, zone_b INTEGER, month INTEGER,
+                count INTEGER, total_a REAL, total_b REAL, squares_a REAL,
+                squares_b REAL, products REAL, equal INTEGER, low REAL,
+                high REAL) WITHOUT ROWID
+    PairWatermarks (timezone TEXT, zone_a INTEGER, zone_b INTEGER,
+                    year INTEGER, version_a INTEGER, version_b INTEGER)
+                    WITHOUT ROWID
+
+with zone_a <= zone_b and low, high the spread of zone_a minus zone_b. Like
+the spreads of entsoeaggregate, months and years are local in the timezone
+of the first zone of the request, month and year are local epochs (see 
+entsoetime) and the rollups are kept per timezone. A local year of a pair is
+recomputed when the watermark of either zone for the UTC years it overlaps
+has changed since, so after an ingest only the years with new prices are
+read again and a matrix of many zones over many years is a GROUP BY of the
+monthly rows.
+'''
+
+import itertools
+import numpy as np
+import pandas as pd
+import entsoestore
+import entsoetime
+
+#Prices closer than half a cent are equal, the zones are coupled.
+COUPLING_TOLERANCE = 0.005
+#Elements of the spreads broadcast at once, rows x zones x zones.
+_BROADCAST = 4 * 10 ** 6
+MATRICES = ("count", "spread_mean", "spread_std", "spread_min", "spread_max",
+            "correlation", "coupling")
+
+
+class PairStats:
+    '''Mergeable statistics of every pair of zones, element [a, b] of the
+    arrays is over the epochs where both a and b have a price.
+
+    Attributes:
+        zones: 'list' of zone names, one per column of the prices.
+        count, equal: 'ndarray' epochs and epochs with equal prices.
+        total, squares: 'ndarray' sums of the prices of a and their squares.
+        products: 'ndarray' sums of the products of the prices of a and b.
+        low, high: 'ndarray' minimum and maximum of price a - price b.
+    '''
+
+    def __init__(self, zones):
+        self.zones = list(zones)
+        shape = (len(self.zones), len(self.zones))
+        self.count = np.zeros(shape)
+        self.total = np.zeros(shape)
+        self.squares = np.zeros(shape)
+        self.products = np.zeros(shape)
+        self.equal = np.zeros(shape)
+        self.low = np.full(shape, np.inf)
+        self.high = np.full(shape, -np.inf)
+
+    def update(self, prices):
+        '''Adds a batch of prices as 2-D array with one column per zone and
+        NaN for missing prices.
+        '''
+
+        prices = np.asarray(prices, dtype=np.float64).reshape(
+            -1, len(self.zones))
+        if not len(prices):
+            return
+        valid = ~np.isnan(prices)
+        ones = valid.astype(np.float64)
+        values = np.where(valid, prices, 0.0)
+        self.count += ones.T @ ones
+        self.total += values.T @ ones
+        self.squares += (values * values).T @ ones
+        self.products += values.T @ values
+        step = max(1, _BROADCAST // len(self.zones) ** 2)
+        with np.errstate(invalid='ignore'):
+            for lower in range(0, len(prices), step):
+                block = prices[lower:lower + step]
+                spreads = block[:, :, None] - block[:, None, :]
+                self.equal += (np.abs(spreads) < COUPLING_TOLERANCE).sum(axis=0)
+                self.low = np.fmin(self.low, np.fmin.reduce(spreads, axis=0))
+                self.high = np.fmax(self.high, np.fmax.reduce(spreads, axis=0))
+
+    def merge(self, other):
+        '''Adds the statistics of another PairStats of the same zones.'''
+
+        self.count += other.count
+        self.total += other.total
+        self.squares += other.squares
+        self.products += other.products
+        self.equal += other.equal
+        self.low = np.fmin(self.low, other.low)
+        self.high = np.fmax(self.high, other.high)
+
+    def matrices(self):
+        '''Returns a dict of the MATRICES as dataframes with the zones as
+        index and columns, spreads are of the row minus the column zone.
+        NaN for pairs without common prices.
+        '''
+
+        count = self.count
+        empty = count == 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (self.total - self.total.T) / count
+            squares = self.squares + self.squares.T - 2 * self.products
+            std = np.sqrt(np.clip((squares - count * mean * mean)
+                                  / (count - 1), 0, None))
+            covariance = self.products - self.total * self.total.T / count
+            variance = self.squares - self.total * self.total / count
+            correlation = covariance / np.sqrt(variance * variance.T)
+            coupling = self.equal / count
+        values = {"count": count, "spread_mean": mean, "spread_std": std,
+                  "spread_min": np.where(empty, np.nan, self.low),
+                  "spread_max": np.where(empty, np.nan, self.high),
+                  "correlation": np.clip(correlation, -1, 1),
+                  "coupling": coupling}
+        return {name: pd.DataFrame(values[name], index=self.zones,
+                                   columns=self.zones)
+                for name in MATRICES}
+
+    def table(self):
+        '''Returns the MATRICES of every pair a < b in the order of the zones
+        as a dataframe with the columns zone_a, zone_b and one per matrix.
+        '''
+
+        matrices = self.matrices()
+        rows, columns = np.triu_indices(len(self.zones), k=1)
+        table = pd.DataFrame({"zone_a": np.array(self.zones, dtype=object)[rows],
+                              "zone_b": np.array(self.zones, dtype=object)[columns]})
+        for name in MATRICES:
+            table[name] = matrices[name].to_numpy()[rows, columns]
+        return table
+
+
+def rolling_correlation(prices, window, pairs=()):
+    '''Correlation of pairs of zones over a rolling window, computed from
+    cumulative sums in one pass over the aligned prices.
+
+    Parameters:
+        prices: 'DataFrame'
+            Prices indexed by epoch with one column per zone, as returned
+            by entsoestore.PriceStore.read_prices.
+        window: 'int'
+            Number of rows of the window, ex: 720 for 30 days of hours.
+        pairs: 'tuple', optional | Default: every pair of the zones
+            Pairs of zones (a, b). Memory is rows x pairs.
+
+    Returns a dataframe indexed by the epoch of the last row of every window
+    with a column "a-b" per pair.
+    '''
+
+    pairs = list(pairs) or list(itertools.combinations(prices.columns, 2))
+    position = {zone: rank for rank, zone in enumerate(prices.columns)}
+    matrix = prices.to_numpy(dtype=np.float64)
+    if len(matrix):
+        #Centered, so the differences of the cumulative sums stay small.
+        matrix = matrix - matrix.mean(axis=0)
+    a = matrix[:, [position[a] for a, _ in pairs]]
+    b = matrix[:, [position[b] for _, b in pairs]]
+
+    def windowed(values):
+        sums = np.cumsum(np.vstack([np.zeros((1, len(pairs))), values]), axis=0)
+        return sums[window:] - sums[:-window]
+
+    names = [f"{a}-{b}" for a, b in pairs]
+    if len(matrix) < window:
+        return pd.DataFrame(columns=names,
+                            index=pd.Index([], name="epoch", dtype=np.int64))
+    sum_a, sum_b = windowed(a), windowed(b)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = window * windowed(a * b) - sum_a * sum_b
+        correlation = covariance / np.sqrt(
+            (window * windowed(a * a) - sum_a * sum_a)
+            * (window * windowed(b * b) - sum_b * sum_b))
+    return pd.DataFrame(correlation, index=prices.index[window - 1:],
+                        columns=names)
+
+
+class PairStore(entsoestore.PriceStore):
+    '''PriceStore with the monthly statistics of every pair of zones.
+
+    Parameters:
+        path: 'str', optional | Default: "./Energyprices.db" or ENTSOE_DB
+    '''
+
+    def __init__(self, path=entsoestore.DB_PATH):
+        super().__init__(path)
+        with self.conn:
+            if "timezone" not in self._columns("PairRollup"):
+                #Rollups of UTC months, rebuilt in local months when read.
+                self.conn.executescript('''
+                    DROP TABLE IF EXISTS PairRollup;
+                    DROP TABLE IF EXISTS PairWatermarks;
+                    ''')
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS PairRollup
+                (timezone TEXT NOT NULL, zone_a INTEGER NOT NULL, 
+                 zone_b INTEGER NOT NULL, month INTEGER NOT NULL, 
+                 count INTEGER, total_a REAL, total_b REAL, squares_a REAL, 
+                 squares_b REAL, products REAL, equal INTEGER, low REAL, 
+                 high REAL,
+                 PRIMARY KEY (timezone, zone_a, zone_b, month)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS PairWatermarks
+                (timezone TEXT NOT NULL, zone_a INTEGER NOT NULL, 
+                 zone_b INTEGER NOT NULL, year INTEGER NOT NULL, 
+                 version_a INTEGER NOT NULL, version_b INTEGER NOT NULL,
+                 PRIMARY KEY (timezone, zone_a, zone_b, year)) WITHOUT ROWID;
+                ''')
+
+    def _zone_ids(self, zones):
+        '''Returns the zone_id of the zones in the store to their name,
+        ordered by zone_id.
+        '''
+
+        zone_ids = {self.zone_id(zone): zone for zone in zones}
+        zone_ids.pop(None, None)
+        return dict(sorted(zone_ids.items()))
+
+    def refresh_pairs(self, zones, timezone=None):
+        '''Recomputes the monthly statistics of every pair of the zones for
+        the local years where the watermark of either zone changed since they
+        were computed. Returns the number of recomputed years of pairs.
+
+        Parameters:
+            zones: 'list'
+            timezone: 'str', optional | Default: timezone of the first zone
+                Timezone of the months and years, see entsoetime.
+        '''
+
+        if timezone is None:
+            timezone = entsoetime.zone_timezone(zones[0] if zones else None)
+        zone_ids = self._zone_ids(zones)
+        watermarks = {zone_id: self.watermarks(zone)
+                      for zone_id, zone in zone_ids.items()}
+        placeholders = ",".join("?" * len(zone_ids))
+        recorded = {(a, b, year): (version_a, version_b)
+                    for a, b, year, version_a, version_b in self.conn.execute(f'''
+            SELECT zone_a, zone_b, year, version_a, version_b FROM PairWatermarks
+            WHERE timezone=? AND zone_a IN ({placeholders}) 
+            AND zone_b IN ({placeholders});
+            ''', [timezone, *zone_ids, *zone_ids])}
+        refreshed = 0
+        #A local year overlaps the UTC years before and after, the versions
+        #only grow so their sum changes with every write to any of them.
+        years = {year + shift for versions in watermarks.values() 
+                 for year in versions for shift in (-1, 0, 1)}
+        for year in sorted(years):
+            versions = {zone_id: sum(watermarks[zone_id].get(year + shift, 0)
+                                     for shift in (-1, 0, 1))
+                        for zone_id in zone_ids}
+            stale = [(a, b) for a, b in itertools.combinations_with_replacement(
+                         zone_ids, 2)
+                     if recorded.get((a, b, year), (0, 0)) 
+                        != (versions[a], versions[b])]
+            if stale:
+                self._refresh_year(zone_ids, versions, timezone, year, stale)
+                refreshed += len(stale)
+        return refreshed
+
+    def _refresh_year(self, zone_ids, versions, timezone, year, stale):
+        involved = sorted({zone_id for pair in stale for zone_id in pair})
+        rank = {zone_id: position for position, zone_id in enumerate(involved)}
+        local_lower, local_upper = (
+            np.array([year - 1970, year - 1969], dtype='datetime64[Y]')
+            .astype('datetime64[s]').astype(np.int64).tolist())
+        lower, upper = entsoetime.utc_epochs([local_lower, local_upper],
+                                             timezone).tolist()
+        prices = self.read_prices([zone_ids[zone_id] for zone_id in involved],
+                                  lower, upper - 1, complete=False)
+        epochs = prices.index.to_numpy(dtype=np.int64)
+        matrix = prices.to_numpy(dtype=np.float64)
+        months = entsoetime.calendar_keys(epochs, timezone)["month"]
+        keys, offsets = np.unique(months, return_index=True)
+        rows = []
+        for month, first, last in zip(keys.tolist(), offsets.tolist(),
+                                      offsets[1:].tolist() + [len(months)]):
+            stats = PairStats(involved)
+            stats.update(matrix[first:last])
+            for a, b in stale:
+                i, j = rank[a], rank[b]
+                if stats.count[i, j]:
+                    rows.append((timezone, a, b, month, int(stats.count[i, j]),
+                                 stats.total[i, j], stats.total[j, i],
+                                 stats.squares[i, j], stats.squares[j, i],
+                                 stats.products[i, j], int(stats.equal[i, j]),
+                                 stats.low[i, j], stats.high[i, j]))
+        with self.conn:
+            self.conn.executemany('''
+                DELETE FROM PairRollup WHERE timezone=? AND zone_a=? 
+                AND zone_b=? AND month>=? AND month<?;
+                ''', [(timezone, a, b, local_lower, local_upper) 
+                      for a, b in stale])
+            self.conn.executemany('''
+                INSERT INTO PairRollup VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?);
+                ''', rows)
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO PairWatermarks VALUES (?,?,?,?,?,?);
+                ''', [(timezone, a, b, year, versions[a], versions[b]) 
+                      for a, b in stale])
+
+    def read_pairs(self, zones, start, end, timezone=None):
+        '''Returns the PairStats of the zones for the local months starting
+        in [start, end) in local epochs of the timezone, summed from 
+        PairRollup after the stale years are refreshed. Unknown zones have
+        no statistics.
+
+        Parameters:
+            timezone: 'str', optional | Default: timezone of the first zone
+        '''
+
+        if timezone is None:
+            timezone = entsoetime.zone_timezone(zones[0] if zones else None)
+        self.refresh_pairs(zones, timezone)
+        stats = PairStats(zones)
+        zone_ids = self._zone_ids(zones)
+        if not zone_ids:
+            return stats
+        rank = {zone: position for position, zone in enumerate(stats.zones)}
+        placeholders = ",".join("?" * len(zone_ids))
+        for a, b, *values in self.conn.execute(f'''
+                SELECT zone_a, zone_b, SUM(count), SUM(total_a), SUM(total_b),
+                SUM(squares_a), SUM(squares_b), SUM(products), SUM(equal),
+                MIN(low), MAX(high)
+                FROM PairRollup WHERE timezone=? 
+                AND zone_a IN ({placeholders}) AND zone_b IN ({placeholders})
+                AND month>=? AND month<?
+                GROUP BY zone_a, zone_b;
+                ''', [timezone, *zone_ids, *zone_ids, start, end]):
+            count, total_a, total_b, squares_a, squares_b, products, equal, \
+                low, high = values
+            i, j = rank[zone_ids[a]], rank[zone_ids[b]]
+            stats.count[i, j] = stats.count[j, i] = count
+            stats.total[i, j], stats.total[j, i] = total_a, total_b
+            stats.squares[i, j], stats.squares[j, i] = squares_a, squares_b
+            stats.products[i, j] = stats.products[j, i] = products
+            stats.equal[i, j] = stats.equal[j, i] = equal
+            stats.low[i, j], stats.high[j, i] = low, -low
+            stats.high[i, j], stats.low[j, i] = high, -high
+        return stats
+
+
+def pair_stats(store, zones, start, end):
+    '''Returns the PairStats of the zones for [start, end) in UTC epoch 
+    seconds, from the monthly rollups of a PairStore when start and end are
+    local midnights starting months in the timezone of the first zone, 
+    otherwise from the prices.
+    '''
+
+    timezone = entsoetime.zone_timezone(zones[0] if zones else None)
+    keys = entsoetime.calendar_keys([start, end], timezone)
+    if isinstance(store, PairStore) and (keys["month"] == keys["local"]).all():
+        return store.read_pairs(zones, *keys["local"].tolist(), timezone)
+    stats = PairStats(zones)
+    stats.update(store.read_prices(zones, start, end - 1, complete=False)
+                 .to_numpy(dtype=np.float64))
+    return stats
@@ -0,0 +1,195 @@
+'''Streaming parser for ENTSO-E market document responses, ex:
+Publication_MarketDocument and GL_MarketDocument.
+
+The document is read with lxml's incremental iterparse, every Period is
+handled as soon as it is closed and then cleared, so the full tree is never
+kept in memory. Positions are mapped to timestamps with the resolution of the
+Period, and curve type A03 (variable sized blocks) is expanded to one point
+per resolution step.
+
+Prices are read from price.amount, other document types such as load,
+generation and flows from quantity, split into series by elements of their
+TimeSeries with parse_series.
+'''
+
+import io
+import re
+from datetime import datetime as dt
+from datetime import timedelta as td
+from datetime import timezone
+import numpy as np
+from lxml import etree
+
+_DURATION = re.compile(r'^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?)?$')
+
+
+class NoMatchingDataError(Exception):
+    '''Raised when ENTSO-E answers with an acknowledgement document instead
+    of data, the reason text from the response is used as message.
+    '''
+
+
+def parse_resolution(resolution):
+    '''Returns the length in seconds of an ISO 8601 duration as used
+    for resolution, ex: "PT60M", "PT15M", "PT1H" or "P1D".
+    '''
+
+    match = _DURATION.match(resolution.strip())
+    if match is None or not any(match.groups()):
+        raise ValueError(f"Resolution {resolution} is not supported!")
+    days, hours, minutes = (int(part or 0) for part in match.groups())
+    return int(td(days=days, hours=hours, minutes=minutes).total_seconds())
+
+
+def parse_timestamp(text):
+    '''Returns epoch seconds for a UTC timestamp as "2020-01-01T23:00Z".'''
+
+    return int(dt.strptime(text.strip(), '%Y-%m-%dT%H:%MZ')
+               .replace(tzinfo=timezone.utc).timestamp())
+
+
+def iter_periods(source, value_tag="price.amount"):
+    '''Streams the Periods of a market document.
+
+    Parameters:
+        source: 'bytes' or file-like object with the XML response.
+        value_tag: 'str', optional | Default: "price.amount"
+            Name of the element holding the value of a Point.
+
+    Yields tuples (start, end, resolution, curvetype, positions, values)
+    where start and end are epoch seconds, resolution is in seconds and
+    positions/values are lists from the Points of the Period.
+
+    Raises NoMatchingDataError if the response is an acknowledgement.
+    '''
+
+    for _, _, period in _iter_periods(source, value_tag):
+        yield period
+
+
+def _iter_periods(source, value_tag):
+    '''Yields (timeseries, namespace, period) for the Periods of iter_periods
+    along with their TimeSeries element, which is only valid until the next
+    Period is read.
+    '''
+
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    context = etree.iterparse(source, events=("end",),
+                              tag=("{*}Period", "{*}text"))
+    for _, element in context:
+        namespace = element.tag[:element.tag.find('}') + 1]
+        if element.tag.endswith('}text') or element.tag == 'text':
+            root = element.getroottree().getroot()
+            if etree.QName(root).localname.startswith('Acknowledgement'):
+                raise NoMatchingDataError(element.text)
+            continue
+        timeseries = element.getparent()
+        curvetype = timeseries.findtext(f'{namespace}curveType') or "A01"
+        interval = element.find(f'{namespace}timeInterval')
+        start = parse_timestamp(interval.findtext(f'{namespace}start'))
+        end = parse_timestamp(interval.findtext(f'{namespace}end'))
+        resolution = parse_resolution(
+            element.findtext(f'{namespace}resolution'))
+        positions = []
+        values = []
+        for point in element.iterchildren(f'{namespace}Point'):
+            positions.append(int(point.findtext(f'{namespace}position')))
+            values.append(float(point.findtext(f'{namespace}{value_tag}')))
+        yield (timeseries, namespace, 
+               (start, end, resolution, curvetype, positions, values))
+        #Free the parsed Period along with already handled TimeSeries.
+        element.clear()
+        while timeseries.getprevious() is not None:
+            del timeseries.getparent()[0]
+
+
+def _expand_period(start, end, resolution, curvetype, positions, values):
+    '''Returns epoch seconds and values as arrays for one Period.'''
+
+    positions = np.asarray(positions, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if curvetype == "A03" and positions.size:
+        #Variable sized blocks, a value holds until the next position.
+        order = np.argsort(positions)
+        positions = positions[order]
+        values = values[order]
+        last_position = (end - start) // resolution + 1
+        counts = np.diff(np.append(positions, last_position))
+        values = np.repeat(values, counts)
+        positions = np.arange(positions[0], positions[0] + values.size)
+    epochs = start + (positions - 1) * resolution
+    return epochs, values
+
+
+def iter_points(source, value_tag="price.amount"):
+    '''Yields (timestamp, value) records of a market document where
+    timestamp is a naive UTC datetime for the start of the position.
+    '''
+
+    for period in iter_periods(source, value_tag):
+        epochs, values = _expand_period(*period)
+        for epoch, value in zip(epochs.tolist(), values.tolist()):
+            yield dt.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None), value
+
+
+def parse_arrays(source, value_tag="price.amount"):
+    '''Parses a market document into NumPy arrays.
+
+    Returns a tuple (epochs, values) with epoch seconds as int64 and
+    values as float64, both in document order.
+    '''
+
+    epoch_parts = []
+    value_parts = []
+    for period in iter_periods(source, value_tag):
+        epochs, values = _expand_period(*period)
+        epoch_parts.append(epochs)
+        value_parts.append(values)
+    if not epoch_parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    return np.concatenate(epoch_parts), np.concatenate(value_parts)
+
+
+def _series_label(timeseries, namespace, series, markers):
+    '''Returns the label of a TimeSeries from the texts of the series paths
+    and the names of the marker paths present, joined by spaces.
+    '''
+
+    parts = []
+    for path in series:
+        text = timeseries.findtext("/".join(f'{namespace}{step}' 
+                                            for step in path.split("/")))
+        if text:
+            parts.append(text.strip())
+    for path, name in markers:
+        if timeseries.find(f'{namespace}{path}') is not None:
+            parts.append(name)
+    return " ".join(parts)
+
+
+def parse_series(source, value_tag="quantity", series=(), markers=()):
+    '''Parses a market document with several TimeSeries into NumPy arrays
+    per series.
+
+    Parameters:
+        source: 'bytes' or file-like object with the XML response.
+        value_tag: 'str', optional | Default: "quantity"
+        series: 'tuple', optional | Default: one series
+            Paths in the TimeSeries, ex: "MktPSRType/psrType", whose texts
+            label the series.
+        markers: 'tuple', optional
+            Pairs (path, name), name is added to the label of TimeSeries 
+            having the element, ex: ("outBiddingZone_Domain.mRID", 
+            "consumption") for the consumption of generation units.
+
+    Returns a dict of label to a tuple (epochs, values) like parse_arrays.
+    '''
+
+    parts = {}
+    for timeseries, namespace, period in _iter_periods(source, value_tag):
+        label = _series_label(timeseries, namespace, series, markers)
+        parts.setdefault(label, []).append(_expand_period(*period))
+    return {label: (np.concatenate([epochs for epochs, _ in arrays]),
+                    np.concatenate([values for _, values in arrays]))
+            for label, arrays in parts.items()}
@@ -0,0 +1,363 @@
+'''Rendering of the figures of DayAheadPrices.
+
+Figures are built from the dataframe of get_historydata and either shown or
+written to a path, the format follows the extension, ex: ".png" or ".svg".
+Histogram bins and KDE are computed once per zone and shared between the
+overview and the zone subplot. The KDE is binned and convolved with FFT on a
+grid, see binned_kde. Line plots draw series decimated to the minimum and
+maximum of every bucket of hours, see decimate, and Scatter plots one point
+of every occupied pixel, see thin.
+
+scipy is only imported by render_analytics, through entsoeanalytics.
+
+For batch reports render_jobs renders many figures headless (Agg backend)
+in a process pool and prints the time spent on every figure.
+'''
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+
+TABLEAUCOLORS = ['#2ca02c', '#1f77b4', '#ff7f0e', '#aec7e8', '#ffbb78',
+                 '#ff9896', '#c5b0d5', '#98df8a', '#9467bd', '#e377c2',
+                 '#bcbd22', '#9edae5', '#f7b6d2', '#17becf']
+PLOTTYPES = ("Line", "Scatter", "Histogram", "Analytics")
+
+
+def distribution(prices, points=500):
+    '''Returns the histogram with Freedman–Diaconis bins and the KDE of an
+    array of prices as a dict with edges, density, kde_xs and pdf. The KDE
+    covers the range of the prices with the default 5 % axis margins.
+    '''
+
+    prices = np.asarray(prices, dtype=np.float64)
+    prices = prices[~np.isnan(prices)]
+    percentile_25, percentile_75 = np.percentile(prices, [25, 75])
+    low, high = prices.min(), prices.max()
+    bin_width = 2 * (percentile_75-percentile_25) * prices.size ** (-1/3)
+    bins = max(round((high - low)/bin_width), 1) if bin_width > 0 else 10
+    density, edges = np.histogram(prices, bins=bins, density=True)
+    margin = 0.05 * (high - low)
+    kde_xs = np.linspace(low - margin, high + margin, points)
+    pdf = binned_kde(prices, kde_xs)
+    return {"edges": edges, "density": density, "kde_xs": kde_xs, "pdf": pdf}
+
+
+def binned_kde(values, xs, bins=None):
+    '''Returns the Gaussian KDE of the values at xs with the bandwidth of
+    scipy.stats.gaussian_kde (Scott's rule). The values are linearly binned
+    on a regular grid, convolved with the kernel by FFT and interpolated at
+    xs, O(n + bins log bins) instead of O(n * len(xs)).
+
+    Parameters:
+        values: 'array' without NaN.
+        xs: 'array'
+        bins: 'int', optional | Default: about 8 grid points per bandwidth,
+            between 1024 and 2**20.
+    '''
+
+    values = np.asarray(values, dtype=np.float64)
+    xs = np.asarray(xs, dtype=np.float64)
+    bandwidth = values.std(ddof=1) * values.size ** (-1/5)
+    if not bandwidth > 0:
+        import scipy.stats as st
+
+        return st.gaussian_kde(values)(xs)
+    low = min(values.min(), xs.min()) - 4 * bandwidth
+    high = max(values.max(), xs.max()) + 4 * bandwidth
+    if bins is None:
+        bins = int(np.clip(8 * (high - low) / bandwidth, 1024, 2 ** 20))
+    delta = (high - low) / (bins - 1)
+    #Linear binning, every value is split between its two grid points.
+    position = (values - low) / delta
+    lower = np.minimum(np.floor(position).astype(np.int64), bins - 2)
+    weight = position - lower
+    grid = (np.bincount(lower, 1 - weight, minlength=bins)
+            + np.bincount(lower + 1, weight, minlength=bins))
+    reach = min(bins - 1, int(np.ceil(4 * bandwidth / delta)))
+    offsets = np.arange(-reach, reach + 1) * delta
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    size = bins + kernel.size - 1
+    density = np.fft.irfft(np.fft.rfft(grid, size) * np.fft.rfft(kernel, size),
+                           size)[reach:reach + bins]
+    density /= values.size * bandwidth * np.sqrt(2 * np.pi)
+    return np.interp(xs, low + np.arange(bins) * delta, np.clip(density, 0, None))
+
+
+def decimate(values, buckets=1500):
+    '''Returns the sorted positions of the values to draw: the first, the
+    last and the minimum and maximum of each of about buckets equal runs,
+    so peaks survive and the curve is unchanged at figure resolution when
+    buckets is the width of the figure in pixels. A
+    bucket of only NaN keeps one NaN to break the line. Series shorter than
+    twice the buckets are kept whole.
+    '''
+
+    values = np.asarray(values, dtype=np.float64)
+    size = values.size
+    if size <= 2 * buckets + 2:
+        return np.arange(size)
+    width = -(-size // buckets)
+    rows = np.full(width * -(-size // width), np.nan)
+    rows[:size] = values
+    rows = rows.reshape(-1, width)
+    missing = np.isnan(rows)
+    offsets = np.arange(rows.shape[0]) * width
+    low = np.where(missing, np.inf, rows).argmin(axis=1) + offsets
+    high = np.where(missing, -np.inf, rows).argmax(axis=1) + offsets
+    return np.unique(np.concatenate(([0, size - 1], low, high)))
+
+
+def thin(x, values, width=1500, height=500):
+    '''Returns the sorted positions of the points to draw in a scatter:
+    the first point of every occupied cell of a width x height grid over
+    the range of x and values, so the point cloud is unchanged at figure
+    resolution when the grid is the axes in pixels. NaN are dropped.
+    '''
+
+    x = np.asarray(x, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(x) & ~np.isnan(values))
+    if valid.size <= width + height:
+        return valid
+    cells = []
+    for axis, bins in ((x[valid], width), (values[valid], height)):
+        low, high = axis.min(), axis.max()
+        scale = (bins - 1) / (high - low) if high > low else 0
+        cells.append(((axis - low) * scale).astype(np.int64))
+    _, first = np.unique(cells[0] * height + cells[1], return_index=True)
+    return valid[np.sort(first)]
+
+
+def finish(figure, path=None):
+    '''Shows the figure or, with a path, saves it and closes it.'''
+
+    figure.tight_layout()
+    if path is None:
+        plt.show()
+        return None
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    figure.savefig(path)
+    plt.close(figure)
+    return path
+
+
+def render_history(zonesdata, zones, plottype="Line", path=None):
+    '''Plots the prices of the zones from get_historydata, one overview
+    subplot with all zones and one subplot per zone.
+
+    Parameters:
+        zonesdata: 'DataFrame' from DayAheadPrices.get_historydata.
+        zones: 'list'
+        plottype: 'str', optional | Default: "Line" | Options: "Line",
+            "Scatter", "Histogram"
+        path: 'str', optional | Default: None, shows the figure.
+    '''
+
+    number_of_subplots = len(zones) + 1
+    figure = plt.figure(f"Prices for {str(zones)[1:-1]} energy zones",
+                        figsize = (10, 5), dpi = 150)
+
+    if plottype == "Histogram":
+        distributions = [distribution(zonesdata[f"{zon} Price"]) for zon in zones]
+        plt.subplot(number_of_subplots, 1, 1)
+        for rank,zon in enumerate(zones):
+            data = distributions[rank]
+            plt.stairs(data["density"], data["edges"], fill=True, 
+                    label=f"{zon}", alpha=0.3, color=TABLEAUCOLORS[-(rank+1)],
+                    lw=0)
+            plt.plot(data["kde_xs"], data["pdf"], label=f"{zon} PDF",
+                    linewidth=1, alpha=0.7, color=TABLEAUCOLORS[rank])
+        plt.yticks(fontsize=5)
+        plt.xticks(fontsize=5)
+        plt.ylabel('Probability', fontsize=7)
+        plt.legend(fontsize=7, frameon=False, ncol=(len(zones)*2))
+
+        for rank,zon in enumerate(zones):
+            data = distributions[rank]
+            plt.subplot(number_of_subplots, 1, (rank+2))
+            #One filled step artist with white bin separators instead of a
+            #patch per bin.
+            plt.stairs(data["density"], data["edges"], fill=True, 
+                    label=f"{zon}", alpha=0.5, color=TABLEAUCOLORS[-(rank+1)],
+                    lw=0)
+            plt.vlines(data["edges"][1:-1], 0, np.maximum(data["density"][:-1],
+                    data["density"][1:]), colors='White', lw=0.2)
+            plt.plot(data["kde_xs"], data["pdf"], label=f"{zon} PDF",
+                    linewidth=1, alpha=1, color=TABLEAUCOLORS[rank])
+            plt.xlim(data["kde_xs"][0], data["kde_xs"][-1])
+            plt.legend(fontsize=7, frameon=False, ncol=2)
+            plt.yticks(fontsize=5)
+            plt.xticks(fontsize=5)
+            plt.ylabel('Probability', fontsize=7)
+        plt.xlabel('Price', fontsize=7)
+
+    else:
+        #Rows are drawn by position with DateHour labels on the ticks, as
+        #the categorical axis of the labels did, decimated per zone.
+        divider_of_xaxis = round(len(zonesdata.index)
+                            / 11 if len(zonesdata.index) > 11 else 5)
+        positions = np.arange(len(zonesdata.index))
+        labels = zonesdata.iloc[:,0].to_numpy()
+        pixels = int(figure.get_figwidth() * figure.dpi)
+        height = int(figure.get_figheight() * figure.dpi / number_of_subplots)
+        series = []
+        for zon in zones:
+            price = zonesdata[f"{zon} Price"].to_numpy(dtype=np.float64)
+            #Lines keep the extremes of every pixel column, scatters one
+            #point of every occupied pixel.
+            keep = (decimate(price, pixels) if plottype == "Line" else
+                    thin(positions, price, pixels, height))
+            series.append((positions[keep], price[keep]))
+        for subplot in range(number_of_subplots):
+            plt.subplot(number_of_subplots, 1, subplot+1)
+            #The overview subplot has all zones, the others one zone each.
+            ranks = range(len(zones)) if subplot == 0 else [subplot-1]
+            for rank in ranks:
+                zon = zones[rank]
+                x, price = series[rank]
+                if plottype == "Line":
+                    plt.plot(x, price, linewidth=0.7, label=f"{zon}",
+                            alpha=0.8 if subplot == 0 else 1,
+                            color=TABLEAUCOLORS[rank])
+                elif plottype == "Scatter":
+                    plt.scatter(x, price, label=f"{zon}", 
+                                alpha=0.6 if subplot == 0 else 0.8,
+                                c=TABLEAUCOLORS[rank], edgecolors='Black',
+                                linewidth=0.1, s=10)
+            plt.yticks(fontsize=5)
+            plt.xticks(positions[::divider_of_xaxis], 
+                       labels[::divider_of_xaxis], fontsize=5)
+            plt.ylabel('Price [EUR/MWh]',fontsize=7)
+            plt.xlim(0, max(len(positions)-1, 1))
+            plt.legend(fontsize=7, frameon=False,
+                       ncol=len(zones) if subplot == 0 else 1)
+        plt.xlabel('YearMonth', fontsize=7)
+    return finish(figure, path)
+
+
+def render_analytics(zonesdata, zones, path=None, alpha=0.05):
+    '''Plots the prices of every zone from get_historydata with linear
+    regression, confidence and prediction interval, see entsoeanalytics.
+
+    Parameters:
+        zonesdata: 'DataFrame' from DayAheadPrices.get_historydata.
+        zones: 'list'
+        path: 'str', optional | Default: None, shows the figure.
+        alpha: 'float', optional | Default: 0.05
+    '''
+
+    import entsoeanalytics
+
+    fits = entsoeanalytics.regression_frame(zonesdata, zones, alpha)
+    time = zonesdata['TimeStamp'].to_numpy()
+    divider_of_xaxis = round(len(zonesdata.index)
+                        / 11 if len(zonesdata.index) > 11 else 5)
+    ticks = time[::divider_of_xaxis]
+    ticklabels = entsoeanalytics.julian_to_month(ticks)
+
+    figure = plt.figure(f"Analysis for energy zones: {str(zones)[1:-1]}",
+                        figsize=(10, 5), dpi=150)
+    for rank,zon in enumerate(zones):
+        fit = fits.loc[[zon]]
+        slope, intercept = fit["slope"].iloc[0], fit["intercept"].iloc[0]
+        plt.subplot(len(zones), 1, rank+1)
+        price = zonesdata[f"{zon} Price"].to_numpy(dtype=np.float64)
+        keep = thin(time, price, int(figure.get_figwidth() * figure.dpi),
+                    int(figure.get_figheight() * figure.dpi / len(zones)))
+        plt.scatter(time[keep], price[keep], c=TABLEAUCOLORS[rank],
+                    marker='o', s = 3)
+        xlim = plt.xlim()
+        ylim = plt.ylim()
+        plt.plot(np.array(xlim), (intercept+slope*np.array(xlim)),
+                c=TABLEAUCOLORS[-1], linewidth=1,
+                label = f'Linear regression line: y={slope:.4f}x'\
+                    f' {"+" if intercept>0 else "-"}{abs(intercept):.2f}')
+        time_fitted = np.linspace(xlim[0], xlim[1], 100)
+        price_fitted, ci, pi = (band[0] for band in
+            entsoeanalytics.bands(fit, time_fitted, alpha))
+        plt.plot([],[],' ',
+            label=f'R²: {fit["r_square"].iloc[0]:.3f} | T-score: '\
+                f'{fit["t_score"].iloc[0]:.3f} | P-value:'\
+                f' {fit["p_value"].iloc[0]:.3f} | Alpha: {alpha}')
+        plt.fill_between(time_fitted, (price_fitted+ci), (price_fitted-ci),
+                        label = f'{100*(1-alpha):g} % Confidence Interval',
+                        facecolor='#b9cfe7', zorder=0)
+        plt.plot(time_fitted, (price_fitted-pi), '--', color='0.5',
+            label=f'{100*(1-alpha):g} % Prediction Limits')
+        plt.plot(time_fitted, (price_fitted+pi), '--', color='0.5')
+        plt.xticks(ticks, ticklabels, fontsize = 5)
+        plt.yticks(fontsize=5)
+        plt.xlim(xlim)
+        plt.ylim(0, ylim[1])
+        plt.title(f"{zon}", fontsize=10, loc='left')
+        plt.ylabel('Price [EUR/MWh]', fontsize=7)
+        plt.legend(loc=(0.2,1.01), ncol=2, fontsize=4, frameon=False)
+    plt.xlabel('YearMonth', fontsize=7)
+    return finish(figure, path)
+
+
+def job_path(job, directory, extension=".png"):
+    '''Returns the path of the figure of a DayAheadPrices job, ex:
+    "{directory}/SE_1-FI_20200101_20201231_Line.png".
+    '''
+
+    name = (f"{'-'.join(job.zones)}_{job.startdate}_{job.enddate}_"
+            f"{job.plottype}{extension}")
+    return os.path.join(directory, name)
+
+
+def _headless():
+    matplotlib.use("Agg", force=True)
+
+
+def _render(plottype, zonesdata, zones, path):
+    '''Renders one figure in a worker, returns the path and the seconds.'''
+
+    start = time.perf_counter()
+    if plottype == "Analytics":
+        render_analytics(zonesdata, zones, path)
+    else:
+        render_history(zonesdata, zones, plottype, path)
+    return path, time.perf_counter() - start
+
+
+def render_jobs(jobs, directory, extension=".png", processes=None):
+    '''Renders the figure of every DayAheadPrices job to a file in the
+    directory with a process pool of headless workers. The plottype of a job
+    chooses the figure, "Analytics" renders the linear regression.
+
+    Data is read in this process, one job at a time, so only the rendering
+    runs in parallel and the database has one writer.
+
+    Parameters:
+        jobs: 'list' of DayAheadPrices.
+        directory: 'str'
+        extension: 'str', optional | Default: ".png" | Options: ".png", ".svg"...
+        processes: 'int', optional | Default: number of CPUs.
+
+    Returns the list of paths written.
+    '''
+
+    paths = []
+    total = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_headless) as pool:
+        futures = []
+        for job in jobs:
+            if job.plottype not in PLOTTYPES:
+                print(f"Plottype {job.plottype} is not a valid plottype!")
+                continue
+            path = job_path(job, directory, extension)
+            futures.append(pool.submit(_render, job.plottype,
+                job.get_historydata(), job.zones, path))
+        for future in futures:
+            path, seconds = future.result()
+            print(f"Rendered {path} in {seconds:.2f} s")
+            paths.append(path)
+    print(f"Rendered {len(paths)} figures in {time.perf_counter() - total:.2f} s")
+    return paths
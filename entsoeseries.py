@@ -0,0 +1,407 @@
+'''Ingestion of other ENTSO-E datasets than day-ahead prices.
+
+Every dataset is declared as a DocumentType with its query parameters, the
+rules splitting its TimeSeries into series and the table it is stored in:
+
+    load        A65  actual total load of a bidding zone
+    generation  A75  actual generation per production type (psrType)
+    flows       A11  physical flows from a zone to a neighbouring zone
+
+All of them are fetched concurrently by entsoefetch.Fetcher, parsed by the
+streaming entsoeparser.parse_series and written in bulk by SeriesStore, one
+long table and coverage table per dataset next to the prices:
+
+    {table}         (zone_id INTEGER, series TEXT, epoch INTEGER, value REAL,
+                     PRIMARY KEY (zone_id, series, epoch)) WITHOUT ROWID
+    {table}Coverage (zone_id INTEGER, counterpart TEXT, start INTEGER,
+                     end INTEGER, PRIMARY KEY (zone_id, counterpart, start))
+                     WITHOUT ROWID
+
+Series are "" for load, the psrType for generation, ex: "B16" (solar, see
+PSR_TYPES) or "B10 consumption" for pumping, and the counterpart zone for
+flows. Values are in MW. The loop running the fetch jobs, ingest, is shared
+with DayAheadPrices.load_db.
+
+Example:
+    from entsoeseries import get_series
+    get_series("generation", ["SE_3"], startdate="20230101", enddate="20230201")
+    get_series("flows", ["SE_1"], counterparts=["FI", "SE_2"])
+'''
+
+import time
+from dataclasses import dataclass
+from datetime import date
+from datetime import datetime as dt
+import numpy as np
+import pandas as pd
+import entsoefetch
+import entsoemetrics
+import entsoeparser
+import entsoestore
+import entsoetime
+
+#Production types of psrType in generation.
+PSR_TYPES = {"B01": "Biomass", "B02": "Fossil Brown coal/Lignite",
+             "B03": "Fossil Coal-derived gas", "B04": "Fossil Gas",
+             "B05": "Fossil Hard coal", "B06": "Fossil Oil",
+             "B07": "Fossil Oil shale", "B08": "Fossil Peat",
+             "B09": "Geothermal", "B10": "Hydro Pumped Storage",
+             "B11": "Hydro Run-of-river and poundage",
+             "B12": "Hydro Water Reservoir", "B13": "Marine",
+             "B14": "Nuclear", "B15": "Other renewable", "B16": "Solar",
+             "B17": "Waste", "B18": "Wind Offshore", "B19": "Wind Onshore",
+             "B20": "Other", "B25": "Energy storage"}
+
+
+@dataclass(frozen=True)
+class DocumentType:
+    '''Declaration of a dataset of the API.
+
+    Attributes:
+        name: 'str'
+            Name used in DOCUMENT_TYPES and on the command line.
+        doc_type: 'str'
+            documentType of the requests, ex: "A65".
+        table: 'str'
+            Table of the values, coverage is kept in "{table}Coverage".
+        domain_params: 'tuple'
+            Query parameters set to the domain of the zone.
+        counterpart_params: 'tuple', optional
+            Query parameters set to the domain of the counterpart zone,
+            datasets with them are fetched per pair of zones.
+        process_type: 'str', optional
+            processType of the requests, ex: "A16" for realised.
+        value_tag: 'str', optional | Default: "quantity"
+        series, markers: 'tuple', optional
+            Labels of the TimeSeries, see entsoeparser.parse_series.
+    '''
+
+    name: str
+    doc_type: str
+    table: str
+    domain_params: tuple
+    counterpart_params: tuple = ()
+    process_type: str = None
+    value_tag: str = "quantity"
+    series: tuple = ()
+    markers: tuple = ()
+
+    @property
+    def pairs(self):
+        return bool(self.counterpart_params)
+
+    def parameters(self, domain, counterpart_domain=None):
+        '''Returns the query parameters of a request as a tuple of pairs.'''
+
+        params = [(name, domain) for name in self.domain_params]
+        params += [(name, counterpart_domain) for name in self.counterpart_params]
+        if self.process_type:
+            params.append(("processType", self.process_type))
+        return tuple(params)
+
+    def parse(self, content):
+        '''Returns the series of a response as parse_series does, or None if
+        the response is an acknowledgement without matching data.
+        '''
+
+        try:
+            series = entsoeparser.parse_series(content, self.value_tag,
+                                               self.series, self.markers)
+        except entsoeparser.NoMatchingDataError:
+            return None
+        return series or None
+
+
+LOAD = DocumentType("load", "A65", "Load", ("outBiddingZone_Domain",),
+                    process_type="A16")
+GENERATION = DocumentType("generation", "A75", "Generation", ("in_Domain",),
+                          process_type="A16", series=("MktPSRType/psrType",),
+                          markers=(("outBiddingZone_Domain.mRID", "consumption"),))
+FLOWS = DocumentType("flows", "A11", "Flows", ("out_Domain",),
+                     counterpart_params=("in_Domain",))
+DOCUMENT_TYPES = {doc.name: doc for doc in (LOAD, GENERATION, FLOWS)}
+
+
+class SeriesStore(entsoestore.PriceStore):
+    '''PriceStore with the tables of the document types, which are created
+    when a document type is first used.
+
+    Parameters:
+        path: 'str', optional | Default: "./Energyprices.db" or ENTSOE_DB
+    '''
+
+    def __init__(self, path=entsoestore.DB_PATH):
+        super().__init__(path)
+        self.tables = set()
+
+    def _create_tables(self, doc):
+        if doc.table in self.tables:
+            return
+        with self.conn:
+            self.conn.executescript(f'''
+                CREATE TABLE IF NOT EXISTS {doc.table}
+                (zone_id INTEGER NOT NULL, series TEXT NOT NULL,
+                 epoch INTEGER NOT NULL, value REAL,
+                 PRIMARY KEY (zone_id, series, epoch)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS {doc.table}Coverage
+                (zone_id INTEGER NOT NULL, counterpart TEXT NOT NULL,
+                 start INTEGER NOT NULL, end INTEGER NOT NULL,
+                 PRIMARY KEY (zone_id, counterpart, start)) WITHOUT ROWID;
+                ''')
+        self.tables.add(doc.table)
+
+    def write_series(self, doc, zone, series, covered_start, covered_end=0,
+                     counterpart=""):
+        '''Upserts the series of a response, a dict of label to (epochs,
+        values), in one transaction and records the range from covered_start
+        to the end of the last point, or covered_end if later, as covered
+        for the zone and counterpart. Returns the number of written rows.
+        '''
+
+        self._create_tables(doc)
+        zone_id = self.zone_id(zone, create=True)
+        rows = []
+        first = last = None
+        step = 3600
+        for label, (epochs, values) in series.items():
+            if not len(epochs):
+                continue
+            epochs = np.asarray(epochs, dtype=np.int64)
+            steps = np.diff(np.unique(epochs))
+            if steps.size:
+                step = min(step, int(steps.min()))
+            first = min(first, int(epochs.min())) if rows else int(epochs.min())
+            last = max(last, int(epochs.max())) if rows else int(epochs.max())
+            name = " ".join(filter(None, (counterpart, label)))
+            rows.extend(zip([zone_id] * len(epochs), [name] * len(epochs),
+                            epochs.tolist(),
+                            np.asarray(values, dtype=np.float64).tolist()))
+        if not rows:
+            return 0
+        with entsoemetrics.timer("write_seconds", zone=zone,
+                                 dataset=doc.name), self.conn:
+            self.conn.executemany(f'''
+                INSERT INTO {doc.table} (zone_id, series, epoch, value)
+                VALUES (?,?,?,?) ON CONFLICT(zone_id, series, epoch)
+                DO UPDATE SET value=excluded.value;
+                ''', rows)
+            entsoestore.merge_coverage(
+                self.conn, f"{doc.table}Coverage",
+                {"zone_id": zone_id, "counterpart": counterpart},
+                min(covered_start, first), max(covered_end, last + step))
+        entsoemetrics.count("write_rows_total", len(rows), zone=zone,
+                            dataset=doc.name)
+        return len(rows)
+
+    def record_series_coverage(self, doc, zone, start, end, counterpart=""):
+        '''Records [start, end) in epoch seconds as covered for the zone.'''
+
+        self._create_tables(doc)
+        zone_id = self.zone_id(zone, create=True)
+        with self.conn:
+            entsoestore.merge_coverage(
+                self.conn, f"{doc.table}Coverage",
+                {"zone_id": zone_id, "counterpart": counterpart}, start, end)
+
+    def missing_series(self, doc, zone, start, end, counterpart=""):
+        '''Returns the sub-intervals of [start, end) in epoch seconds that are
+        not covered for the zone and counterpart.
+        '''
+
+        self._create_tables(doc)
+        zone_id = self.zone_id(zone)
+        if zone_id is None:
+            return [(start, end)]
+        covered = self.conn.execute(f'''
+            SELECT start, end FROM {doc.table}Coverage
+            WHERE zone_id=? AND counterpart=? AND end>? AND start<?
+            ORDER BY start;
+            ''', (zone_id, counterpart, start, end)).fetchall()
+        return entsoestore.uncovered(covered, start, end)
+
+    def read_series(self, doc, zones, start, end):
+        '''Returns the series of the zones between start and end in epoch
+        seconds, both included, as a dataframe indexed by epoch with one
+        column per zone and series, named "{zone} {series}" or "{zone}" for
+        series "". Epochs missing in a series are NaN.
+        '''
+
+        self._create_tables(doc)
+        zone_ids = {self.zone_id(zone): zone for zone in zones}
+        zone_ids.pop(None, None)
+        if not zone_ids:
+            return pd.DataFrame(index=pd.Index([], name="epoch", dtype=np.int64))
+        placeholders = ",".join("?" * len(zone_ids))
+        long_format = pd.read_sql(f'''
+            SELECT zone_id, series, epoch, value FROM {doc.table}
+            WHERE zone_id IN ({placeholders}) AND epoch BETWEEN ? AND ?;
+            ''', self.conn, params=[*zone_ids, start, end])
+        long_format["column"] = [
+            f"{zone_ids[zone_id]} {series}".strip() for zone_id, series in
+            zip(long_format["zone_id"].tolist(), long_format["series"].tolist())]
+        wide_format = long_format.pivot(index="epoch", columns="column",
+                                        values="value")
+        wide_format.columns.name = None
+        return wide_format.sort_index(axis=0).sort_index(axis=1)
+
+
+def ingest(fetcher, jobs, parse, write, empty=None):
+    '''Runs the FetchJobs concurrently and writes their results from this
+    thread, the single writer to the database.
+
+    Parameters:
+        fetcher: 'entsoefetch.Fetcher'
+        jobs: 'list' of entsoefetch.FetchJob
+        parse: 'function'
+            Called with the content of a response in the worker threads,
+            returns a batch or None for responses without data.
+        write: 'function'
+            Called as write(job, batch, covered_end), returns the number of
+            written rows. covered_end is the epoch of the end of windows in
+            the past, which are complete, else 0.
+        empty: 'function', optional
+            Called with the jobs of windows in the past without data, which
+            won't get any, ex: to record them as covered.
+
+    Returns the number of written rows.
+    '''
+
+    started = time.perf_counter()
+    total_rows = 0
+    today = date.today()
+    for job, batch, error in fetcher.run(jobs, parse=parse):
+        label = f"{job.zone}>{job.counterpart}" if job.counterpart else job.zone
+        window = f"{job.start:%Y%m%d}-{job.end:%Y%m%d}"
+        if error is not None:
+            print(error)
+            print(f"Request for {label} {window} failed!")
+            continue
+        if batch is None:
+            print(f"No data found for {label} {window}, choose another zone!")
+            if job.end < today and empty is not None:
+                empty(job)
+            continue
+        write_started = time.perf_counter()
+        complete = entsoetime.day_epoch(job.end) if job.end < today else 0
+        rows = write(job, batch, complete)
+        elapsed = time.perf_counter() - write_started
+        total_rows += rows
+        print(f"{label} fetched and loaded {rows} rows for {job.start}"\
+                f" - {job.end} in to sql tables!"\
+                f" ({rows / max(elapsed, 1e-9):.0f} rows/s)")
+    if jobs:
+        elapsed = time.perf_counter() - started
+        entsoemetrics.gauge("load_rows_per_second",
+                            total_rows / max(elapsed, 1e-9))
+        print(f"Loaded {total_rows} rows from {len(jobs)} requests in "\
+                f"{elapsed:.1f} s ({total_rows / max(elapsed, 1e-9):.0f} rows/s)")
+    return total_rows
+
+
+def _pairs(doc, zones, counterparts):
+    '''Returns the (zone, counterpart) pairs of a request.'''
+
+    if not doc.pairs:
+        return [(zone, "") for zone in zones]
+    return [(zone, counterpart) for zone in zones
+            for counterpart in counterparts or () if counterpart != zone]
+
+
+def load_series(name, zones, startdate="20200101", enddate=None,
+                counterparts=None, fetcher=None, database=entsoestore.DB_PATH):
+    '''Fetches the windows of the dataset name for the zones, and pairs with
+    the counterparts for flows, that are not yet covered in the database.
+
+    Parameters:
+        name: 'str' | Options: "load", "generation", "flows"
+        zones: 'list'
+        startdate: 'str', optional | Default: "20200101"
+        enddate: 'str', optional | Default: Today's date.
+        counterparts: 'list', optional
+            Zones the flows go to, needed for "flows".
+        fetcher: 'entsoefetch.Fetcher', optional | Default: 8 jobs with
+            the token of entsoefetch.api_token, nothing is fetched without.
+        database: 'str', optional | Default: "./Energyprices.db"
+
+    Returns the number of written rows.
+    '''
+
+    doc = DOCUMENT_TYPES[name]
+    start_day = dt.strptime(startdate, '%Y%m%d').date()
+    end_day = (dt.strptime(enddate, '%Y%m%d').date() if enddate
+               else date.today())
+    if doc.pairs and not counterparts:
+        print(f"{name} is fetched per pair of zones, give the counterparts!")
+        return 0
+    store = SeriesStore(database)
+    jobs = []
+    for zone, counterpart in _pairs(doc, zones, counterparts):
+        domain = store.domain(zone)
+        counterpart_domain = store.domain(counterpart) if counterpart else None
+        if domain is None or (counterpart and counterpart_domain is None):
+            print(f"{zone if domain is None else counterpart} is not a valid"\
+                    " shortcode!")
+            continue
+        for lower, upper in store.missing_series(
+                doc, zone, entsoetime.day_epoch(start_day), 
+                entsoetime.day_epoch(end_day), counterpart):
+            lower_day = entsoetime.epoch_day(lower)
+            upper_day = entsoetime.epoch_day(upper, ceil=True)
+            for lower_limit, upper_limit in entsoefetch.split_windows(
+                    lower_day, upper_day):
+                jobs.append(entsoefetch.FetchJob(
+                    zone, domain, lower_limit, upper_limit, doc.doc_type,
+                    doc.parameters(domain, counterpart_domain), counterpart))
+    if not jobs:
+        store.close()
+        return 0
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = entsoefetch.default_fetcher()
+        if fetcher is None:
+            store.close()
+            return 0
+
+    def write(job, series, covered_end):
+        entsoemetrics.count("parse_points_total", 
+                            sum(len(epochs) for epochs, _ in series.values()),
+                            zone=job.zone, dataset=name)
+        return store.write_series(doc, job.zone, series, 
+                                  entsoetime.day_epoch(job.start), covered_end, 
+                                  job.counterpart)
+
+    def empty(job):
+        store.record_series_coverage(doc, job.zone, 
+                                     entsoetime.day_epoch(job.start),
+                                     entsoetime.day_epoch(job.end), job.counterpart)
+
+    try:
+        return ingest(fetcher, jobs, doc.parse, write, empty)
+    finally:
+        store.close()
+        if own_fetcher:
+            fetcher.close()
+
+
+def get_series(name, zones, startdate="20200101", enddate=None,
+               counterparts=None, fetcher=None, database=entsoestore.DB_PATH):
+    '''Returns the dataset name for the zones between startdate and enddate,
+    fetching the windows not yet in the database first, as a dataframe with
+    the column DateHour (UTC) and one column per zone and series, see
+    SeriesStore.read_series. For the parameters see load_series.
+    '''
+
+    load_series(name, zones, startdate, enddate, counterparts, fetcher,
+                database)
+    doc = DOCUMENT_TYPES[name]
+    start = entsoetime.day_epoch(dt.strptime(startdate, '%Y%m%d'))
+    end = entsoetime.day_epoch(dt.strptime(enddate, '%Y%m%d') if enddate 
+                               else date.today())
+    with SeriesStore(database) as store:
+        series = store.read_series(doc, zones, start, end - 1)
+    if doc.pairs and counterparts:
+        series = series[[column for column in series.columns
+                         if column.split(" ")[-1] in counterparts]]
+    times = pd.to_datetime(series.index.to_numpy(dtype=np.int64), unit='s')
+    series.insert(0, "DateHour", times.strftime('%Y-%m-%d %H:%M'))
+    return series
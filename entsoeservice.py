@@ -0,0 +1,417 @@
+'''Long-running service that keeps the day-ahead prices of the zones up to
+date and serves the recent prices from memory over HTTP.
+
+    python -m entsoecli serve --zones SE_1 SE_3 FI --port 8080
+
+Day-ahead prices of the next delivery day are published once a day around
+13:00 CET. The service polls the API from PUBLICATION (Brussels time) every
+RETRY until every zone has the delivery day, or DEADLINE passed, and then
+sleeps until the next publication, so only the new delivery day is
+fetched. At start the last days of the window are synced once.
+
+The prices of the last WINDOW_DAYS days of every zone are kept in memory as
+NumPy arrays and reloaded for the zones with a new ingest version after
+every poll. Requests within the window are answered from memory, others
+from the database. JSON endpoints, every date as "%Y%m%d":
+
+    GET /health                 status, delivery day, last and next poll
+    GET /zones                  timezone, first and last epoch and rows
+    GET /prices?zones=SE_1,FI&start=20240101&end=20240201&resolution=day
+                                epochs, local time labels and prices per
+                                zone, resolution as in entsoeaggregate with
+                                the mean of every bucket, labelled as
+                                YearMonthDay for days and weeks and as
+                                YearMonth for months and years
+    GET /latest?zones=SE_1,FI   prices of the last delivery day per zone
+
+The event loop only parses requests and slices arrays, fetching, writing
+and reading the database run in worker threads with their own connections.
+'''
+
+import asyncio
+import json
+import signal
+import time
+import urllib.parse
+from datetime import datetime as dt
+from datetime import time as tm
+from datetime import timedelta as td
+from zoneinfo import ZoneInfo
+import numpy as np
+import pandas as pd
+import entsoeaggregate
+import entsoemetrics
+import entsoestore
+import entsoetime
+
+MARKET_TIMEZONE = ZoneInfo("Europe/Brussels")
+PUBLICATION = tm(12, 45)
+DEADLINE = tm(18, 0)
+RETRY = td(minutes=5)
+WINDOW_DAYS = 90
+HOST = "127.0.0.1"
+PORT = 8080
+#Index in entsoetime.calendar_labels of the labels of local buckets, 
+#YearMonth for months and years, else YearMonthDay.
+LABELS = {"month": 1, "year": 1}
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+def delivery_day(now):
+    '''Returns the date of the next delivery day at the aware datetime now.'''
+
+    return now.astimezone(MARKET_TIMEZONE).date() + td(days=1)
+
+
+def next_poll(now, complete):
+    '''Returns the aware datetime of the poll after now: the publication of
+    today, a retry while the delivery day is not complete for every zone
+    and the deadline is ahead, else the publication of tomorrow.
+    '''
+
+    now = now.astimezone(MARKET_TIMEZONE)
+    today = now.date()
+    publication = dt.combine(today, PUBLICATION, tzinfo=MARKET_TIMEZONE)
+    if now < publication:
+        return publication
+    if not complete and now < dt.combine(today, DEADLINE, tzinfo=MARKET_TIMEZONE):
+        return now + RETRY
+    return dt.combine(today + td(days=1), PUBLICATION, tzinfo=MARKET_TIMEZONE)
+
+
+def day_bounds(zone, day):
+    '''Returns [start, end) in UTC epoch seconds of the local market day of
+    the zone at the date.
+    '''
+
+    local = entsoetime.day_epoch(day)
+    start, end = entsoetime.utc_epochs([local, local + 86400],
+                                       entsoetime.zone_timezone(zone)).tolist()
+    return start, end
+
+
+class HotWindow:
+    '''Prices of the last days of every zone in memory.
+
+    Attributes:
+        days: 'int' length of the window.
+        state: 'tuple' (start, end, arrays), [start, end) in epoch seconds
+            and arrays a dict of zone to (epochs, prices), replaced as a
+            whole on refresh so readers never see a partial update.
+    '''
+
+    def __init__(self, days=WINDOW_DAYS):
+        self.days = days
+        self.state = (0, 0, {})
+        self.versions = {}
+
+    def refresh(self, store, zones, end):
+        '''Moves the window to end and reads the prices of the zones whose
+        ingest version changed since the last refresh. Returns the number
+        of zones read from the store.
+        '''
+
+        start = end - (self.days + 1) * 86400
+        versions = dict(zip(zones, store.zone_versions(zones)))
+        _, _, current = self.state
+        arrays = {}
+        reloaded = 0
+        for zone in zones:
+            if zone in current and versions[zone] == self.versions.get(zone):
+                epochs, prices = current[zone]
+                lower = np.searchsorted(epochs, start)
+                arrays[zone] = (epochs[lower:], prices[lower:])
+                continue
+            frame = store.read_prices([zone], start, end - 1)
+            arrays[zone] = (frame.index.to_numpy(dtype=np.int64),
+                            frame[zone].to_numpy(dtype=np.float64))
+            reloaded += 1
+        self.state = (start, end, arrays)
+        self.versions = versions
+        entsoemetrics.gauge("service_window_rows",
+                            sum(len(epochs) for epochs, _ in arrays.values()))
+        return reloaded
+
+    def read_prices(self, zones, start, end):
+        '''Returns the prices of the zones for [start, end) like
+        PriceStore.read_prices, or None if the window does not hold them.
+        '''
+
+        window_start, window_end, arrays = self.state
+        if start < window_start or end > window_end or any(
+                zone not in arrays for zone in zones):
+            return None
+        slices = []
+        common = None
+        for zone in zones:
+            epochs, prices = arrays[zone]
+            lower, upper = np.searchsorted(epochs, [start, end])
+            slices.append((epochs[lower:upper], prices[lower:upper]))
+            common = (epochs[lower:upper] if common is None else
+                      np.intersect1d(common, epochs[lower:upper], assume_unique=True))
+        matrix = np.column_stack([prices[np.searchsorted(epochs, common)]
+                                  for epochs, prices in slices])
+        return pd.DataFrame(matrix, index=pd.Index(common, name="epoch"),
+                            columns=list(zones))
+
+
+class Service:
+    '''Polls the API for the new delivery day and serves the prices.
+
+    Parameters:
+        zones: 'list' of shortcodes.
+        database: 'str', optional | Default: "./Energyprices.db" or ENTSOE_DB
+        fetcher: 'entsoefetch.Fetcher' used for every poll.
+        days: 'int', optional | Default: WINDOW_DAYS
+            Days of prices kept in memory.
+        host: 'str', optional | Default: "127.0.0.1"
+        port: 'int', optional | Default: 8080
+    '''
+
+    def __init__(self, zones, database=entsoestore.DB_PATH, fetcher=None,
+                 days=WINDOW_DAYS, host=HOST, port=PORT):
+        self.zones = list(zones)
+        self.database = database
+        self.fetcher = fetcher
+        self.window = HotWindow(days)
+        self.host = host
+        self.port = port
+        self.delivery_day = None
+        self.complete = False
+        self.last_poll = None
+        self.next_poll = None
+        self.stopped = None
+        self.routes = {"/health": self.health, "/zones": self.zone_info,
+                       "/prices": self.prices, "/latest": self.latest}
+
+    def now(self):
+        return dt.now(MARKET_TIMEZONE)
+
+    async def run(self):
+        '''Serves until SIGINT or SIGTERM, polling on the publication
+        schedule.
+        '''
+
+        self.stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self.stopped.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        print(f"Serving {len(self.zones)} zones on http://{self.host}:{self.port}")
+        async with server:
+            await asyncio.to_thread(self._sync)
+            while not self.stopped.is_set():
+                now = self.now()
+                complete = self.complete and self.delivery_day == delivery_day(now)
+                self.next_poll = next_poll(now, complete)
+                try:
+                    await asyncio.wait_for(self.stopped.wait(),
+                        (self.next_poll - now).total_seconds())
+                except asyncio.TimeoutError:
+                    await asyncio.to_thread(self._poll)
+        print("Service stopped!")
+
+    def stop(self):
+        if self.stopped is not None:
+            self.stopped.set()
+
+    def _sync(self):
+        '''Fetches the missing prices of the window up to the delivery day.'''
+
+        from entsoedata import DayAheadPrices
+
+        day = delivery_day(self.now())
+        start = day - td(days=self.window.days)
+        try:
+            DayAheadPrices(self.zones, startdate=f"{start:%Y%m%d}",
+                           enddate=f"{day + td(days=1):%Y%m%d}",
+                           database=self.database
+                           ).check_status_of_zones(self.fetcher)
+        except Exception as exc:
+            print(exc)
+            print("Syncing the window failed!")
+        self._refresh(day)
+
+    def _poll(self):
+        '''Fetches the delivery day of the zones without it.'''
+
+        from entsoedata import DayAheadPrices
+
+        day = delivery_day(self.now())
+        incomplete = self._incomplete(day)
+        if incomplete:
+            #UTC dates covering the local market day of every zone.
+            intervals = {}
+            for zone in incomplete:
+                start, end = day_bounds(zone, day)
+                intervals[zone] = [(entsoetime.epoch_day(start),
+                                   entsoetime.epoch_day(end, ceil=True))]
+            lower = min(interval[0][0] for interval in intervals.values())
+            upper = max(interval[0][1] for interval in intervals.values())
+            try:
+                DayAheadPrices(incomplete, startdate=f"{lower:%Y%m%d}",
+                               enddate=f"{upper:%Y%m%d}", database=self.database
+                               ).load_db(zones=incomplete, fetcher=self.fetcher,
+                                         intervals=intervals)
+            except Exception as exc:
+                print(exc)
+                print(f"Polling the delivery day {day} failed!")
+        self._refresh(day)
+        self.last_poll = self.now()
+        entsoemetrics.count("service_polls_total")
+
+    def _incomplete(self, day):
+        with entsoestore.PriceStore(self.database) as store:
+            return [zone for zone in self.zones
+                    if store.missing_intervals(zone, *day_bounds(zone, day))]
+
+    def _refresh(self, day):
+        '''Sets the state of the delivery day and moves the window to it.'''
+
+        incomplete = self._incomplete(day)
+        with entsoestore.PriceStore(self.database) as store:
+            reloaded = self.window.refresh(store, self.zones, max(
+                day_bounds(zone, day)[1] for zone in self.zones))
+        self.delivery_day = day
+        self.complete = not incomplete
+        print(f"Delivery day {day} complete for "
+              f"{len(self.zones) - len(incomplete)} of {len(self.zones)} zones,"
+              f" reloaded {reloaded} zones in memory")
+
+    async def _handle(self, reader, writer):
+        '''Answers one HTTP/1.1 request and closes the connection.'''
+
+        started = time.perf_counter()
+        path = ""
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+            method, target, _ = (request.split(b"\r\n", 1)[0]
+                                 .decode("latin-1").split(" ", 2))
+            url = urllib.parse.urlsplit(target)
+            path = url.path
+            query = dict(urllib.parse.parse_qsl(url.query))
+            if method != "GET":
+                status, body = 405, {"error": f"{method} is not supported!"}
+            elif path not in self.routes:
+                status, body = 404, {"error": f"{path} is not found!"}
+            else:
+                status, body = 200, await self.routes[path](query)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+        except (KeyError, ValueError) as exc:
+            status, body = 400, {"error": str(exc)}
+        except Exception as exc:
+            print(exc)
+            print(f"Request for {path} failed!")
+            status, body = 500, {"error": str(exc)}
+        payload = json.dumps(body).encode()
+        writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + payload)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+        entsoemetrics.count("service_requests_total", path=path, status=status)
+        entsoemetrics.observe("service_request_seconds",
+                              time.perf_counter() - started, path=path)
+
+    def _zones(self, query):
+        zones = [zone for zone in query.get("zones", "").split(",") if zone]
+        unknown = set(zones) - set(self.zones)
+        if unknown:
+            raise ValueError(f"Zones {sorted(unknown)} are not served!")
+        return zones or self.zones
+
+    async def health(self, query):
+        start, end, arrays = self.window.state
+        return {"status": "ok", "zones": len(self.zones),
+                "delivery_day": f"{self.delivery_day:%Y%m%d}"
+                                if self.delivery_day else None,
+                "complete": self.complete,
+                "last_poll": self.last_poll.isoformat() if self.last_poll else None,
+                "next_poll": self.next_poll.isoformat() if self.next_poll else None,
+                "window": {"start": start, "end": end,
+                           "rows": sum(len(epochs) for epochs, _ in arrays.values())}}
+
+    async def zone_info(self, query):
+        _, _, arrays = self.window.state
+        return {zone: {"timezone": entsoetime.zone_timezone(zone),
+                       "first": int(epochs[0]) if len(epochs) else None,
+                       "last": int(epochs[-1]) if len(epochs) else None,
+                       "rows": len(epochs)}
+                for zone, (epochs, _) in arrays.items()}
+
+    async def prices(self, query):
+        zones = self._zones(query)
+        resolution = query.get("resolution", "hour")
+        local = resolution != "hour" and entsoeaggregate.is_local(resolution)
+        timezone = entsoetime.zone_timezone(zones[0])
+        start, end, _ = self.window.state
+        #Local midnights of the dates in the timezone of the first zone.
+        if "start" in query:
+            start = _midnight(query["start"], timezone)
+        if "end" in query:
+            end = _midnight(query["end"], timezone)
+        prices = self.window.read_prices(zones, start, end)
+        source = "memory"
+        if prices is None:
+            prices = await asyncio.to_thread(self._read_store, zones, start, end)
+            source = "store"
+        if resolution != "hour":
+            prices = entsoeaggregate.aggregate_prices(
+                prices, resolution, timezone=timezone if local else None
+                ).xs("mean", axis=1, level=1)
+        epochs = prices.index.to_numpy(dtype=np.int64)
+        labels = entsoetime.calendar_labels(
+            epochs if local else entsoetime.local_epochs(epochs, timezone)
+            )[LABELS.get(resolution, 2) if local else 0]
+        return {"source": source, "resolution": resolution,
+                "timezone": timezone, "epochs": epochs.tolist(),
+                "time": labels.tolist(),
+                "prices": {zone: _floats(prices[zone]) for zone in zones}}
+
+    def _read_store(self, zones, start, end):
+        with entsoestore.PriceStore(self.database) as store:
+            return store.read_prices(zones, start, end - 1)
+
+    async def latest(self, query):
+        zones = self._zones(query)
+        _, _, arrays = self.window.state
+        latest = {zone: None for zone in zones}
+        if self.delivery_day is None:
+            return latest
+        for zone in zones:
+            epochs, prices = arrays.get(zone, ((), ()))
+            #The delivery day or the day before while it is not published.
+            for day in (self.delivery_day, self.delivery_day - td(days=1)):
+                lower, upper = np.searchsorted(epochs, day_bounds(zone, day))
+                if upper > lower:
+                    latest[zone] = {"day": f"{day:%Y%m%d}",
+                                    "epochs": epochs[lower:upper].tolist(),
+                                    "prices": _floats(prices[lower:upper])}
+                    break
+        return latest
+
+
+def _midnight(text, timezone):
+    '''Returns the UTC epoch of the local midnight of a "%Y%m%d" date.'''
+
+    local = entsoetime.day_epoch(dt.strptime(text, '%Y%m%d'))
+    return int(entsoetime.utc_epochs([local], timezone)[0])
+
+
+def _floats(values):
+    '''Returns the values as a list for JSON with None for NaN.'''
+
+    values = np.asarray(values, dtype=np.float64)
+    return [None if value != value else value for value in values.tolist()]
@@ -0,0 +1,537 @@
+'''Storage engine for day-ahead prices.
+
+All zones share one long table keyed by (zone_id, epoch):
+
+    Zones    (zone_id INTEGER PRIMARY KEY, Shortcode TEXT UNIQUE)
+    Prices   (zone_id INTEGER, epoch INTEGER, price REAL,
+              PRIMARY KEY (zone_id, epoch)) WITHOUT ROWID
+    Coverage (zone_id INTEGER, start INTEGER, end INTEGER,
+              PRIMARY KEY (zone_id, start)) WITHOUT ROWID
+    DailyRollup, MonthlyRollup
+             (zone_id INTEGER, day/month INTEGER, count INTEGER, total REAL,
+              squares REAL, low REAL, high REAL) WITHOUT ROWID
+
+    Watermarks (zone_id INTEGER, year INTEGER, version INTEGER) WITHOUT ROWID
+
+The rollups hold count, sum, sum of squares, min and max of the prices per
+zone and local market day or month of the zone, keyed by the local epoch of
+its first second, see entsoetime. They are refreshed in the same transaction
+as every write, which also bumps the version of every UTC year it touched in
+Watermarks, so caches of the prices can tell when they are stale. Databases
+with rollups of UTC days, user_version 0, get them rebuilt when opened.
+
+Epochs are UTC seconds. As a WITHOUT ROWID table, Prices is stored as the
+B-tree of its primary key with price as payload, so the key is a covering
+index and a range scan of a zone is one index seek.
+
+Connections are pooled per thread and database, see connect, in WAL mode
+with synchronous=NORMAL, a larger page cache, memory-mapped reads and a busy
+timeout, so many readers and one writer work concurrently: readers never
+block the writer or each other and a second writer waits instead of failing
+with "database is locked". The default path is "./Energyprices.db" or the
+environment variable ENTSOE_DB.
+
+Databases from before, with one table "{zone}" (DateTime TEXT, Price INT)
+per zone, are migrated when opened or with:
+    python -m entsoestore ./Energyprices.db
+'''
+
+import os
+import re
+import sqlite3
+import sys
+import threading
+import numpy as np
+import pandas as pd
+import entsoemetrics
+import entsoetime
+
+DB_PATH = os.environ.get("ENTSOE_DB", "./Energyprices.db")
+#Seconds a connection waits for a lock held by another writer.
+BUSY_TIMEOUT = 30
+PRAGMAS = {"synchronous": "NORMAL",      #WAL is durable on checkpoint.
+           "cache_size": -64 * 1024,      #64 MiB page cache.
+           "mmap_size": 256 * 2 ** 20,    #Reads straight from the page cache.
+           "temp_store": "MEMORY"}
+#Seconds legacy hour-ending timestamps are moved back to the hour start.
+LEGACY_SHIFT = 3600
+#PRAGMA user_version of the schema, 1 since rollups are in local time.
+SCHEMA_VERSION = 1
+_local = threading.local()
+_CHUNK = re.compile(r'^(\d*)([DWMY])$')
+
+
+def connect(path=DB_PATH):
+    '''Returns the connection of this thread to the database, opened and
+    tuned with PRAGMAS on first use and reused afterwards. Connections are
+    not shared between threads and not reused after a fork.
+    '''
+
+    path = os.path.abspath(path)
+    connections = getattr(_local, "connections", None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    conn, inode = connections.get(path, (None, None))
+    if conn is not None and inode != _inode(path):
+        #The file was replaced or deleted since the connection was opened.
+        conn.close()
+        conn = None
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        conn.execute('''PRAGMA journal_mode=WAL;''')
+        for pragma, value in PRAGMAS.items():
+            conn.execute(f'''PRAGMA {pragma}={value};''')
+        connections[path] = (conn, _inode(path))
+    return conn
+
+
+def _inode(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+def close_connections():
+    '''Closes the pooled connections of this thread.'''
+
+    for conn, _ in getattr(_local, "connections", {}).values():
+        conn.close()
+    _local.connections = {}
+
+
+class PriceStore:
+    '''Owns the price database and its schema, with the pooled connection
+    of the thread from connect. Databases without the current schema are
+    migrated and completed when opened.
+
+    Parameters:
+        path: 'str', optional | Default: "./Energyprices.db" or ENTSOE_DB
+    '''
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.conn = connect(path)
+        if not self._has_schema():
+            if self.legacy_tables() or self._legacy_coverage():
+                self.migrate()
+            self._create_schema()
+
+    def close(self):
+        '''Releases the store, the connection stays open for reuse by the
+        thread, a transaction left open is rolled back.
+        '''
+
+        if self.conn.in_transaction:
+            self.conn.rollback()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _has_schema(self):
+        '''True if all tables of the current schema exist at the current
+        version, lookups in the cached schema instead of the migration checks.
+        '''
+
+        return (self.conn.execute('''PRAGMA user_version;''').fetchone()[0] 
+                >= SCHEMA_VERSION and self.conn.execute('''
+            SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name IN 
+            ('Zones', 'Prices', 'Coverage', 'DailyRollup', 'MonthlyRollup', 
+             'Watermarks');
+            ''').fetchone()[0] == 6)
+
+    def _create_schema(self):
+        rollups = self.conn.execute('''
+            SELECT COUNT(*) FROM sqlite_master 
+            WHERE name IN ('DailyRollup', 'MonthlyRollup');
+            ''').fetchone()[0]
+        with self.conn:
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS Zones
+                (zone_id INTEGER PRIMARY KEY, Shortcode TEXT UNIQUE NOT NULL);
+                CREATE TABLE IF NOT EXISTS Prices
+                (zone_id INTEGER NOT NULL, epoch INTEGER NOT NULL, price REAL,
+                 PRIMARY KEY (zone_id, epoch)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS Coverage
+                (zone_id INTEGER NOT NULL, start INTEGER NOT NULL,
+                 end INTEGER NOT NULL, PRIMARY KEY (zone_id, start)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS DailyRollup
+                (zone_id INTEGER NOT NULL, day INTEGER NOT NULL, count INTEGER,
+                 total REAL, squares REAL, low REAL, high REAL,
+                 PRIMARY KEY (zone_id, day)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS MonthlyRollup
+                (zone_id INTEGER NOT NULL, month INTEGER NOT NULL, count INTEGER,
+                 total REAL, squares REAL, low REAL, high REAL,
+                 PRIMARY KEY (zone_id, month)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS Watermarks
+                (zone_id INTEGER NOT NULL, year INTEGER NOT NULL, 
+                 version INTEGER NOT NULL, PRIMARY KEY (zone_id, year)) WITHOUT ROWID;
+                ''')
+        version = self.conn.execute('''PRAGMA user_version;''').fetchone()[0]
+        if rollups < 2 or version < SCHEMA_VERSION:
+            self.rebuild_rollups()
+        self.conn.execute(f'''PRAGMA user_version={SCHEMA_VERSION};''')
+
+    def domain(self, zone):
+        '''Returns the Domainstr of the zone from DomainInfo or None.'''
+
+        try:
+            row = self.conn.execute('''
+                SELECT Domainstr FROM DomainInfo WHERE Shortcode=?;
+                ''', (zone,)).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row else None
+
+    def zone_id(self, zone, create=False):
+        '''Returns the zone_id of the shortcode, with create a new id is
+        added for unknown zones, otherwise None is returned for them.
+        '''
+
+        row = self.conn.execute('''
+            SELECT zone_id FROM Zones WHERE Shortcode=?;
+            ''', (zone,)).fetchone()
+        if row is None and create:
+            with self.conn:
+                cursor = self.conn.execute('''
+                    INSERT INTO Zones (Shortcode) VALUES (?);
+                    ''', (zone,))
+            return cursor.lastrowid
+        return row[0] if row else None
+
+    def write_prices(self, zone, epochs, prices, covered_start, covered_end=0):
+        '''Upserts the arrays of epochs and prices of the zone in one
+        transaction, rows with an existing epoch get their price updated.
+        The range from covered_start to the end of the last point, or to
+        covered_end if later, is recorded as covered in the same transaction.
+        Returns the number of written rows.
+        '''
+
+        zone_id = self.zone_id(zone, create=True)
+        epochs = np.asarray(epochs, dtype=np.int64)
+        steps = np.diff(np.unique(epochs))
+        step = int(steps.min()) if steps.size else 3600
+        with entsoemetrics.timer("write_seconds", zone=zone), self.conn:
+            self.conn.executemany('''
+                INSERT INTO Prices (zone_id, epoch, price) VALUES (?,?,?)
+                ON CONFLICT(zone_id, epoch) DO UPDATE SET price=excluded.price;
+                ''', zip([zone_id] * len(epochs), epochs.tolist(),
+                         np.asarray(prices, dtype=np.float64).tolist()))
+            self._record_coverage(zone_id, min(covered_start, int(epochs.min())),
+                                  max(covered_end, int(epochs.max()) + step))
+            self._refresh_rollups(zone_id, int(epochs.min()), int(epochs.max()))
+            self._bump_watermarks(zone_id, int(epochs.min()), int(epochs.max()))
+        entsoemetrics.count("write_rows_total", len(epochs), zone=zone)
+        return len(epochs)
+
+    def _bump_watermarks(self, zone_id, first, last):
+        '''Increments the version of the zone for every UTC year touched by
+        epochs first to last. Runs in the transaction of the caller.
+        '''
+
+        first_year, last_year = (int(year) for year in np.array(
+            [first, last]).astype('datetime64[s]').astype('datetime64[Y]')
+            .astype(np.int64) + 1970)
+        self.conn.executemany('''
+            INSERT INTO Watermarks (zone_id, year, version) VALUES (?,?,1)
+            ON CONFLICT(zone_id, year) DO UPDATE SET version=version+1;
+            ''', [(zone_id, year) for year in range(first_year, last_year + 1)])
+
+    def zone_versions(self, zones):
+        '''Returns a tuple with the ingest version of every zone, which grows
+        with every write to the zone.
+        '''
+
+        return tuple(self.conn.execute('''
+            SELECT COALESCE(SUM(version), 0) FROM Watermarks 
+            JOIN Zones USING (zone_id) WHERE Shortcode=?;
+            ''', (zone,)).fetchone()[0] for zone in zones)
+
+    def watermarks(self, zone):
+        '''Returns the versions of the zone as a dict of year to version.'''
+
+        zone_id = self.zone_id(zone)
+        return dict(self.conn.execute('''
+            SELECT year, version FROM Watermarks WHERE zone_id=?;
+            ''', (zone_id,)).fetchall())
+
+    def timezone(self, zone_id):
+        '''Returns the timezone of the zone_id, see entsoetime.zone_timezone.'''
+
+        row = self.conn.execute('''
+            SELECT Shortcode FROM Zones WHERE zone_id=?;
+            ''', (zone_id,)).fetchone()
+        return entsoetime.zone_timezone(row[0] if row else None)
+
+    def _refresh_rollups(self, zone_id, first, last):
+        '''Recomputes the daily and monthly rollups of the zone for the local
+        days and months touched by epochs first to last. Runs in the 
+        transaction of the caller.
+        '''
+
+        timezone = self.timezone(zone_id)
+        first_day, last_day = entsoetime.calendar_keys([first, last], 
+                                                       timezone)["day"].tolist()
+        lower, upper = entsoetime.utc_epochs([first_day, last_day + 86400], 
+                                             timezone).tolist()
+        rows = self.conn.execute('''
+            SELECT epoch, price FROM Prices 
+            WHERE zone_id=? AND epoch>=? AND epoch<? ORDER BY epoch;
+            ''', (zone_id, lower, upper)).fetchall()
+        if rows:
+            epochs = np.array([row[0] for row in rows], dtype=np.int64)
+            prices = np.array([row[1] for row in rows], dtype=np.float64)
+            days = entsoetime.calendar_keys(epochs, timezone)["day"]
+            keys, offsets, counts = np.unique(days, return_index=True, 
+                                              return_counts=True)
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO DailyRollup VALUES (?,?,?,?,?,?,?);
+                ''', zip([zone_id] * keys.size, keys.tolist(), counts.tolist(),
+                         np.add.reduceat(prices, offsets).tolist(),
+                         np.add.reduceat(prices * prices, offsets).tolist(),
+                         np.minimum.reduceat(prices, offsets).tolist(),
+                         np.maximum.reduceat(prices, offsets).tolist()))
+        month_start, month_end = (np.array([first_day, last_day], 
+            dtype='datetime64[s]').astype('datetime64[M]') + [0, 1]).astype(
+            'datetime64[s]').astype(np.int64).tolist()
+        self.conn.execute('''
+            INSERT OR REPLACE INTO MonthlyRollup
+            SELECT zone_id, CAST(strftime('%s', day, 'unixepoch', 'start of month') 
+            AS INTEGER) AS month, SUM(count), SUM(total), SUM(squares), 
+            MIN(low), MAX(high)
+            FROM DailyRollup WHERE zone_id=? AND day>=? AND day<?
+            GROUP BY month;
+            ''', (zone_id, month_start, month_end))
+
+    def rebuild_rollups(self):
+        '''Recomputes the rollups of all zones from Prices.'''
+
+        with self.conn:
+            self.conn.execute('''DELETE FROM DailyRollup;''')
+            self.conn.execute('''DELETE FROM MonthlyRollup;''')
+            for zone_id, first, last in self.conn.execute('''
+                    SELECT zone_id, MIN(epoch), MAX(epoch) FROM Prices 
+                    GROUP BY zone_id;
+                    ''').fetchall():
+                self._refresh_rollups(zone_id, first, last)
+
+    def record_coverage(self, zone, start, end):
+        '''Records [start, end) in epoch seconds as covered for the zone.'''
+
+        zone_id = self.zone_id(zone, create=True)
+        with self.conn:
+            self._record_coverage(zone_id, start, end)
+
+    def _record_coverage(self, zone_id, start, end):
+        '''Adds [start, end) to the coverage of the zone and merges it with
+        overlapping or adjacent ranges. Runs in the transaction of the caller.
+        '''
+
+        merge_coverage(self.conn, "Coverage", {"zone_id": zone_id}, start, end)
+
+    def missing_intervals(self, zone, start, end):
+        '''Returns the sub-intervals of [start, end) in epoch seconds that are
+        not covered for the zone. Zones with prices but without coverage get
+        their coverage built once from the stored rows.
+        '''
+
+        zone_id = self.zone_id(zone)
+        if zone_id is None:
+            return [(start, end)]
+        covered = self.conn.execute('''
+            SELECT start, end FROM Coverage
+            WHERE zone_id=? AND end>? AND start<? ORDER BY start;
+            ''', (zone_id, start, end)).fetchall()
+        if not covered and self._bootstrap_coverage(zone_id):
+            return self.missing_intervals(zone, start, end)
+        return uncovered(covered, start, end)
+
+    def _bootstrap_coverage(self, zone_id):
+        '''Records the contiguous hourly runs of a zone without coverage.
+        Returns True if any coverage was recorded.
+        '''
+
+        if self.conn.execute('''
+                SELECT 1 FROM Coverage WHERE zone_id=? LIMIT 1;
+                ''', (zone_id,)).fetchone():
+            return False
+        epochs = np.array([row[0] for row in self.conn.execute('''
+            SELECT epoch FROM Prices WHERE zone_id=? ORDER BY epoch;
+            ''', (zone_id,))], dtype=np.int64)
+        if not epochs.size:
+            return False
+        breaks = np.flatnonzero(np.diff(epochs) > 3600)
+        starts = np.concatenate(([epochs[0]], epochs[breaks + 1]))
+        ends = np.concatenate((epochs[breaks], [epochs[-1]])) + 3600
+        with self.conn:
+            for run_start, run_end in zip(starts.tolist(), ends.tolist()):
+                self._record_coverage(zone_id, run_start, run_end)
+        return True
+
+    def read_prices(self, zones, start, end, complete=True):
+        '''Returns the prices of the zones between start and end in epoch
+        seconds, both included, as a dataframe indexed by epoch with one
+        column per zone. Only epochs with prices for all zones are kept,
+        unless complete is False which keeps every epoch with NaN for the
+        missing prices.
+        '''
+
+        zone_ids = {self.zone_id(zone): zone for zone in zones}
+        zone_ids.pop(None, None)
+        if not zone_ids or complete and len(zone_ids) < len(set(zones)):
+            return pd.DataFrame(columns=list(zones),
+                                index=pd.Index([], name="epoch", dtype=np.int64))
+        placeholders = ",".join("?" * len(zone_ids))
+        long_format = pd.read_sql(f'''
+            SELECT zone_id, epoch, price FROM Prices
+            WHERE zone_id IN ({placeholders}) AND epoch BETWEEN ? AND ?;
+            ''', self.conn, params=[*zone_ids, start, end])
+        wide_format = long_format.pivot(index="epoch", columns="zone_id",
+                                        values="price")
+        wide_format = wide_format.rename(columns=zone_ids)
+        wide_format = wide_format.reindex(columns=list(zones))
+        if complete:
+            wide_format = wide_format.dropna()
+        return wide_format.sort_index()
+
+    def iter_prices(self, zones, start, end, chunk="1M", complete=True):
+        '''Yields the prices of read_prices for consecutive windows of
+        [start, end] in epoch seconds, so only one chunk is in memory.
+        For chunk see chunk_bounds, for complete read_prices.
+        '''
+
+        for lower, upper in chunk_bounds(start, end + 1, chunk):
+            yield self.read_prices(zones, lower, upper - 1, complete)
+
+    def legacy_tables(self):
+        '''Returns the names of per-zone tables (DateTime, Price).'''
+
+        tables = [row[0] for row in self.conn.execute('''
+            SELECT name FROM sqlite_master WHERE type='table';
+            ''')]
+        return [table for table in tables
+                if self._columns(table) == ["DateTime", "Price"]]
+
+    def _legacy_coverage(self):
+        return "Zone" in self._columns("Coverage")
+
+    def _columns(self, table):
+        return [row[1] for row in self.conn.execute(
+            f'''PRAGMA table_info("{table}");''')]
+
+    def migrate(self):
+        '''Moves the per-zone tables and the former Coverage table into the
+        long format and vacuums the database. Text timestamps are converted
+        to epoch seconds and prices to REAL. The per-zone tables stamped
+        every hour with its end, start + position hours, so their epochs are
+        shifted back LEGACY_SHIFT to the start of the hour as parsed now.
+        Coverage ranges are the bounds of the requested windows and kept.
+        '''
+
+        legacy_coverage = []
+        if self._legacy_coverage():
+            legacy_coverage = self.conn.execute('''
+                SELECT Zone, Start, End FROM Coverage;
+                ''').fetchall()
+            with self.conn:
+                self.conn.execute('''DROP TABLE Coverage;''')
+        self._create_schema()
+        for table in self.legacy_tables():
+            zone_id = self.zone_id(table, create=True)
+            with self.conn:
+                cursor = self.conn.execute(f'''
+                    INSERT INTO Prices (zone_id, epoch, price)
+                    SELECT ?, CAST(strftime('%s', DateTime) AS INTEGER) - ?,
+                    CAST(Price AS REAL) FROM "{table}" WHERE true
+                    ON CONFLICT(zone_id, epoch) DO UPDATE SET price=excluded.price;
+                    ''', (zone_id, LEGACY_SHIFT))
+                self.conn.execute(f'''DROP TABLE "{table}";''')
+                first, last = self.conn.execute('''
+                    SELECT MIN(epoch), MAX(epoch) FROM Prices WHERE zone_id=?;
+                    ''', (zone_id,)).fetchone()
+                if first is not None:
+                    self._bump_watermarks(zone_id, first, last)
+            print(f"{table} migrated with {cursor.rowcount} rows!")
+        with self.conn:
+            for zone, start, end in legacy_coverage:
+                self._record_coverage(self.zone_id(zone, create=True), start, end)
+        self.rebuild_rollups()
+        self.conn.execute('''VACUUM;''')
+
+
+def merge_coverage(conn, table, key, start, end):
+    '''Adds [start, end) to the ranges of a coverage table with the columns
+    of key, a dict of column to value, and start and end, merging it with 
+    overlapping or adjacent ranges. Runs in the transaction of the caller.
+    '''
+
+    where = " AND ".join(f"{column}=?" for column in key)
+    overlap = (*key.values(), end, start)
+    lowest, highest = conn.execute(f'''
+        SELECT MIN(start), MAX(end) FROM {table}
+        WHERE {where} AND start<=? AND end>=?;
+        ''', overlap).fetchone()
+    if lowest is not None:
+        start, end = min(start, lowest), max(end, highest)
+    conn.execute(f'''
+        DELETE FROM {table} WHERE {where} AND start<=? AND end>=?;
+        ''', overlap)
+    conn.execute(f'''
+        INSERT INTO {table} ({", ".join(key)}, start, end) 
+        VALUES ({", ".join("?" * (len(key) + 2))});
+        ''', (*key.values(), start, end))
+
+
+def uncovered(covered, start, end):
+    '''Returns the sub-intervals of [start, end) outside the covered 
+    ranges, a list of (start, end) sorted by start.
+    '''
+
+    missing = []
+    lower = start
+    for covered_start, covered_end in covered:
+        if covered_start > lower:
+            missing.append((lower, covered_start))
+        lower = max(lower, covered_end)
+    if lower < end:
+        missing.append((lower, end))
+    return missing
+
+
+def chunk_bounds(start, end, chunk="1M"):
+    '''Splits [start, end) in epoch seconds into windows of the chunk,
+    ex: "1D", "7D", "2W", "1M", "1Y". Windows after the first start at UTC 
+    midnight, the first day of a month or year. Returns (lower, upper) pairs.
+    '''
+
+    match = _CHUNK.match(chunk)
+    if match is None:
+        raise ValueError(f"Chunk {chunk} is not supported!")
+    count, unit = int(match.group(1) or 1), match.group(2)
+    if unit in "DW":
+        unit, count = 'D', count * (7 if unit == 'W' else 1)
+    first = np.datetime64(int(start), 's').astype(f'datetime64[{unit}]')
+    last = np.datetime64(int(end) - 1, 's').astype(f'datetime64[{unit}]')
+    edges = (np.arange(first, last + count, count).astype('datetime64[s]')
+             .astype(np.int64).tolist())
+    edges = [start] + [edge for edge in edges if start < edge < end] + [end]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def main(argv=None):
+    '''Migrates the database given as argument, or ./Energyprices.db.'''
+
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[0] if argv else DB_PATH
+    with PriceStore(path) as store:
+        zones = store.conn.execute('''SELECT COUNT(*) FROM Zones;''').fetchone()[0]
+    print(f"{path} is in the long format with {zones} zones!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+'''Time index of the zones, UTC epochs and local calendar keys.
+
+Prices are stored at UTC epoch seconds, but every zone trades in the market
+day of its timezone, the column Location of Domaininfo.csv, ex:
+"Europe/Stockholm", so days, weeks, months and years of a zone start at its
+local midnight, also across daylight saving time.
+
+Local calendar keys are "local epochs", the epoch seconds of the local wall
+clock read as UTC. Local midnight of 2020-01-01 is 1577836800 in every zone,
+so keys of zones in different timezones line up and calendar keys are
+integer arithmetic, ex: day = local - local % 86400.
+
+The UTC offsets of a timezone are looked up in a table of its transitions
+from 1970 to 2070, built once per timezone, so converting an array of epochs
+is a searchsorted and an add, without datetime objects or strftime per row.
+'''
+
+import calendar
+import csv
+import functools
+import os
+from datetime import date
+from datetime import datetime as dt
+from datetime import timedelta as td
+from datetime import timezone as tz
+from zoneinfo import ZoneInfo
+import numpy as np
+
+DOMAININFO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "Domaininfo.csv")
+DEFAULT_TIMEZONE = "UTC"
+#Range of the transition tables, 1970-01-01 to 2070-01-01.
+FIRST_EPOCH = 0
+LAST_EPOCH = 3155760000
+#Daylight saving time never changes twice within a week.
+_PROBE = 7 * 86400
+_HOURS = np.array([f" {hour:02d}" for hour in range(24)])
+
+
+@functools.lru_cache(maxsize=None)
+def zone_timezones(path=DOMAININFO_PATH):
+    '''Returns the shortcodes mapped to their timezone from Domaininfo.csv.'''
+
+    try:
+        with open(path, newline='') as file:
+            return {row["Shortcode"]: row["Location"]
+                    for row in csv.DictReader(file) if row.get("Location")}
+    except FileNotFoundError:
+        return {}
+
+
+def zone_timezone(zone):
+    '''Returns the timezone of the zone, UTC for unknown zones.'''
+
+    return zone_timezones().get(zone, DEFAULT_TIMEZONE)
+
+
+def day_epoch(day):
+    '''Returns epoch seconds for a date or naive UTC datetime.'''
+
+    return calendar.timegm(day.timetuple())
+
+
+def epoch_day(epoch, ceil=False):
+    '''Returns the UTC date of epoch seconds, with ceil the next date 
+    unless epoch is at midnight.
+    '''
+
+    days, rest = divmod(epoch, 86400)
+    if ceil and rest:
+        days += 1
+    return date(1970, 1, 1) + td(days=days)
+
+
+def _utcoffset(epoch, zone):
+    return int(dt.fromtimestamp(epoch, tz.utc).astimezone(zone)
+               .utcoffset().total_seconds())
+
+
+@functools.lru_cache(maxsize=None)
+def transitions(timezone):
+    '''Returns the transition table of the timezone as arrays (starts,
+    offsets, dst) where offsets and dst hold from the epoch of the start
+    until the next start, offsets in seconds and dst as bool.
+    '''
+
+    zone = ZoneInfo(timezone)
+    starts = [FIRST_EPOCH]
+    offsets = [_utcoffset(FIRST_EPOCH, zone)]
+    for probe in range(FIRST_EPOCH + _PROBE, LAST_EPOCH, _PROBE):
+        offset = _utcoffset(probe, zone)
+        if offset == offsets[-1]:
+            continue
+        #Bisect the week for the first second with the new offset.
+        lower, upper = probe - _PROBE, probe
+        while upper - lower > 1:
+            middle = (lower + upper) // 2
+            if _utcoffset(middle, zone) == offset:
+                upper = middle
+            else:
+                lower = middle
+        starts.append(upper)
+        offsets.append(offset)
+    dst = [bool(dt.fromtimestamp(start, tz.utc).astimezone(zone).dst())
+           for start in starts]
+    return (np.array(starts, dtype=np.int64), np.array(offsets, dtype=np.int64),
+            np.array(dst, dtype=bool))
+
+
+def _periods(epochs, timezone):
+    starts, _, _ = transitions(timezone)
+    return np.searchsorted(starts, epochs, side='right') - 1
+
+
+def utc_offsets(epochs, timezone):
+    '''Returns the UTC offsets in seconds of UTC epochs in the timezone.'''
+
+    epochs = np.asarray(epochs, dtype=np.int64)
+    if timezone == "UTC":
+        return np.zeros_like(epochs)
+    return transitions(timezone)[1][_periods(epochs, timezone)]
+
+
+def local_epochs(epochs, timezone):
+    '''Returns the local epochs of UTC epochs in the timezone.'''
+
+    epochs = np.asarray(epochs, dtype=np.int64)
+    return epochs + utc_offsets(epochs, timezone)
+
+
+def utc_epochs(local, timezone):
+    '''Returns the UTC epochs of local epochs in the timezone, ex: of
+    local midnights. Wall clock times skipped or repeated when the clocks
+    change have no exact UTC epoch, they are shifted by the change.
+    '''
+
+    local = np.asarray(local, dtype=np.int64)
+    guess = local - utc_offsets(local, timezone)
+    return local - utc_offsets(guess, timezone)
+
+
+def calendar_keys(epochs, timezone):
+    '''Returns the local calendar keys of UTC epochs in the timezone as a
+    dict of arrays:
+        local   local epoch
+        day     local epoch of the local midnight
+        month   local epoch of the first local midnight of the month
+        year    local epoch of the first local midnight of the year
+        hour    hour of the local day, 0 to 23
+        dst     True during daylight saving time
+        offset  UTC offset in seconds
+    '''
+
+    epochs = np.asarray(epochs, dtype=np.int64)
+    periods = _periods(epochs, timezone)
+    _, offsets, dst = transitions(timezone)
+    local = epochs + offsets[periods]
+    seconds = local.astype('datetime64[s]')
+    return {"local": local,
+            "day": local - local % 86400,
+            "month": seconds.astype('datetime64[M]').astype('datetime64[s]')
+                     .astype(np.int64),
+            "year": seconds.astype('datetime64[Y]').astype('datetime64[s]')
+                    .astype(np.int64),
+            "hour": local % 86400 // 3600,
+            "dst": dst[periods],
+            "offset": offsets[periods]}
+
+
+def calendar_labels(local):
+    '''Returns the labels DateHour ("%Y-%m-%d %H"), YearMonth ("%Y%m") and
+    YearMonthDay ("%Y%m%d") of local epochs as arrays of str. Only the
+    distinct days are formatted, rows take the label of their day.
+    '''
+
+    local = np.asarray(local, dtype=np.int64)
+    if not local.size:
+        return tuple(np.empty(0, dtype=object) for _ in range(3))
+    days, inverse = np.unique(local // 86400, return_inverse=True)
+    dates = np.datetime_as_string(days.astype('datetime64[D]'))
+    date_hours = np.char.add(dates[inverse], _HOURS[local % 86400 // 3600])
+    year_month_days = np.char.replace(dates, "-", "")
+    return (date_hours.astype(object),
+            year_month_days.astype('U6')[inverse].astype(object),
+            year_month_days[inverse].astype(object))